@@ -0,0 +1,239 @@
+""" Offline benchmarks of the hot paths of oceancolor, on synthetic inputs
+
+No data files or network are needed.  Typical use:
+
+    python benchmarks/bench_oceancolor.py --save baseline.json
+    python benchmarks/bench_oceancolor.py --compare baseline.json
+
+The second call exits with status 1 if a benchmark has become slower,
+or uses more memory, than in the baseline by more than --threshold.
+"""
+
+import os
+import sys
+import argparse
+import tempfile
+import warnings
+import contextlib
+
+import numpy as np
+import pandas
+
+from oceancolor.utils import benchmark
+
+# Sizes of the inputs
+scales = {
+    'quick': dict(pixels=(1e3, 1e4, 1e5), single=(1e2,), rows=(1e3, 1e4),
+                  samples=(1, 1e3, 1e5), ids=(1e4, 1e5)),
+    'full': dict(pixels=(1e3, 1e4, 1e5, 1e6, 1e7), single=(1e2, 1e3),
+                 rows=(1e3, 1e4, 1e5), samples=(1, 1e3, 1e5),
+                 ids=(1e4, 1e5, 1e6, 1e7)),
+}
+
+
+def synthetic_tara(nrow:int, seed:int=0):
+    """ Synthetic table in the schema of the Tara database """
+    from oceancolor.tara import synthetic
+    return pandas.concat(synthetic.iter_chunks(nrow, seed=seed),
+                         ignore_index=True)
+
+def ls2_inputs(npix:int, seed:int=0):
+    """ sza, lambda, Rrs, Kd, aw, bw, bp of LS2 """
+    rstate = np.random.default_rng(seed)
+    return (rstate.uniform(0., 60., npix), 490.,
+            rstate.uniform(1e-3, 1e-2, npix), rstate.uniform(0.03, 0.3, npix),
+            0.015, 0.003, rstate.uniform(0.05, 0.5, npix))
+
+def simple_net(ninput:int=3, noutput:int=81):
+    from oceancolor.remote import nn as remote_nn
+    return remote_nn.SimpleNet(
+        ninput, noutput, 128, 128, (np.zeros(ninput), np.ones(ninput)),
+        (np.zeros(noutput), np.ones(noutput)))
+
+
+def build_suite(scale:str, workdir:str):
+    """ Benchmarks of a scale
+
+    Args:
+        scale (str): Key of scales
+        workdir (str): Folder for the synthetic files
+
+    Returns:
+        dict: name -> setup, for benchmark.run_suite()
+    """
+    sizes = scales[scale]
+    suite = {}
+
+    # LS2
+    def setup_ls2_main(npix):
+        from oceancolor.ls2 import ls2_main
+        from oceancolor.ls2.io import load_LUT
+        LUT = load_LUT()
+        sza, lam, Rrs, Kd, aw, bw, bp = ls2_inputs(npix)
+        return lambda: [ls2_main.LS2_main(sza[i], lam, Rrs[i], Kd[i], aw, bw,
+                                          bp[i], LUT, True)
+                        for i in range(npix)]
+
+    def setup_ls2_batch(npix, mode='exact'):
+        from oceancolor.ls2 import ls2_main
+        from oceancolor.ls2.io import load_LUT
+        LUT = load_LUT()
+        tables = ls2_main.LS2_fast_tables(LUT) if mode == 'fast' else None
+        inputs = ls2_inputs(npix)
+        return lambda: ls2_main.LS2_batch(*inputs, LUT, True, mode=mode,
+                                          tables=tables)
+
+    def setup_ls2_uncertainty(npix):
+        from oceancolor.ls2 import ls2_main
+        from oceancolor.ls2.io import load_LUT
+        LUT = load_LUT()
+        inputs = ls2_inputs(npix)
+        return lambda: ls2_main.LS2_batch_uncertainty(
+            *inputs, LUT, True, sig_sza=0.5, sig_Rrs=1e-4, sig_Kd=0.01,
+            sig_bp=0.02)
+
+    def setup_retrieve_iops(npix):
+        from oceancolor.ls2 import pipeline
+        wave = np.array([412., 443., 490., 510., 555., 670.])
+        _, sza, _, Rrs, _ = pipeline.simulate_kd_training(1000, seed=0,
+                                                          wave=wave)
+        idx = np.random.default_rng(0).integers(0, len(sza), npix)
+        return lambda: pipeline.retrieve_iops(Rrs[idx], wave, sza[idx])
+
+    for n in sizes['single']:
+        suite[f'ls2.LS2_main[{n:.0e}]'] = lambda n=int(n): setup_ls2_main(n)
+    for n in sizes['pixels']:
+        suite[f'ls2.LS2_batch[{n:.0e}]'] = lambda n=int(n): setup_ls2_batch(n)
+        suite[f'ls2.LS2_batch_fast[{n:.0e}]'] = \
+            lambda n=int(n): setup_ls2_batch(n, mode='fast')
+        suite[f'ls2.LS2_batch_uncertainty[{n:.0e}]'] = \
+            lambda n=int(n): setup_ls2_uncertainty(n)
+        suite[f'ls2.retrieve_iops[{n:.0e}]'] = \
+            lambda n=int(n): setup_retrieve_iops(n)
+
+    # Tara
+    def setup_rebin(nrow):
+        from oceancolor.tara import spectra
+        wv_nm, values, err = spectra.spectra_from_table(synthetic_tara(nrow))
+        wv_grid = np.arange(402.5, 707.5, 5.)
+        return lambda: spectra.rebin_to_grid(wv_nm, values, err, wv_grid)
+
+    def setup_single_value(nrow):
+        from oceancolor.tara import spectra
+        tbl = synthetic_tara(nrow)
+        return lambda: spectra.single_value(tbl, 676., wv_delta=7.)
+
+    def setup_add_derived(nrow):
+        from oceancolor.tara import measures
+        tbl = synthetic_tara(nrow)
+        return lambda: measures.add_derived(tbl.copy())
+
+    def setup_prep_spectra(nrow):
+        from oceancolor.tara import io as tara_io
+        from oceancolor.tara import explore
+        from oceancolor.tara import synthetic
+        db_file = os.path.join(workdir, f'Tara_APCP_{nrow}.parquet')
+        with contextlib.redirect_stdout(None):
+            synthetic.write_tara_db(db_file, nrow, seed=0)
+        def run():
+            db_name, tara_io.db_name = tara_io.db_name, db_file
+            try:
+                return explore.prep_spectra()
+            finally:
+                tara_io.db_name = db_name
+        return run
+
+    for n in sizes['rows']:
+        for name, setup in (('rebin_to_grid', setup_rebin),
+                            ('single_value', setup_single_value),
+                            ('add_derived', setup_add_derived),
+                            ('prep_spectra', setup_prep_spectra)):
+            suite[f'tara.{name}[{n:.0e}]'] = lambda n=int(n), setup=setup: setup(n)
+
+    # Remote sensing
+    def setup_prediction(nsample):
+        import torch
+        model = simple_net()
+        device = torch.device('cpu')
+        sample = np.random.default_rng(0).normal(size=(nsample, model.ninput))
+        return lambda: model.prediction(sample, device)
+
+    def setup_emcee_step():
+        from oceancolor.remote import mcmc
+        model = simple_net()
+        Rs = np.random.default_rng(0).uniform(1e-3, 1e-2, model.noutput)
+        def run():
+            with contextlib.redirect_stdout(None):
+                return mcmc.run_emcee_nn(model, Rs, nsteps=1, nburn=0)
+        return run
+
+    def setup_importance(nspec):
+        from oceancolor.remote import library
+        rstate = np.random.default_rng(0)
+        ab = rstate.normal(size=(3320, 6))
+        Rs = 0.005*np.exp(ab @ rstate.normal(scale=0.3, size=(6, 81)))
+        lib = library.Library(ab, Rs)
+        targets = Rs[rstate.integers(0, len(Rs), nspec)]
+        return lambda: library.retrieve_ab(lib, targets)
+
+    for n in sizes['samples']:
+        suite[f'remote.SimpleNet.prediction[{n:.0e}]'] = \
+            lambda n=int(n): setup_prediction(n)
+        suite[f'remote.library.retrieve_ab[{n:.0e}]'] = \
+            lambda n=int(n): setup_importance(n)
+    suite['remote.run_emcee_nn[1 step]'] = setup_emcee_step
+
+    # Catalogs
+    def setup_match_ids(nid):
+        from oceancolor.utils import cat_utils
+        rstate = np.random.default_rng(0)
+        match_IDs = rstate.permutation(nid)
+        IDs = rstate.choice(nid, size=nid//2, replace=False)
+        return lambda: cat_utils.match_ids(IDs, match_IDs)
+
+    for n in sizes['ids']:
+        suite[f'utils.match_ids[{n:.0e}]'] = lambda n=int(n): setup_match_ids(n)
+
+    return suite
+
+
+def parse_args(args=None):
+    parser = argparse.ArgumentParser(
+        description='Offline benchmarks of oceancolor')
+    parser.add_argument('--scale', type=str, default='quick',
+                        choices=list(scales.keys()), help='Sizes of the inputs')
+    parser.add_argument('--select', type=str,
+                        help='Only run the benchmarks whose name contains this')
+    parser.add_argument('--repeat', type=int, default=3,
+                        help='Number of timings of each benchmark')
+    parser.add_argument('--save', type=str, help='Write the results to this JSON file')
+    parser.add_argument('--compare', type=str, help='Baseline JSON file')
+    parser.add_argument('--threshold', type=float, default=0.25,
+                        help='Allowed fractional increase of time or memory')
+    return parser.parse_args(args)
+
+def main(args=None):
+    pargs = parse_args(args)
+
+    with tempfile.TemporaryDirectory() as workdir, warnings.catch_warnings():
+        warnings.simplefilter('ignore')
+        results = benchmark.run_suite(build_suite(pargs.scale, workdir),
+                                      repeat=pargs.repeat, select=pargs.select)
+
+    if pargs.save is not None:
+        benchmark.write_results(pargs.save, results)
+
+    if pargs.compare is not None:
+        regressions = benchmark.compare(
+            results, benchmark.load_results(pargs.compare),
+            threshold=pargs.threshold)
+        for item in regressions:
+            print(f"REGRESSION  {item}")
+        if len(regressions) > 0:
+            return 1
+        print(f"No regressions with respect to {pargs.compare}")
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,34 @@
+""" Ocean color tools
+
+Subpackages and modules are imported on first access, e.g. 
+oceancolor.ls2.ls2_main, so that importing the package is cheap.
+"""
+import sys
+import importlib
+
+
+def lazy_submodules(package:str, submodules:tuple):
+    """ Module-level __getattr__ and __dir__ that import
+    the submodules of a package on first access
+
+    Args:
+        package (str): Name of the package, i.e. __name__
+        submodules (tuple): Names of the submodules
+
+    Returns:
+        tuple: __getattr__, __dir__
+    """
+    def __getattr__(name:str):
+        if name in submodules:
+            return importlib.import_module(f'{package}.{name}')
+        raise AttributeError(f"module {package!r} has no attribute {name!r}")
+
+    def __dir__():
+        return sorted(set(vars(sys.modules[package])) | set(submodules))
+
+    return __getattr__, __dir__
+
+
+__getattr__, __dir__ = lazy_submodules(__name__, (
+    'cross', 'mixture', 'water', 'ls2', 'ph', 'polarize', 'remote', 'tara',
+    'utils'))
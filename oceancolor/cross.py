@@ -90,10 +90,7 @@ def bubbles_abs(lamb:float):
     Returns:
         float or np.ndarray: absorption cross-section in micron^-2
     """
-    if isinstance(lamb, np.ndarray):
-        return np.zeros_like(lamb)
-    else:
-        return 0.
+    return 0. * np.asarray(lamb, dtype=float)[()]
 
 def bubbles_scatt(lamb:float):
     """ Scattering cross-section of bubbles
@@ -107,10 +104,7 @@ def bubbles_scatt(lamb:float):
         float or np.ndarray: scattering cross-section in micron^-2
     """
     const = 4607.873
-    if isinstance(lamb, np.ndarray):
-        return const * np.ones_like(lamb)
-    else:
-        return const
+    return const + 0. * np.asarray(lamb, dtype=float)[()]
 
 def bubbles_backscatt(lamb:float):
     """ Backscattering cross-section of bubbles
@@ -124,7 +118,26 @@ def bubbles_backscatt(lamb:float):
         float or np.ndarray: scattering cross-section in micron^-2
     """
     const = 55.359
-    if isinstance(lamb, np.ndarray):
-        return const * np.ones_like(lamb)
-    else:
-        return const
\ No newline at end of file
+    return const + 0. * np.asarray(lamb, dtype=float)[()]
+
+# Cross-section functions of each component:  absorption,
+#  scattering, backscattering
+components = {
+    'detritus': (detritus_abs, detritus_scatt, detritus_backscatt),
+    'minerals': (minerals_abs, mineral_scatt, mineral_backscatt),
+    'bubbles': (bubbles_abs, bubbles_scatt, bubbles_backscatt),
+}
+
+def cross_sections(lamb:np.ndarray, component:str):
+    """ Absorption, scattering and backscattering cross-sections
+    of one component
+
+    Args:
+        lamb (np.ndarray): wavelengths in nm
+        component (str): detritus, minerals or bubbles
+
+    Returns:
+        np.ndarray: cross-sections in micron^2 (3, nwave)
+    """
+    lamb = np.asarray(lamb, dtype=float)
+    return np.stack([func(lamb) for func in components[component]])
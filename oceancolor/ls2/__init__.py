@@ -0,0 +1,6 @@
+from oceancolor import lazy_submodules
+
+__getattr__, __dir__ = lazy_submodules(__name__, ('io', 'ls2_main', 'forward',
+                                                  'pipeline', 'closure'))
+
+del lazy_submodules
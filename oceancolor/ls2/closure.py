@@ -0,0 +1,246 @@
+""" Closure of LS2 against the Loisel 2023 Hydrolight tables:
+retrieved a and bb against the true IOPs, per band """
+
+import os
+import re
+import warnings
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+import pandas
+
+from oceancolor import water
+from oceancolor.ls2 import io as ls2_io
+from oceancolor.ls2 import ls2_main
+from oceancolor.utils import instrument
+
+# Retrieved variables compared to the truth
+variables = ('a', 'bb')
+
+# Bins of log10 |ret-true|/true for the median absolute percentage error;
+#  0.005 dex is ~1% of the median
+ape_edges = np.arange(-6., 2.+1e-9, 0.005)
+
+
+def parse_hydrolight_file(filename:str):
+    """ X and Y of a Hydrolight{X}{Y}.nc file
+
+    Args:
+        filename (str): File
+
+    Returns:
+        tuple: X (1, 2, 4 for nothing, Raman, Raman+Fluorescence),
+            Y, the sun zenith angle [deg]
+    """
+    match = re.fullmatch(r'Hydrolight(\d)(\d+)\.nc', os.path.basename(filename))
+    if match is None:
+        raise ValueError(f"Not a Hydrolight file: {filename}")
+    return int(match.group(1)), int(match.group(2))
+
+def new_accumulator(nwave:int):
+    """ Empty sums of the closure statistics, per band
+
+    Args:
+        nwave (int): Number of bands
+
+    Returns:
+        dict: variable -> dict of n, sum, sum2, hist
+    """
+    return {var: dict(n=np.zeros(nwave, dtype=np.int64),
+                      sum=np.zeros(nwave), sum2=np.zeros(nwave),
+                      hist=np.zeros((nwave, ape_edges.size-1), dtype=np.int64))
+            for var in variables}
+
+def accumulate(acc:dict, var:str, true:np.ndarray, ret:np.ndarray):
+    """ Add retrievals to an accumulator, in place
+
+    Args:
+        acc (dict): From new_accumulator()
+        var (str): Variable
+        true (np.ndarray): True values (nrow, nwave)
+        ret (np.ndarray): Retrieved values (nrow, nwave);  NaN are skipped
+    """
+    ok = np.isfinite(ret) & np.isfinite(true) & (true > 0)
+    diff = np.where(ok, ret - true, 0.)
+    acc[var]['n'] += ok.sum(axis=0)
+    acc[var]['sum'] += diff.sum(axis=0)
+    acc[var]['sum2'] += (diff**2).sum(axis=0)
+
+    with np.errstate(divide='ignore'):
+        log_ape = np.log10(np.abs(diff[ok]) / true[ok])
+    ibin = np.clip(np.searchsorted(ape_edges, log_ape, side='right') - 1,
+                   0, ape_edges.size-2)
+    iwave = np.nonzero(ok)[1]
+    np.add.at(acc[var]['hist'], (iwave, ibin), 1)
+
+def merge(acc1:dict, acc2:dict):
+    """ Sum of two accumulators
+
+    Args:
+        acc1 (dict): From new_accumulator()
+        acc2 (dict): From new_accumulator()
+
+    Returns:
+        dict: accumulator
+    """
+    return {var: {key: acc1[var][key] + acc2[var][key] for key in acc1[var]}
+            for var in acc1}
+
+def _median_ape(hist:np.ndarray):
+    # Median of the binned log10 APE, interpolated within its bin [%]
+    n = hist.sum(axis=1)
+    cum = np.cumsum(hist, axis=1)
+    half = n/2
+    ibin = np.argmax(cum >= half[:,None], axis=1)
+    below = np.where(ibin > 0, np.take_along_axis(
+        cum, np.maximum(ibin-1, 0)[:,None], axis=1)[:,0], 0)
+    inbin = hist[np.arange(hist.shape[0]), ibin]
+    with np.errstate(invalid='ignore', divide='ignore'):
+        frac = (half - below) / inbin
+    step = ape_edges[1] - ape_edges[0]
+    log_ape = ape_edges[ibin] + np.clip(frac, 0., 1.)*step
+    return np.where(n > 0, 100*10**log_ape, np.nan)
+
+def summarize(acc:dict, wave:np.ndarray):
+    """ Closure statistics per band
+
+    Args:
+        acc (dict): From accumulate()
+        wave (np.ndarray): Wavelengths of the bands [nm]
+
+    Returns:
+        pandas.DataFrame: variable, wave, n, bias and rmse [m^-1],
+            mdape (median absolute percentage error [%])
+    """
+    tbls = []
+    for var in acc:
+        n = acc[var]['n']
+        with np.errstate(invalid='ignore', divide='ignore'):
+            bias = acc[var]['sum'] / n
+            rmse = np.sqrt(acc[var]['sum2'] / n)
+        tbls.append(pandas.DataFrame(dict(
+            variable=var, wave=np.asarray(wave, dtype=float), n=n,
+            bias=bias, rmse=rmse, mdape=_median_ape(acc[var]['hist']))))
+    return pandas.concat(tbls, ignore_index=True)
+
+def closure_rows(filename:str, i0:int, i1:int, Flag_Raman:bool=None,
+                 mode:str='exact', kd_variable:str='Kd', kd_file:str=None):
+    """ Run LS2 on rows [i0, i1) of a Hydrolight file
+
+    sza is Y of the file, aw and bw are the pure seawater IOPs at its
+    wavelengths and bp = b - bw.  Kd is kd_variable of the file if it
+    has one, else from the Kd estimator of ls2.pipeline.
+
+    Args:
+        filename (str): Hydrolight{X}{Y}.nc file
+        i0 (int): First row
+        i1 (int): End row
+        Flag_Raman (bool, optional): Raman correction.
+            Defaults to True if X includes Raman scattering
+        mode (str, optional): 'exact' or 'fast', as for LS2_batch
+        kd_variable (str, optional): Kd in the file
+        kd_file (str, optional): Weights of the Kd MLP, if Kd is
+            estimated.  Defaults to the bundled one
+
+    Returns:
+        tuple: accumulator (dict), wavelengths (np.ndarray)
+    """
+    import xarray
+
+    X, Y = parse_hydrolight_file(filename)
+    if Flag_Raman is None:
+        Flag_Raman = X > 1
+
+    with xarray.open_dataset(filename, cache=False) as ds:
+        wave = ds.Lambda.values.astype(np.float64)
+        rows = {key: ds[key][i0:i1].values.astype(np.float64)
+                for key in ('a', 'b', 'bb', 'Rrs')}
+        if kd_variable in ds:
+            Kd = ds[kd_variable][i0:i1].values.astype(np.float64)
+        else:
+            from oceancolor.ls2 import pipeline
+            Kd = pipeline.load_kd_mlp(kd_file)(rows['Rrs'], wave, float(Y))
+
+    aw, bw, _ = water.water_iops(wave)
+    LS2_LUT = {key: np.asarray(value) for key, value in ls2_io.load_LUT().items()}
+    with warnings.catch_warnings():
+        warnings.simplefilter('ignore')
+        a, _, bb, _, _ = ls2_main.LS2_batch(
+            float(Y), wave, rows['Rrs'], Kd, aw, bw, rows['b'] - bw,
+            LS2_LUT, Flag_Raman, mode=mode)
+
+    acc = new_accumulator(wave.size)
+    accumulate(acc, 'a', rows['a'], a)
+    accumulate(acc, 'bb', rows['bb'], bb)
+    return acc, wave
+
+def _closure_task(args):
+    return closure_rows(*args[0], **args[1])
+
+def run_closure(files:list, outfile:str=None, chunk_size:int=2000,
+                nworkers:int=None, **kwargs):
+    """ Closure statistics of LS2 over one or more Hydrolight files
+
+    Chunks of rows run in a pool of processes;  only their summed
+    statistics come back, so the memory does not grow with the
+    number of rows.
+
+    Args:
+        files (list): Hydrolight files, e.g. from
+            remote.pca.hydrolight_files()
+        outfile (str, optional): Write the summary here (.csv or .parquet)
+        chunk_size (int, optional): Rows per task
+        nworkers (int, optional): Number of processes.
+            Defaults to the number of CPUs;  1 runs in process
+        **kwargs: Passed to closure_rows()
+
+    Returns:
+        pandas.DataFrame: From summarize()
+    """
+    import xarray
+
+    tasks = []
+    for ifile in files:
+        with xarray.open_dataset(ifile, cache=False) as ds:
+            nrow = ds['a'].shape[0]
+        tasks += [((ifile, i0, min(i0+chunk_size, nrow)), kwargs)
+                  for i0 in range(0, nrow, chunk_size)]
+
+    acc, wave = None, None
+    with instrument.stage('ls2.closure', items=len(tasks), nfile=len(files)):
+        if nworkers == 1:
+            for task_acc, task_wave in map(_closure_task, tasks):
+                acc, wave = _merge_task(acc, wave, task_acc, task_wave)
+        else:
+            ctx = multiprocessing.get_context('spawn')
+            with ProcessPoolExecutor(max_workers=nworkers,
+                                     mp_context=ctx) as executor:
+                for task_acc, task_wave in executor.map(_closure_task, tasks):
+                    acc, wave = _merge_task(acc, wave, task_acc, task_wave)
+
+    summary = summarize(acc, wave)
+    if outfile is not None:
+        if outfile.endswith('.parquet'):
+            summary.to_parquet(outfile)
+        else:
+            summary.to_csv(outfile, index=False)
+        print(f"Wrote closure summary to {outfile}")
+    return summary
+
+def _merge_task(acc:dict, wave:np.ndarray, task_acc:dict, task_wave:np.ndarray):
+    # Fold the statistics of a task into the running sums
+    if acc is None:
+        return task_acc, task_wave
+    if not np.array_equal(wave, task_wave):
+        raise ValueError("The Hydrolight files have different wavelengths")
+    return merge(acc, task_acc), wave
+
+
+if __name__ == '__main__':
+    import glob
+    from oceancolor.remote import io as remote_io
+
+    files = sorted(glob.glob(os.path.join(remote_io.loisel_2023_path(),
+                                          'Hydrolight*.nc')))
+    print(run_closure(files, outfile='LS2_closure_L23.csv').to_string())
@@ -0,0 +1,128 @@
+""" Forward LS2:  Rrs and Kd from a, bb and b """
+
+import numpy as np
+
+from oceancolor.ls2 import ls2_main
+from oceancolor.utils import instrument
+
+nw = 1.34  # Refractive index of seawater
+
+
+def calc_muw(sza):
+    """ Cosine of the angle of refraction of the solar beam just
+    beneath the sea surface
+
+    Args:
+        sza (float or np.ndarray): Solar zenith angle [deg]
+
+    Returns:
+        float or np.ndarray: muw
+    """
+    return np.cos(np.arcsin(np.sin(np.asarray(sza) * np.pi/180)/nw))
+
+def _corner_polys(Rrs:np.ndarray, ca:np.ndarray, cb:np.ndarray,
+                  weights:np.ndarray):
+    # Sum over the 4 corners of w/Pa, and the weighted Pbb, with their
+    #  derivatives with respect to Rrs.  ca are the gathered a
+    #  coefficients (ncoeff, 4 corners, ...), cb the bb coefficients
+    #  already summed over the corners (ncoeff, ...)
+    Pa = ca[0] + Rrs*(ca[1] + Rrs*(ca[2] + Rrs*ca[3]))
+    dPa = ca[1] + Rrs*(2*ca[2] + Rrs*3*ca[3])
+    wPa = weights / Pa
+    inv_a = np.sum(wPa, axis=0)
+    dinv_a = -np.sum(wPa * dPa / Pa, axis=0)
+    bbn = Rrs*(cb[0] + Rrs*(cb[1] + Rrs*cb[2]))
+    dbbn = cb[0] + Rrs*(2*cb[1] + Rrs*3*cb[2])
+    return inv_a, dinv_a, bbn, dbbn
+
+@instrument.timed('ls2.LS2_forward',
+                  items=lambda sza, a, bb, b, bw, *args, **kwargs:
+                  np.broadcast(sza, a, bb, b, bw).size)
+def LS2_forward(sza, a:np.ndarray, bb:np.ndarray, b:np.ndarray,
+                bw:np.ndarray, LS2_LUT:dict, Rrs_max:float=0.1,
+                niter:int=30, rtol:float=1e-8):
+    """ Invert the LS2 relations:  Rrs and Kd consistent with a, bb, b
+
+    In LS2, a = Kd / Pa(Rrs) and bb = Kd * Pbb(Rrs), bilinearly
+    interpolated in (eta, muw).  Kd cancels in bb/a, which is
+    monotonic in Rrs, so Rrs follows from a 1D root find
+    (safeguarded Newton) for every entry at once.
+    Kd then follows from a.  No Raman correction is applied.
+
+    All array inputs broadcast against each other.
+
+    Args:
+        sza (float or np.ndarray): Solar zenith angle [deg]
+        a (np.ndarray): Absorption coefficient [m^-1]
+        bb (np.ndarray): Backscattering coefficient [m^-1]
+        b (np.ndarray): Total scattering coefficient [m^-1]
+        bw (np.ndarray): Pure seawater scattering coefficient [m^-1]
+        LS2_LUT (dict): LS2 look-up tables
+        Rrs_max (float, optional): Upper bound for Rrs [sr^-1]
+        niter (int, optional): Maximum number of iterations
+        rtol (float, optional): Relative tolerance on Rrs
+
+    Returns:
+        tuple: Rrs [sr^-1], Kd [m^-1];  NaN where eta or muw is
+            outside of the LUT or bb/a is out of range
+    """
+    a, bb, b, bw, sza = np.broadcast_arrays(
+        *[np.asarray(x, dtype=float) for x in (a, bb, b, bw, sza)])
+    shape = a.shape
+    muw = calc_muw(sza)
+    eta = bw / b
+    idx_eta, idx_muw, weights, valid = ls2_main.LS2_bilinear_weights(
+        eta, muw, LS2_LUT)
+
+    # Work on the valid entries only, flattened
+    ok = np.flatnonzero(valid)
+    a, bb = a.ravel()[ok], bb.ravel()[ok]
+    weights = weights.reshape(4, -1)[:, ok]
+    ca, cb = ls2_main.gather_corners(idx_eta.ravel()[ok],
+                                     idx_muw.ravel()[ok], LS2_LUT)
+    # Pbb is linear in its coefficients:  interpolate them once
+    cb = np.sum(weights * cb, axis=1)
+
+    target = bb / a
+    # Bracket and initial guess from Gordon et al. (1988)
+    lo = np.zeros_like(target)
+    hi = np.full_like(target, Rrs_max)
+    u = bb / (a + bb)
+    rrs = 0.0949*u + 0.0794*u**2
+    Rrs = np.clip(0.52*rrs / (1 - 1.7*rrs), 1e-6, Rrs_max/2)
+
+    # No root below Rrs_max?
+    inv_a, _, bbn, _ = _corner_polys(hi, ca, cb, weights)
+    good = bbn / inv_a >= target
+
+    # Iterate on the unconverged entries only
+    act = np.flatnonzero(good)
+    for _ in range(niter):
+        if act.size == 0:
+            break
+        x = Rrs[act]
+        inv_a, dinv_a, bbn, dbbn = _corner_polys(
+            x, ca[:, :, act], cb[:, act], weights[:, act])
+        f = bbn / inv_a - target[act]
+        df = (dbbn * inv_a - bbn * dinv_a) / inv_a**2
+        # Update bracket
+        lo[act] = np.where(f < 0, x, lo[act])
+        hi[act] = np.where(f > 0, x, hi[act])
+        # Newton, or bisect when leaving the bracket
+        new = x - f / df
+        inside = (new >= lo[act]) & (new <= hi[act])
+        new = np.where(inside, new, 0.5*(lo[act] + hi[act]))
+        Rrs[act] = new
+        act = act[np.abs(new - x) > rtol * np.abs(new)]
+
+    inv_a, _, _, _ = _corner_polys(Rrs, ca, cb, weights)
+    Kd = a / inv_a
+
+    # Failures
+    good &= (Rrs < Rrs_max) & np.isfinite(Rrs)
+    out_Rrs = np.full(valid.size, np.nan)
+    out_Kd = np.full(valid.size, np.nan)
+    out_Rrs[ok[good]] = Rrs[good]
+    out_Kd[ok[good]] = Kd[good]
+
+    return out_Rrs.reshape(shape), out_Kd.reshape(shape)
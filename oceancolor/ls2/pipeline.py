@@ -0,0 +1,311 @@
+""" Rrs to IOPs:  Chla (OC4), bp from Chla and Kd estimators feeding LS2 """
+
+import os
+import functools
+from importlib import resources
+
+import numpy as np
+
+from oceancolor import water
+from oceancolor.ls2 import io as ls2_io
+from oceancolor.ls2 import ls2_main
+from oceancolor.utils import instrument
+
+# OC4v4 (O'Reilly et al. 2000):  polynomial for log10 Chla in
+#  log10(max(Rrs443, Rrs490, Rrs510)/Rrs555)
+oc4v4_coeffs = (0.366, -3.067, 1.930, 0.649, -1.532)
+oc4_bands = (443., 490., 510., 555.)
+
+# Small MLP for Kd, trained by train_kd_mlp()
+kd_mlp_file = os.path.join(resources.files('oceancolor'), 'data', 'LS2',
+                           'Kd_MLP.npz')
+
+
+def band_indices(wave:np.ndarray, bands:tuple, tol:float=15.):
+    """ Indices of the wavelengths nearest to a set of bands
+
+    Args:
+        wave (np.ndarray): Wavelengths [nm]
+        bands (tuple): Bands [nm]
+        tol (float, optional): Maximum offset [nm]
+
+    Returns:
+        np.ndarray: indices (nband)
+    """
+    wave = np.asarray(wave, dtype=float)
+    idx = np.array([np.argmin(np.abs(wave - band)) for band in bands])
+    off = np.abs(wave[idx] - np.asarray(bands))
+    if np.any(off > tol):
+        raise ValueError(f"No wavelength within {tol} nm of the bands "
+                         f"{np.asarray(bands)[off > tol]}")
+    return idx
+
+def oc4_chla(Rrs:np.ndarray, wave:np.ndarray, coeffs:tuple=oc4v4_coeffs,
+             bands:tuple=oc4_bands):
+    """ Chlorophyll-a from the OC4 maximum band ratio
+
+    The nearest wavelengths to the bands are used.
+
+    Args:
+        Rrs (np.ndarray): Remote-sensing reflectance [sr^-1] (..., nwave)
+        wave (np.ndarray): Wavelengths [nm] (nwave)
+        coeffs (tuple, optional): Polynomial coefficients, lowest first
+        bands (tuple, optional): Blue bands, then the green band [nm]
+
+    Returns:
+        np.ndarray: Chla [mg/m^3] (...);  NaN for non-positive Rrs
+    """
+    idx = band_indices(wave, bands)
+    Rrs = np.asarray(Rrs, dtype=float)
+    with np.errstate(divide='ignore', invalid='ignore'):
+        ratio = np.log10(np.max(Rrs[..., idx[:-1]], axis=-1) / Rrs[..., idx[-1]])
+    log_chla = np.polynomial.polynomial.polyval(ratio, coeffs)
+    return 10**log_chla
+
+def bp_from_chla(chla:np.ndarray, wave:np.ndarray):
+    """ Particulate scattering from Chla
+
+    bp(550) = 0.416 Chla^0.766 (Loisel & Morel 1998), with the
+    spectral slope nu = 0.5 (log10 Chla - 0.3) for Chla < 2 mg/m^3
+    and 0 above (Morel et al. 2002).
+
+    Args:
+        chla (np.ndarray): Chla [mg/m^3] (...)
+        wave (np.ndarray): Wavelengths [nm] (nwave)
+
+    Returns:
+        np.ndarray: bp [m^-1] (..., nwave)
+    """
+    chla = np.asarray(chla, dtype=float)[..., None]
+    with np.errstate(divide='ignore', invalid='ignore'):
+        nu = np.where(chla < 2., 0.5*(np.log10(chla) - 0.3), 0.)
+    return 0.416 * chla**0.766 * (np.asarray(wave)/550.)**nu
+
+def _mlp(x:np.ndarray, layers:list):
+    # tanh hidden layers, linear output
+    for W, b in layers[:-1]:
+        x = np.tanh(x @ W + b)
+    W, b = layers[-1]
+    return x @ W + b
+
+@functools.lru_cache(maxsize=None)
+def load_kd_mlp(filename:str=None):
+    """ Kd estimator from a small MLP, as written by train_kd_mlp()
+
+    The MLP maps log10 Rrs at its bands, muw and the wavelength to
+    log10 Kd.  Memoized per file.
+
+    Args:
+        filename (str, optional): Weights.  Defaults to kd_mlp_file
+
+    Returns:
+        callable: kd_estimator(Rrs, wave, sza) -> Kd [m^-1] (..., nwave),
+            for Rrs (..., nwave) and sza (...);  NaN outside of the
+            wavelength range of the training
+    """
+    if filename is None:
+        filename = kd_mlp_file
+    with np.load(filename) as d:
+        nlayer = int(d['nlayer'])
+        layers = [(d[f'W{ii}'], d[f'b{ii}']) for ii in range(nlayer)]
+        x_mean, x_std = d['x_mean'], d['x_std']
+        bands, wave_range = tuple(d['bands']), d['wave_range']
+
+    def kd_estimator(Rrs:np.ndarray, wave:np.ndarray, sza):
+        Rrs = np.asarray(Rrs, dtype=float)
+        wave = np.asarray(wave, dtype=float)
+        idx = band_indices(wave, bands)
+        muw = np.cos(np.arcsin(np.sin(np.asarray(sza, dtype=float)*np.pi/180)/1.34))
+        with np.errstate(divide='ignore', invalid='ignore'):
+            log_Rrs = np.log10(Rrs[..., idx])
+        shape = Rrs.shape
+        # One row per pixel and wavelength
+        x = np.empty(shape + (len(bands)+2,))
+        x[..., :len(bands)] = log_Rrs[..., None, :]
+        x[..., -2] = np.broadcast_to(muw, shape[:-1])[..., None]
+        x[..., -1] = (wave - 550.)/100.
+        x = (x.reshape(-1, x.shape[-1]) - x_mean) / x_std
+        Kd = 10**_mlp(x, layers).reshape(shape)
+        outside = (wave < wave_range[0]) | (wave > wave_range[1])
+        Kd[..., outside] = np.nan
+        return Kd
+
+    return kd_estimator
+
+def simulate_kd_training(nscen:int, seed:int=None, wave:np.ndarray=None,
+                         sza_range:tuple=(0., 70.)):
+    """ Rrs and Kd of the forward LS2 relations for random Case 1
+    waters, to train a Kd estimator
+
+    a_ph has the Gaussian bands of tara.synthetic scaled with Chla,
+    CDOM+NAP an exponential tied to a_ph(443), bp follows
+    bp_from_chla() with scatter, and bbp/bp is 0.005-0.025.
+
+    Args:
+        nscen (int): Number of scenarios
+        seed (int, optional): Seed
+        wave (np.ndarray, optional): Wavelengths [nm].  Defaults to
+            400-700 nm every 5 nm and the OC4 bands
+        sza_range (tuple, optional): Range of solar zenith angles [deg]
+
+    Returns:
+        tuple: wave (nwave), sza (nscen), chla (nscen),
+            Rrs, Kd (nscen, nwave);  NaN outside of the LS2 LUT
+    """
+    from oceancolor.ls2 import forward
+    from oceancolor.tara.synthetic import phyto_shape
+
+    if wave is None:
+        wave = np.unique(np.concatenate([np.arange(400., 705., 5.), oc4_bands]))
+    rstate = np.random.default_rng(seed)
+    chla = 10**rstate.uniform(-1.5, 1.5, nscen)
+    sza = rstate.uniform(*sza_range, nscen)
+
+    aw, bw, _ = water.water_iops(wave)
+    aph = ((chla/157.)**(1/1.22))[:,None] * phyto_shape(wave, chla)
+    aph443 = aph[:, np.argmin(np.abs(wave-443.))]
+    adg = (10**rstate.uniform(-1., 0.3, nscen)*aph443)[:,None] * np.exp(
+        -rstate.uniform(0.01, 0.02, nscen)[:,None]*(wave - 443.))
+    bp = bp_from_chla(chla, wave) * rstate.lognormal(0., 0.3, nscen)[:,None]
+    bbp = rstate.uniform(0.005, 0.025, nscen)[:,None] * bp
+
+    Rrs, Kd = forward.LS2_forward(sza[:,None], aw + aph + adg, bw/2 + bbp,
+                                  bw + bp, bw, ls2_io.load_LUT())
+    return wave, sza, chla, Rrs, Kd
+
+def train_kd_mlp(outfile:str, nscen:int=100000, seed:int=1234,
+                 hidden_layer_sizes:tuple=(32, 32), nper:int=8,
+                 bands:tuple=oc4_bands):
+    """ Train the Kd MLP of load_kd_mlp() on simulate_kd_training()
+
+    Args:
+        outfile (str): Output npz file, e.g. kd_mlp_file
+        nscen (int, optional): Number of scenarios
+        seed (int, optional): Seed
+        hidden_layer_sizes (tuple, optional): Hidden layers
+        nper (int, optional): Random wavelengths per scenario
+        bands (tuple, optional): Bands of the input Rrs [nm]
+
+    Returns:
+        float: RMS error in log10 Kd of the held-out scenarios
+    """
+    from sklearn.neural_network import MLPRegressor
+
+    wave, sza, _, Rrs, Kd = simulate_kd_training(nscen, seed=seed)
+    rstate = np.random.default_rng(seed)
+    idx = band_indices(wave, bands)
+    muw = np.cos(np.arcsin(np.sin(sza*np.pi/180)/1.34))
+
+    iscen = np.repeat(np.arange(nscen), nper)
+    iwave = rstate.integers(0, wave.size, iscen.size)
+    with np.errstate(divide='ignore', invalid='ignore'):
+        X = np.concatenate([np.log10(Rrs[iscen][:, idx]), muw[iscen][:,None],
+                            ((wave[iwave]-550.)/100.)[:,None]], axis=1)
+        y = np.log10(Kd[iscen, iwave])
+    ok = np.all(np.isfinite(X), axis=1) & np.isfinite(y)
+    X, y = X[ok], y[ok]
+
+    # Hold out 10% of the scenarios
+    valid = rstate.random(nscen)[iscen[ok]] < 0.1
+    x_mean, x_std = X[~valid].mean(axis=0), X[~valid].std(axis=0)
+    model = MLPRegressor(hidden_layer_sizes=hidden_layer_sizes,
+                         activation='tanh', batch_size=1024,
+                         learning_rate_init=2e-3, max_iter=200, tol=1e-6,
+                         early_stopping=True, n_iter_no_change=15,
+                         random_state=seed)
+    model.fit((X[~valid] - x_mean)/x_std, y[~valid])
+    rms = np.sqrt(np.mean((model.predict((X[valid]-x_mean)/x_std)
+                           - y[valid])**2))
+
+    weights = {}
+    for ii, (W, b) in enumerate(zip(model.coefs_, model.intercepts_)):
+        weights[f'W{ii}'], weights[f'b{ii}'] = W, b
+    np.savez(outfile, nlayer=len(model.coefs_), x_mean=x_mean, x_std=x_std,
+             bands=np.asarray(bands), wave_range=np.array([wave.min(), wave.max()]),
+             rms=rms, **weights)
+    print(f"Wrote Kd MLP to {outfile};  held-out RMS {rms:.4f} dex")
+    return rms
+
+def retrieve_iops(Rrs:np.ndarray, wave:np.ndarray, sza, kd_estimator=None,
+                  LS2_LUT:dict=None, Flag_Raman:bool=True, aw=None, bw=None,
+                  chunk_size:int=20000, mode:str='exact'):
+    """ IOPs of an Rrs scene:  Chla (OC4), bp from Chla, Kd from an
+    estimator, then LS2, one chunk of pixels at a time
+
+    The outputs are allocated once;  the intermediate Chla, bp and Kd
+    of a chunk go straight into LS2.
+
+    Args:
+        Rrs (np.ndarray): Remote-sensing reflectance [sr^-1] (..., nwave)
+        wave (np.ndarray): Wavelengths [nm] (nwave)
+        sza (float or np.ndarray): Solar zenith angle [deg] (...)
+        kd_estimator (callable, optional): kd_estimator(Rrs, wave, sza)
+            -> Kd (..., nwave) for Rrs (..., nwave) and sza (...).
+            Defaults to load_kd_mlp()
+        LS2_LUT (dict, optional): LS2 look-up tables.
+            Defaults to ls2.io.load_LUT()
+        Flag_Raman (bool, optional): Apply the Raman scattering correction
+        aw (np.ndarray, optional): Pure seawater absorption (nwave) [m^-1].
+            Defaults to water.water_iops(wave), as for bw
+        bw (np.ndarray, optional): Pure seawater scattering (nwave) [m^-1]
+        chunk_size (int, optional): Pixels per chunk
+        mode (str, optional): 'exact' or 'fast', as for LS2_batch
+
+    Returns:
+        dict: chla (...), and bp, Kd, a, anw, bb, bbp, kappa (..., nwave)
+    """
+    Rrs = np.asarray(Rrs, dtype=float)
+    wave = np.asarray(wave, dtype=float)
+    if Rrs.shape[-1] != wave.size:
+        raise ValueError(f"Rrs has {Rrs.shape[-1]} wavelengths, "
+                         f"not {wave.size}")
+    if kd_estimator is None:
+        kd_estimator = load_kd_mlp()
+    if LS2_LUT is None:
+        LS2_LUT = {key: np.asarray(value)
+                   for key, value in ls2_io.load_LUT().items()}
+    if aw is None or bw is None:
+        water_aw, water_bw, _ = water.water_iops(wave)
+        aw = water_aw if aw is None else aw
+        bw = water_bw if bw is None else bw
+    aw = np.broadcast_to(np.asarray(aw, dtype=float), wave.shape)
+    bw = np.broadcast_to(np.asarray(bw, dtype=float), wave.shape)
+    if mode not in ('exact', 'fast'):
+        raise ValueError(f"Bad mode: {mode}")
+    tables = ls2_main.LS2_fast_tables(LS2_LUT) if mode == 'fast' else None
+
+    shape = Rrs.shape[:-1]
+    nwave = wave.size
+    Rrs = Rrs.reshape(-1, nwave)
+    npix = Rrs.shape[0]
+    sza = np.broadcast_to(np.asarray(sza, dtype=float), shape).reshape(-1)
+
+    out = dict(chla=np.full(npix, np.nan))
+    for key in ('bp', 'Kd', 'a', 'anw', 'bb', 'bbp', 'kappa'):
+        out[key] = np.full((npix, nwave), np.nan)
+
+    nbad = 0
+    with instrument.stage('ls2.retrieve_iops', items=npix, nwave=nwave,
+                          mode=mode):
+        for i0 in range(0, npix, chunk_size):
+            sl = slice(i0, i0+chunk_size)
+            Rrs_c, sza_c = Rrs[sl], sza[sl]
+            chla = oc4_chla(Rrs_c, wave)
+            bp = bp_from_chla(chla, wave)
+            Kd = kd_estimator(Rrs_c, wave, sza_c)
+            out['chla'][sl], out['bp'][sl], out['Kd'][sl] = chla, bp, Kd
+
+            # All of the pixels and wavelengths of the chunk at once
+            inputs = np.broadcast_arrays(sza_c[:,None], wave, Rrs_c, Kd,
+                                         aw, bw, bp)
+            *outputs, nbad_chunk = ls2_main._LS2_chunk(
+                *[x.ravel() for x in inputs], LS2_LUT, Flag_Raman,
+                tables=tables)
+            for key, value in zip(('a', 'anw', 'bb', 'bbp', 'kappa'), outputs):
+                out[key][sl] = value.reshape(-1, nwave)
+            nbad += nbad_chunk
+
+    ls2_main._check_outputs([out[key] for key in ('a', 'anw', 'bb', 'bbp')],
+                            nbad)
+    return {key: value.reshape(shape + value.shape[1:])
+            for key, value in out.items()}
@@ -0,0 +1,95 @@
+""" IOPs of mixtures of particles in seawater """
+
+import numpy as np
+
+from oceancolor import cross
+from oceancolor import water
+
+
+class ParticleMixture:
+    """ Synthesize a, b and bb spectra for many scenarios of
+    particle concentrations
+
+    The cross-sections of all components are tabulated once on the
+    wavelength grid into a single (ncomponent, 3*nwave) matrix, so that
+    the IOPs of N scenarios are one (N, ncomponent) x (ncomponent, 3*nwave)
+    matrix multiply, plus pure water.
+
+    Args:
+        wave (np.ndarray): Wavelengths [nm]
+        components (tuple, optional): Components of oceancolor.cross
+        add_water (bool, optional): Add pure water from water_coef.txt
+        dtype (type, optional): Data type of the outputs
+    """
+    def __init__(self, wave:np.ndarray,
+                 components:tuple=('detritus', 'minerals', 'bubbles'),
+                 add_water:bool=True, dtype=np.float64):
+        self.wave = np.asarray(wave, dtype=float)
+        self.dtype = dtype
+        self.components = []
+        self._xsec = np.zeros((0, 3*self.wave.size), dtype=dtype)
+
+        for component in components:
+            self.add_component(component,
+                               *cross.cross_sections(self.wave, component))
+
+        # Pure water
+        if add_water:
+            self.water = np.concatenate(
+                water.water_iops(self.wave)).astype(dtype)
+        else:
+            self.water = None
+
+    @property
+    def xsec(self):
+        """ np.ndarray: cross-sections in m^2 (ncomponent, 3, nwave) """
+        return self._xsec.reshape(len(self.components), 3, self.wave.size)
+
+    def add_component(self, name:str, abs:np.ndarray, scatt:np.ndarray,
+                      backscatt:np.ndarray):
+        """ Add a component from its cross-sections on self.wave
+
+        Args:
+            name (str): Name of the component
+            abs (np.ndarray): Absorption cross-section [micron^2] (nwave)
+            scatt (np.ndarray): Scattering cross-section [micron^2] (nwave)
+            backscatt (np.ndarray): Backscattering cross-section [micron^2]
+                (nwave)
+        """
+        # micron^2 to m^2
+        row = 1e-12 * np.concatenate([abs, scatt, backscatt]).astype(self.dtype)
+        self._xsec = np.vstack([self._xsec, row])
+        self.components.append(name)
+
+    def iops(self, conc:np.ndarray, out:np.ndarray=None):
+        """ IOPs of a set of scenarios
+
+        Args:
+            conc (np.ndarray): Concentrations of the components
+                [particles per m^3] (N, ncomponent), in the order
+                of self.components
+            out (np.ndarray, optional): Output array (N, 3, nwave),
+                C-contiguous and of self.dtype
+
+        Returns:
+            tuple: a, b, bb [m^-1] (N, nwave); views into out
+        """
+        conc = np.atleast_2d(conc).astype(self.dtype, copy=False)
+        if conc.shape[1] != len(self.components):
+            raise ValueError(
+                f"Expected {len(self.components)} components, got {conc.shape[1]}")
+        shape = (conc.shape[0], 3, self.wave.size)
+        if out is None:
+            out = np.empty(shape, dtype=self.dtype)
+        elif out.shape != shape or out.dtype != self.dtype \
+                or not out.flags.c_contiguous:
+            raise ValueError(
+                f"out must be a C-contiguous {self.dtype} array of shape {shape}")
+
+        # One BLAS call
+        flat = out.reshape(conc.shape[0], 3*self.wave.size)
+        np.matmul(conc, self._xsec, out=flat)
+        if self.water is not None:
+            flat += self.water
+
+        return out[:,0], out[:,1], out[:,2]
@@ -0,0 +1,5 @@
+from oceancolor import lazy_submodules
+
+__getattr__, __dir__ = lazy_submodules(__name__, ('load_data', 'community'))
+
+del lazy_submodules
@@ -0,0 +1,90 @@
+""" IOPs of phytoplankton communities from the Stramski et al. 2001
+cross-sections """
+
+import numpy as np
+
+from oceancolor.ph import load_data
+
+
+class Community:
+    """ Synthesize a_ph, b_ph and c_ph for many community compositions
+
+    The absorption and attenuation cross-sections of the species are
+    interpolated once onto the wavelength grid and held in a
+    (nspecies, 3, nwave) array of a, b = c - a and c, so that the IOPs
+    of N compositions are a single einsum.
+
+    Args:
+        wave (np.ndarray): Wavelengths [nm]
+        species (tuple, optional): Species labels, e.g. ('PROC', 'SYNE').
+            Defaults to all species of the absorption table
+        dtype (type, optional): Data type of the outputs
+        **kwargs: Passed to load_data.stramski2001_xsec()
+    """
+    def __init__(self, wave:np.ndarray, species:tuple=None,
+                 dtype=np.float64, **kwargs):
+        self.wave = np.asarray(wave, dtype=float)
+        self.dtype = dtype
+
+        xsec_abs = load_data.stramski2001_xsec('abs', **kwargs)
+        xsec_att = load_data.stramski2001_xsec('att', **kwargs)
+        if species is None:
+            species = xsec_abs.species
+        missing = [label for label in species
+                   if label not in xsec_abs or label not in xsec_att]
+        if len(missing) > 0:
+            raise ValueError(f"Species not in Stramski 2001: {missing}")
+        self.species = list(species)
+
+        # Interpolate once;  NaN outside of the tables
+        abs = np.array([np.interp(self.wave, xsec_abs.wave, row,
+                                  left=np.nan, right=np.nan)
+                        for row in xsec_abs.rows(self.species)])
+        att = np.array([np.interp(self.wave, xsec_att.wave, row,
+                                  left=np.nan, right=np.nan)
+                        for row in xsec_att.rows(self.species)])
+        self._xsec_um2 = np.stack([abs, att - abs, att], axis=1)
+        # micron^2 to m^2
+        self.xsec = (1e-12 * self._xsec_um2).astype(dtype)
+        self.xsec.flags.writeable = False
+
+    def iops(self, conc:np.ndarray, out:np.ndarray=None):
+        """ IOPs of a set of community compositions
+
+        Args:
+            conc (np.ndarray): Cell concentrations [cells per m^3]
+                (N, nspecies), in the order of self.species
+            out (np.ndarray, optional): Output array (N, 3, nwave)
+
+        Returns:
+            tuple: a_ph, b_ph, c_ph [m^-1] (N, nwave); views into out
+        """
+        conc = np.atleast_2d(conc).astype(self.dtype, copy=False)
+        if conc.shape[1] != len(self.species):
+            raise ValueError(
+                f"Expected {len(self.species)} species, got {conc.shape[1]}")
+        if out is None:
+            out = np.empty((conc.shape[0], 3, self.wave.size),
+                           dtype=self.dtype)
+
+        np.einsum('ns,skw->nkw', conc, self.xsec, out=out)
+
+        return out[:,0], out[:,1], out[:,2]
+
+    def add_to_mixture(self, mix, bb_ratio:float=0.005):
+        """ Add the species as components of a ParticleMixture,
+        so they combine with the non-algal components of
+        oceancolor.cross
+
+        The Stramski 2001 tables here have no backscattering,
+        so a constant backscattering ratio is assumed.
+
+        Args:
+            mix (oceancolor.mixture.ParticleMixture): Mixture on
+                the same wavelengths
+            bb_ratio (float, optional): bb_ph / b_ph
+        """
+        if not np.array_equal(mix.wave, self.wave):
+            raise ValueError("The mixture and the community differ in wavelength")
+        for label, (abs, scatt, _) in zip(self.species, self._xsec_um2):
+            mix.add_component(label, abs, scatt, bb_ratio*scatt)
@@ -1,51 +1,203 @@
 """ I/O for phytoplankton data. """
 
 import os
-from pkg_resources import resource_filename
+import functools
+from importlib import resources
 import warnings
 
+import numpy as np
 import pandas
 
-from IPython import embed
+from oceancolor.utils import cache
 
-def stramski2001():
+# Source files of Stramski et al. 2001, in data/phytoplankton
+stramski2001_files = {
+    'table1': 'stramski2001_table1.ascii',
+    'abs': 'Stramski 2001_absorption cross sections_18 species.xlsx',
+    'att': 'Stramski 2001_attenuation cross sections_18 species.xlsx',
+}
+
+
+class CrossSectionTable:
+    """ Cross-sections of a set of species on a common wavelength grid
+
+    Rows are looked up by species label through a dict,
+    without pandas.
+
+    Args:
+        wave (np.ndarray): Wavelengths [nm] (nwave)
+        species (list): Species labels, e.g. 'VIRU', 'HBAC'
+        values (np.ndarray): Cross-sections (nspecies, nwave)
+    """
+    def __init__(self, wave:np.ndarray, species, values:np.ndarray):
+        self.wave = wave
+        self.species = list(species)
+        self.values = values
+        self.index = {label: ii for ii, label in enumerate(self.species)}
+
+    def __getitem__(self, label:str):
+        """ Cross-section spectrum of one species (nwave) """
+        return self.values[self.index[label]]
+
+    def __contains__(self, label:str):
+        return label in self.index
+
+    def __len__(self):
+        return len(self.species)
+
+    def rows(self, labels):
+        """ Cross-sections of a set of species
+
+        Args:
+            labels (list): Species labels
+
+        Returns:
+            np.ndarray: (nlabel, nwave)
+        """
+        return self.values[[self.index[label] for label in labels]]
+
+
+def phytoplankton_path():
+    return os.path.join(resources.files('oceancolor'), 'data', 'phytoplankton')
+
+def _xsec_columns(xlsx_file:str):
+    # Columns of the workbook as read by pandas:  Lambda, then one
+    #  per species
+    df = pandas.read_excel(xlsx_file, sheet_name='Sheet1')
+    return [str(key) for key in df.keys()], [df[key].to_numpy() for key in df.keys()]
+
+def stramski2001_cache(data_path:str=None, cache_dir:str=None):
+    """ Convert the Stramski et al. 2001 tables to binary caches,
+    unless they are up to date
+
+    Table 1 goes to a parquet file and the columns of the
+    cross-section workbooks to an npz file, both as read by pandas.  The file names carry
+    a hash of the modification times of the sources, so an edited
+    source triggers a new conversion.
+
+    Args:
+        data_path (str, optional): Folder of the source files.
+            Defaults to data/phytoplankton
+        cache_dir (str, optional): Folder of the caches.
+            Defaults to cache.cache_path()
+
+    Returns:
+        tuple: parquet file of Table 1, npz file of the cross-sections
+            (None if the Excel files are missing)
+    """
+    if data_path is None:
+        data_path = phytoplankton_path()
+
+    # Table 1
+    tab1_file = os.path.join(data_path, stramski2001_files['table1'])
+    tab1_cache = cache.cache_file('stramski2001_table1', [tab1_file],
+                                  '.parquet', cache_dir=cache_dir)
+    if not os.path.isfile(tab1_cache):
+        tab1 = pandas.read_csv(tab1_file, sep='\t', header=0)
+        cache.write_cache(tab1_cache, lambda outfile: tab1.to_parquet(outfile))
+
+    # Cross-sections
+    xsec_files = [os.path.join(data_path, stramski2001_files[key])
+                  for key in ('abs', 'att')]
+    if not all(os.path.isfile(ifile) for ifile in xsec_files):
+        return tab1_cache, None
+    xsec_cache = cache.cache_file('stramski2001_xsec', xsec_files, '.npz',
+                                  cache_dir=cache_dir)
+    if not os.path.isfile(xsec_cache):
+        arrays = {}
+        for key, ifile in zip(('abs', 'att'), xsec_files):
+            labels, columns = _xsec_columns(ifile)
+            arrays[f'{key}_columns'] = np.array(labels)
+            arrays.update({f'{key}_{ii}': col for ii, col in enumerate(columns)})
+        cache.write_cache(xsec_cache,
+                          lambda outfile: cache.write_npz(outfile, arrays))
+
+    return tab1_cache, xsec_cache
+
+@functools.lru_cache(maxsize=None)
+def _load_table1(tab1_cache:str):
+    return pandas.read_parquet(tab1_cache)
+
+@functools.lru_cache(maxsize=None)
+def _load_columns(xsec_cache:str):
+    # Labels and columns of the workbooks
+    with np.load(xsec_cache) as d:
+        return {key: (d[f'{key}_columns'].tolist(),
+                      [d[f'{key}_{ii}'] for ii in range(d[f'{key}_columns'].size)])
+                for key in ('abs', 'att')}
+
+@functools.lru_cache(maxsize=None)
+def _load_xsec(xsec_cache:str):
+    tables = {}
+    for key, (labels, columns) in _load_columns(xsec_cache).items():
+        # Labels may carry padding, e.g. 'PROC '
+        iwave = labels.index('Lambda')
+        species = [label.strip() for ii, label in enumerate(labels) if ii != iwave]
+        wave = columns[iwave].astype(float)
+        values = np.array([col for ii, col in enumerate(columns) if ii != iwave],
+                          dtype=float)
+        for arr in (wave, values):
+            arr.flags.writeable = False
+        tables[key] = CrossSectionTable(wave, species, values)
+    return tables
+
+def stramski2001_table1(**kwargs):
+    """ Table 1 of Stramski et al. 2001, from the parquet cache
+
+    Args:
+        **kwargs: Passed to stramski2001_cache()
+
+    Returns:
+        pandas.DataFrame: Table 1;  a copy of the cached table
+    """
+    tab1_cache, _ = stramski2001_cache(**kwargs)
+    return _load_table1(tab1_cache).copy()
+
+def stramski2001_xsec(kind:str='abs', **kwargs):
+    """ Absorption or attenuation cross-sections of Stramski et al. 2001
+    [micron^2 per cell], from the npz cache
+
+    Args:
+        kind (str, optional): 'abs' or 'att'
+        **kwargs: Passed to stramski2001_cache()
+
+    Returns:
+        CrossSectionTable: read-only arrays indexed by species label
+    """
+    if kind not in ('abs', 'att'):
+        raise ValueError(f"Bad kind: {kind}.  Use 'abs' or 'att'")
+    _, xsec_cache = stramski2001_cache(**kwargs)
+    if xsec_cache is None:
+        raise FileNotFoundError(
+            'Stramski+ 2001 cross sections not found. Request them')
+    return _load_xsec(xsec_cache)[kind]
+
+def stramski2001(**kwargs):
     """ Load data from Stramski et al. 2001
 
+    Served from the binary caches of stramski2001_cache(), as
+    pandas reads the source files
+
+    Args:
+        **kwargs: Passed to stramski2001_cache()
+
     Returns:
         dict: dictionary of tables
     """
     tables = {}
 
     # Stramski Table 1
-    s2001_tab1_file = os.path.join(resource_filename(
-            'oceancolor', 'data'), 'phytoplankton', 
-            'stramski2001_table1.ascii')
-    # Read
-    s2001_tab1 = pandas.read_csv(s2001_tab1_file, sep='\t', 
-                                 header=0)
-
-    tables['table1'] = s2001_tab1
-
-    # Stramski Absorption
-    s2001_abs_file = os.path.join(resource_filename(
-            'oceancolor', 'data'), 'phytoplankton', 
-            'Stramski 2001_absorption cross sections_18 species.xlsx')
-    if os.path.isfile(s2001_abs_file):
-        df_abs = pandas.read_excel(s2001_abs_file, sheet_name='Sheet1')
-        tables['abs'] = df_abs
-    else:
-        warnings.warn('Stramski+ 2001 absorption cross sections not found. Request them')
-        
-
-    # Stramski Absorption
-    s2001_att_file = os.path.join(resource_filename(
-            'oceancolor', 'data'), 'phytoplankton', 
-            'Stramski 2001_attenuation cross sections_18 species.xlsx')
-    if os.path.isfile(s2001_att_file):
-        df_att = pandas.read_excel(s2001_att_file, sheet_name='Sheet1')
-        tables['att'] = df_att
-    else:
-        warnings.warn('Stramski+ 2001 attenuation cross sections not found. Request them')
+    tables['table1'] = stramski2001_table1(**kwargs)
+
+    # Stramski cross-sections
+    _, xsec_cache = stramski2001_cache(**kwargs)
+    for key, name in zip(('abs', 'att'), ('absorption', 'attenuation')):
+        if xsec_cache is None:
+            warnings.warn(f'Stramski+ 2001 {name} cross sections not found. Request them')
+            continue
+        labels, columns = _load_columns(xsec_cache)[key]
+        tables[key] = pandas.DataFrame(
+            {ii: col.copy() for ii, col in enumerate(columns)}).set_axis(labels, axis=1)
 
     # Return
-    return tables
\ No newline at end of file
+    return tables
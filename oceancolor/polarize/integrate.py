@@ -0,0 +1,105 @@
+""" Integrate volume scattering functions to b and bb """
+import functools
+
+import numpy as np
+
+import xarray
+
+
+def _interp_matrix(psi:np.ndarray, nodes:np.ndarray, extrapolate:str=None):
+    # Matrix P such that P @ values is linear in values at the nodes
+    npsi = psi.size
+    idx = np.clip(np.searchsorted(psi, nodes, side='right') - 1, 0, npsi-2)
+    t = (nodes - psi[idx]) / (psi[idx+1] - psi[idx])
+    if extrapolate == 'constant':
+        t = np.clip(t, 0., 1.)
+    P = np.zeros((nodes.size, npsi))
+    rows = np.arange(nodes.size)
+    P[rows, idx] += 1 - t
+    P[rows, idx+1] += t
+    return P
+
+def _trapz_weights(nodes:np.ndarray, lo:float, hi:float):
+    # Trapezoid weights of the nodes within [lo, hi]
+    w = np.zeros(nodes.size)
+    inside = (nodes >= lo) & (nodes <= hi)
+    x = nodes[inside]
+    dx = np.diff(x)
+    w_in = np.zeros(x.size)
+    w_in[:-1] += dx/2
+    w_in[1:] += dx/2
+    w[inside] = w_in
+    return w
+
+@functools.lru_cache(maxsize=64)
+def _quadrature_weights(psi:tuple, extrapolate:str):
+    psi = np.array(psi)
+    lo, hi = (0., 180.) if extrapolate is not None else (psi[0], psi[-1])
+    nodes = np.unique(np.concatenate([psi, [lo, 90., hi]]))
+    nodes = nodes[(nodes >= lo) & (nodes <= hi)]
+
+    rad = np.deg2rad(nodes)
+    P = _interp_matrix(psi, nodes, extrapolate=extrapolate)
+    f = 2*np.pi * np.sin(rad)
+    W = np.stack([
+        (f * _trapz_weights(rad, rad[0], rad[-1])) @ P,
+        (f * _trapz_weights(rad, np.pi/2, rad[-1])) @ P])
+    W.flags.writeable = False
+    return W
+
+def quadrature_weights(psi:np.ndarray, extrapolate:str=None):
+    """ Quadrature weights of b and bb for an angle grid
+
+    b = 2 pi int_0^pi VSF sin(psi) dpsi and bb the same from pi/2,
+    by the trapezoid rule in psi, with VSF linear between the angles
+    of the grid.  Memoized on the grid.
+
+    Args:
+        psi (np.ndarray): Scattering angles, ascending [deg] (npsi)
+        extrapolate (str, optional): Extend the VSF to 0 and 180 deg,
+            'constant' (nearest value) or 'linear' (nearest two values).
+            Otherwise the integrals are limited to the range of psi
+
+    Returns:
+        np.ndarray: b and bb weights (2, npsi) [sr];  read-only
+    """
+    if extrapolate not in (None, 'constant', 'linear'):
+        raise ValueError(f"Bad extrapolate: {extrapolate}")
+    psi = np.asarray(psi, dtype=float)
+    if np.any(np.diff(psi) <= 0):
+        raise ValueError("psi must be strictly ascending")
+    return _quadrature_weights(tuple(psi.tolist()), extrapolate)
+
+def integrate_vsf(psi:np.ndarray, vsf:np.ndarray, extrapolate:str=None):
+    """ b, bb and the backscattering ratio of a set of VSFs
+
+    Args:
+        psi (np.ndarray): Scattering angles, ascending [deg] (npsi)
+        vsf (np.ndarray): VSFs [1/m sr] (..., npsi)
+        extrapolate (str, optional): See quadrature_weights()
+
+    Returns:
+        tuple: b, bb [1/m], bb/b (...)
+    """
+    W = quadrature_weights(psi, extrapolate=extrapolate)
+    b_bb = np.asarray(vsf, dtype=float) @ W.T
+    b, bb = b_bb[...,0], b_bb[...,1]
+    return b, bb, bb/b
+
+def scattering_coeffs(ds:xarray.Dataset, quantity:str='VSF',
+                      extrapolate:str=None):
+    """ b, bb and bb/b of a VSF sheet from load_data.koestner()
+
+    Args:
+        ds (xarray.Dataset): Sheet on (sample, psi)
+        quantity (str, optional): VSF variable
+        extrapolate (str, optional): See quadrature_weights()
+
+    Returns:
+        xarray.Dataset: b, bb, bb_ratio on sample
+    """
+    b, bb, ratio = integrate_vsf(ds.psi.data, ds[quantity].data,
+                                 extrapolate=extrapolate)
+    return xarray.Dataset(dict(b=('sample', b), bb=('sample', bb),
+                               bb_ratio=('sample', ratio)),
+                          coords=dict(sample=ds.sample.data))
@@ -1,14 +1,242 @@
 """ Module to load polarization data """
 import os
-from pkg_resources import resource_filename
+import functools
+from importlib import resources
 
 import numpy as np
 
 import pandas
+import xarray
+
+from oceancolor.utils import cache
+
+# Workbooks in data/polarization
+koestner_files = {
+    2020: 'Koestner_et_al_2020_AO_Fig4.xlsx',
+    2021: 'Koestner-et-al-2021_AO_VSFs.xlsx',
+}
+# Short names of the 2021 sheets
+k2021_aliases = {
+    'BS': 'Beaufort Sea - corrected',
+    'BS-uncorrected': 'Beaufort Sea - uncorrected',
+    'Mineral': 'Minerals',
+}
+
+
+def polarization_path():
+    return os.path.join(resources.files('oceancolor'), 'data', 'polarization')
+
+def _label_kind(label):
+    # Type of a column label, to restore it from the cache
+    if isinstance(label, (int, np.integer)):
+        return 'i'
+    if isinstance(label, (float, np.floating)):
+        return 'f'
+    return 's'
+
+def _parse_sheet(year:int, name:str, df:pandas.DataFrame):
+    """ Arrays of one sheet: angle columns have numeric labels """
+    col_psi = pandas.to_numeric(df.columns.astype(str), errors='coerce')
+    is_psi = np.isfinite(col_psi)
+    psi = np.asarray(col_psi[is_psi], dtype=float)
+    values = df.loc[:, is_psi].to_numpy(dtype=float)
+
+    if year == 2020:
+        # 15 samples, then the median and mean
+        quantity = name[:3]
+        samples = [str(ii) for ii in range(len(df)-2)] + ['median', 'mean']
+    else:
+        quantity = 'VSF'
+        samples = df.iloc[:, 0].astype(str).tolist()
+    others = np.flatnonzero(~is_psi)
+    is_meta = np.array([pandas.api.types.is_numeric_dtype(df.iloc[:, ii])
+                        for ii in others], dtype=bool)
+    meta_pos, text_pos = others[is_meta], others[~is_meta]
+    text = df.iloc[:, text_pos]
+    return dict(quantity=np.array(quantity), psi=psi, values=values,
+                samples=np.array(samples),
+                meta_names=np.array([str(df.columns[ii]) for ii in meta_pos], dtype=str),
+                meta=df.iloc[:, meta_pos].to_numpy(dtype=float).reshape(len(df), -1),
+                # To rebuild the sheet as read by pandas
+                columns=np.array([str(key) for key in df.columns], dtype=str),
+                column_kinds=np.array([_label_kind(key) for key in df.columns]),
+                psi_pos=np.flatnonzero(is_psi), meta_pos=meta_pos,
+                text_pos=text_pos,
+                text=text.fillna('').to_numpy(dtype=str).T.reshape(-1, len(df)),
+                text_isna=text.isna().to_numpy().T.reshape(-1, len(df)))
+
+def koestner_cache(year:int, data_path:str=None, cache_dir:str=None):
+    """ Convert a Koestner workbook to an npz cache, unless it is
+    up to date
+
+    Each data sheet becomes a set of arrays of shape (sample, psi)
+    plus the per-sample metadata.  The text of the Header sheet
+    is kept too.  The file name carries a hash of
+    the modification time of the workbook.
+
+    Args:
+        year (int): 2020 or 2021
+        data_path (str, optional): Folder of the workbooks.
+            Defaults to data/polarization
+        cache_dir (str, optional): Folder of the caches
+
+    Returns:
+        str: npz file
+    """
+    if year not in koestner_files:
+        raise ValueError(f"Bad year: {year}.  Choose from {list(koestner_files)}")
+    if data_path is None:
+        data_path = polarization_path()
+    xlsx_file = os.path.join(data_path, koestner_files[year])
+    npz_file = cache.cache_file(f'koestner{year}', [xlsx_file], '.npz',
+                                cache_dir=cache_dir)
+    if not os.path.isfile(npz_file):
+        sheets = pandas.read_excel(xlsx_file, sheet_name=None)
+        # Text only;  kept to rebuild the workbook
+        header = sheets.pop('Header')
+        arrays = dict(sheets=np.array(list(sheets.keys())))
+        for key, arr in _parse_sheet(year, 'Header', header).items():
+            arrays[f'header-{key}'] = arr
+        for ss, (name, df) in enumerate(sheets.items()):
+            for key, arr in _parse_sheet(year, name, df).items():
+                arrays[f'sheet{ss}-{key}'] = arr
+        cache.write_cache(npz_file,
+                          lambda outfile: cache.write_npz(outfile, arrays))
+    return npz_file
+
+@functools.lru_cache(maxsize=None)
+def _sheet_names(npz_file:str):
+    with np.load(npz_file) as store:
+        return store['sheets'].tolist()
+
+def _read_sheet(npz_file:str, sheet:str):
+    # Only the members of the sheet are read;  the file is closed after
+    sheets = _sheet_names(npz_file)
+    if sheet == 'Header':
+        prefix = 'header-'
+    elif sheet in sheets:
+        prefix = f'sheet{sheets.index(sheet)}-'
+    else:
+        raise ValueError(f"Bad sheet: {sheet}.  Choose from {sheets}")
+    with np.load(npz_file) as store:
+        return {key[len(prefix):]: store[key] for key in store.files
+                if key.startswith(prefix)}
+
+@functools.lru_cache(maxsize=None)
+def _load_sheet(npz_file:str, sheet:str):
+    arrays = _read_sheet(npz_file, sheet)
+    values = arrays['values']
+    values.flags.writeable = False
+    coords = dict(sample=arrays['samples'], psi=arrays['psi'])
+    for key, col in zip(arrays['meta_names'], arrays['meta'].T):
+        coords[str(key)] = ('sample', col)
+    ds = xarray.Dataset({str(arrays['quantity']): (('sample', 'psi'), values)},
+                        coords=coords)
+    ds.attrs['sheet'] = sheet
+    return ds
+
+@functools.lru_cache(maxsize=None)
+def _load_frame(npz_file:str, sheet:str):
+    # The sheet as read by pandas.read_excel
+    arrays = _read_sheet(npz_file, sheet)
+    cols = {}
+    for pos, col in zip(arrays['psi_pos'], arrays['values'].T):
+        cols[pos] = col
+    for pos, col in zip(arrays['meta_pos'], arrays['meta'].T):
+        cols[pos] = col
+    for pos, col, isna in zip(arrays['text_pos'], arrays['text'],
+                              arrays['text_isna']):
+        cols[pos] = pandas.Series(col.astype(object), dtype='str').mask(isna)
+    casts = dict(i=int, f=float, s=str)
+    labels = [casts[kind](label) for label, kind in
+              zip(arrays['columns'], arrays['column_kinds'])]
+    return pandas.DataFrame({ii: cols[ii] for ii in range(len(labels))}).set_axis(
+        labels, axis=1)
+
+def koestner_sheets(year:int, **kwargs):
+    """ Names of the data sheets of a Koestner workbook
+
+    Args:
+        year (int): 2020 or 2021
+        **kwargs: Passed to koestner_cache()
+
+    Returns:
+        list: sheet names
+    """
+    return _sheet_names(koestner_cache(year, **kwargs))
+
+def koestner(year:int, sheet:str, **kwargs):
+    """ One sheet of Koestner et al. 2020 (P12, P22) or 2021 (VSF),
+    from the npz cache
+
+    Only the arrays of the requested sheet are read.
+
+    Args:
+        year (int): 2020 or 2021
+        sheet (str): Name of the sheet, e.g. 'P22' or 'Lagoon'.
+            The 2021 sheets also go by 'BS' and 'BS-uncorrected'
+        **kwargs: Passed to koestner_cache()
+
+    Returns:
+        xarray.Dataset: P12, P22 [dim] or VSF [1/m sr] on (sample, psi [deg]),
+            with the per-sample metadata (e.g. DF, cp, bp) as coordinates.
+            Shared across calls;  the arrays are read-only
+    """
+    if year == 2021:
+        sheet = k2021_aliases.get(sheet, sheet)
+    return _load_sheet(koestner_cache(year, **kwargs), sheet)
+
+def interp_psi(psi:np.ndarray, values:np.ndarray, psi_grid:np.ndarray,
+               log:bool=False):
+    """ Interpolate many angular distributions onto a common psi grid
+
+    The bracketing indices and weights are computed once for the grid
+    and applied to all rows.
+
+    Args:
+        psi (np.ndarray): Scattering angles, ascending [deg] (npsi)
+        values (np.ndarray): Values (..., npsi)
+        psi_grid (np.ndarray): Output angles [deg] (ngrid)
+        log (bool, optional): Interpolate log(values), e.g. for the VSF
+
+    Returns:
+        np.ndarray: (..., ngrid);  NaN outside of psi
+    """
+    psi = np.asarray(psi, dtype=float)
+    psi_grid = np.asarray(psi_grid, dtype=float)
+    values = np.log(values) if log else np.asarray(values, dtype=float)
+
+    idx = np.clip(np.searchsorted(psi, psi_grid, side='right') - 1,
+                  0, psi.size-2)
+    t = (psi_grid - psi[idx]) / (psi[idx+1] - psi[idx])
+    output = values[..., idx]*(1-t) + values[..., idx+1]*t
+    output[..., (psi_grid < psi[0]) | (psi_grid > psi[-1])] = np.nan
+
+    return np.exp(output) if log else output
+
+def regrid(ds:xarray.Dataset, psi_grid:np.ndarray, log:bool=False):
+    """ A sheet from koestner() on a new psi grid
+
+    Args:
+        ds (xarray.Dataset): Sheet
+        psi_grid (np.ndarray): Output angles [deg]
+        log (bool, optional): Interpolate in log
+
+    Returns:
+        xarray.Dataset: on (sample, psi_grid)
+    """
+    data_vars = {key: (('sample', 'psi'),
+                       interp_psi(ds.psi.data, ds[key].data, psi_grid, log=log))
+                 for key in ds.data_vars}
+    coords = {key: ds.coords[key] for key in ds.coords if key != 'psi'}
+    coords['psi'] = np.asarray(psi_grid, dtype=float)
+    return xarray.Dataset(data_vars, coords=coords, attrs=ds.attrs)
 
 def koetner2020(sheet:str=None):
     """ Load Koetner et al. 2020 from Figure 4
 
+    Served from the npz cache of koestner_cache(), as read by pandas
+
     Args:
         sheet (str, optional): Name of the sheet
             ['Header', 'P12', 'P22', 'P12 2018 corrections', 'P22 no correction']
@@ -17,44 +245,28 @@ def koetner2020(sheet:str=None):
         pandas.DataFrame or tuple: 
             DataFrame of the full table or tuple of the sheet, psis [deg], vsf [1/m sr]
     """
-    file_2020 = os.path.join(resource_filename('oceancolor', 'data'), 'polarization',
-                         'Koestner_et_al_2020_AO_Fig4.xlsx')
-    # Open                        
-    k2020 = pandas.read_excel(file_2020, sheet_name=None)
+    npz_file = koestner_cache(2020)
 
     # Sheet?
     if sheet is None:
-        return k2020
-
-    sheet = k2020[sheet]
-
-    # Parse
-    psis = []
-    psi_cols = []
-    cols = []
-    for key in sheet.keys():
-        try:
-            psis.append(float(key))
-        except:
-            pass
-        else:
-            psi_cols.append(key)
-            cols.append(sheet[key])
-                        
-    # Recast
-    psis = np.array(psis)
-    data = np.concatenate(cols).reshape(len(psi_cols),(len(sheet)))
+        return {name: _load_frame(npz_file, name).copy()
+                for name in ['Header'] + _sheet_names(npz_file)}
+
+    ds = _load_sheet(npz_file, sheet)
+    data = ds[list(ds.data_vars)[0]].data.T
 
     # Chop up
     samples = data[:,0:15]
     median = data[:,15]
     mean = data[:,16]
 
-    return sheet, psis, samples, median, mean 
+    return _load_frame(npz_file, sheet).copy(), ds.psi.data, samples, median, mean 
 
 def koetner2021(sheet:str=None):
     """ Load the Koetner et al. 2021 VSF data
 
+    Served from the npz cache of koestner_cache(), as read by pandas
+
     Args:
         sheet (str, optional): Name of the sheet
             ['Lagoon', 'Mineral', 'BS', 'BS-uncorrected']
@@ -63,37 +275,19 @@ def koetner2021(sheet:str=None):
         pandas.DataFrame or tuple: 
             DataFrame of the full table or tuple of the sheet, psis [deg], vsf [1/m sr]
     """
-    file_2021 = os.path.join(resource_filename('oceancolor', 'data'), 'polarization',
-                         'Koestner-et-al-2021_AO_VSFs.xlsx')
-    # Open                        
-    k2021 = pandas.read_excel(file_2021, sheet_name=None)
-
-    # Rename BS for convenience
-    k2021['BS'] = k2021.pop('Beaufort Sea - corrected')
-    k2021['BS-uncorrected'] = k2021.pop('Beaufort Sea - uncorrected')
+    npz_file = koestner_cache(2021)
 
     # Sheet?
     if sheet is None:
+        k2021 = {name: _load_frame(npz_file, name).copy()
+                 for name in ['Header'] + _sheet_names(npz_file)}
+        # Rename BS for convenience
+        k2021['BS'] = k2021.pop('Beaufort Sea - corrected')
+        k2021['BS-uncorrected'] = k2021.pop('Beaufort Sea - uncorrected')
         return k2021
 
-    sheet = k2021[sheet]
-
-    # Parse
-    psis = []
-    psi_cols = []
-    cols = []
-    for key in sheet.keys():
-        try:
-            psis.append(float(key))
-        except:
-            pass
-        else:
-            psi_cols.append(key)
-            cols.append(sheet[key])
-                        
-    # Recast
-    psis = np.array(psis)
-    vsf = np.concatenate(cols).reshape(len(psi_cols),(len(sheet)))
+    sheet = k2021_aliases.get(sheet, sheet)
+    ds = _load_sheet(npz_file, sheet)
 
     # Return
-    return sheet, psis, vsf
+    return _load_frame(npz_file, sheet).copy(), ds.psi.data, ds['VSF'].data.T
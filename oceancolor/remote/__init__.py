@@ -0,0 +1,7 @@
+from oceancolor import lazy_submodules
+
+__getattr__, __dir__ = lazy_submodules(__name__, (
+    'figures', 'io', 'library', 'mcmc', 'nn', 'pca', 'posterior', 'sweep',
+    'synthetic'))
+
+del lazy_submodules
@@ -1,7 +1,7 @@
 """ Generate figures for the remote sensing project """
 
 import os
-import xarray
+import warnings
 import numpy as np
 
 from matplotlib import pyplot as plt
@@ -9,41 +9,45 @@ from matplotlib import pyplot as plt
 import emcee
 
 from oceancolor.remote import io as remote_io
+from oceancolor.remote import pca as remote_pca
+from oceancolor.remote import posterior
+from oceancolor.remote import mcmc
 
-from IPython import embed
+def fig_pca_mcmc(outfile:str, l23_idx:int, X:int=4, Y:int=0,
+                 chain_file:str='MCMC_NN_L23.h5'):
 
-def fig_pca_mcmc(outfile:str, l23_idx:int, X:int=4, Y:int=0):
-
-    # Load Hydrolight
-    l23_path = os.path.join(os.getenv('OS_COLOR'),
-                            'data', 'Loisel2023')
-    variable_file = os.path.join(l23_path, 
-                                 f'Hydrolight{X}{Y:02d}.nc')
-    ds = xarray.load_dataset(variable_file)
+    # Load the one Hydrolight row
+    l23 = remote_io.load_loisel_2023()
+    ds = l23.hydrolight_rows(l23_idx, X=X, Y=Y, variables=['a', 'bb'])
 
     # And its PCA
     print("Loading Hydrolight data")
     ab, Rs, d_l23 = remote_io.load_loisel_2023_pca()
 
-    # Load MCMC
-    mcmc_file = f'MCMC_NN_i{l23_idx}.h5'
-    reader = emcee.backends.HDFBackend(mcmc_file, read_only=True)
-    flatchain = reader.get_chain(flat=True)
-
-    # Cut down
-    flatchain = flatchain[-10000:]
+    # Load MCMC;  the converged samples from the chain store, else the
+    #  last of a full chain
+    if os.path.isfile(chain_file) and \
+            f'i{l23_idx}' in mcmc.chain_keys(chain_file):
+        flatchain, attrs = mcmc.read_chain(chain_file, f'i{l23_idx}')
+        if not attrs.get('converged', True):
+            warnings.warn(f"The chain of {l23_idx} did not converge")
+    else:
+        mcmc_file = f'MCMC_NN_i{l23_idx}.h5'
+        reader = emcee.backends.HDFBackend(mcmc_file, read_only=True)
+        flatchain = reader.get_chain(flat=True)[-10000:]
 
     # Generate the predictions
-    a_recon = np.dot(flatchain[:,0:3], d_l23['a_M3']) + d_l23['a_mean']
-    a_mean = np.mean(a_recon, axis=0)
-    a_std = np.std(a_recon, axis=0)
-    a_pca = np.dot(ab[l23_idx, 0:3], d_l23['a_M3']) + d_l23['a_mean']
+    summary = posterior.summarize_ab(flatchain, d_l23, quantiles=None)
+    a_mean = summary.a_mean.data[0]
+    a_std = summary.a_std.data[0]
+    a_pca = remote_pca.reconstruct_from_coeffs(
+        ab[l23_idx, 0:3], d_l23['a_M3'], d_l23['a_mean'])
 
     # Generate the predictions
-    bb_recon = np.dot(flatchain[:,3:], d_l23['bb_M3']) + d_l23['bb_mean']
-    bb_mean = np.mean(bb_recon, axis=0)
-    bb_std = np.std(bb_recon, axis=0)
-    bb_pca = np.dot(ab[l23_idx, 3:], d_l23['bb_M3']) + d_l23['bb_mean']
+    bb_mean = summary.bb_mean.data[0]
+    bb_std = summary.bb_std.data[0]
+    bb_pca = remote_pca.reconstruct_from_coeffs(
+        ab[l23_idx, 3:], d_l23['bb_M3'], d_l23['bb_mean'])
 
 
     # Init plot
@@ -54,7 +58,7 @@ def fig_pca_mcmc(outfile:str, l23_idx:int, X:int=4, Y:int=0):
     ax_a = axes[0,0]
 
     # Plot real answer
-    ax_a.plot(ds.Lambda, ds.a.data[l23_idx,:], 'k-', label='True a')
+    ax_a.plot(ds.Lambda, ds.a.data, 'k-', label='True a')
 
     # Plot prediction
     ax_a.plot(ds.Lambda, a_mean, 'b--', label='Predicted a')
@@ -74,7 +78,7 @@ def fig_pca_mcmc(outfile:str, l23_idx:int, X:int=4, Y:int=0):
     ax_az = axes[0,1]
 
     # Plot real answer
-    ax_az.plot(ds.Lambda, ds.a.data[l23_idx,:], 'k-', label='True a')
+    ax_az.plot(ds.Lambda, ds.a.data, 'k-', label='True a')
 
     # Plot prediction
     ax_az.plot(ds.Lambda, a_mean, 'b--', label='Predicted a')
@@ -97,7 +101,7 @@ def fig_pca_mcmc(outfile:str, l23_idx:int, X:int=4, Y:int=0):
     ax_bb = axes[1,0]
 
     # Plot real answer
-    ax_bb.plot(ds.Lambda, ds.bb.data[l23_idx,:], 'k-', label='True bb')
+    ax_bb.plot(ds.Lambda, ds.bb.data, 'k-', label='True bb')
 
     # Plot prediction
     ax_bb.plot(ds.Lambda, bb_mean, 'b--', label='Predicted bb')
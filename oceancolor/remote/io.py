@@ -1,23 +1,195 @@
 """ I/O for Remote Sensing data and more """
 import os
+import functools
+
 import numpy as np
 
+import xarray
+
+
+def loisel_2023_path():
+    """ Folder holding the Loisel 2023 products
+
+    Returns:
+        str: $OS_COLOR/data/Loisel2023
+    """
+    return os.path.join(os.getenv('OS_COLOR'), 'data', 'Loisel2023')
+
+def hydrolight_file(X:int, Y:int, l23_path:str=None):
+    """ Path to one Loisel 2023 Hydrolight file
+
+    Args:
+        X (int): 1,2,4 for nothing, Raman, Raman+Fluorescence
+        Y (int): Sun zenith angle [deg]
+        l23_path (str, optional): Folder of the file.
+            Defaults to loisel_2023_path()
+
+    Returns:
+        str: path to Hydrolight{X}{Y:02d}.nc
+    """
+    if l23_path is None:
+        l23_path = loisel_2023_path()
+    return os.path.join(l23_path, f'Hydrolight{X}{Y:02d}.nc')
+
+def _read_only(arr:np.ndarray):
+    arr.flags.writeable = False
+    return arr
+
+
+class Loisel2023:
+    """ Access to the Loisel 2023 products:  the PCA file and
+    the Hydrolight tables
+
+    Use load_loisel_2023() to get the instance shared across
+    the process rather than building one directly.
+
+    The PCA file is read once, on first access, and its arrays
+    are exposed read-only.  The Hydrolight files are opened
+    lazily, so selecting rows only reads those rows.
+
+    Args:
+        pca_file (str, optional): PCA file in l23_path
+        back_scatt (str, optional): Back-scattering PCA for ab
+        l23_path (str, optional): Folder of the files.
+            Defaults to loisel_2023_path()
+    """
+    def __init__(self, pca_file:str='pca_ab_33_Rrs.npz',
+                 back_scatt:str='bb', l23_path:str=None):
+        self.l23_path = loisel_2023_path() if l23_path is None else l23_path
+        self.pca_file = os.path.join(self.l23_path, pca_file)
+        self.back_scatt = back_scatt
+        self._d = None
+        self._ab = None
+
+    @property
+    def d(self):
+        """ dict: read-only arrays of the PCA file """
+        if self._d is None:
+            with np.load(self.pca_file) as f:
+                self._d = {key: _read_only(f[key]) for key in f.files}
+        return self._d
+
+    @property
+    def ab(self):
+        """ np.ndarray: PCA coefficients of a and back_scatt,
+        concatenated (nspec, nparam) """
+        if self._ab is None:
+            self._ab = _read_only(np.concatenate(
+                [self.d['a'], self.d[self.back_scatt]], axis=1))
+        return self._ab
+
+    @property
+    def Rs(self):
+        """ np.ndarray: Rs (nspec, nwave) """
+        return self.d['Rs']
+
+    def pca_basis(self, key:str):
+        """ PCA basis of one IOP
+
+        Args:
+            key (str): a, b or bb
+
+        Returns:
+            tuple: components (ncomp, nwave), mean (nwave)
+        """
+        return self.d[f'{key}_M3'], self.d[f'{key}_mean']
+
+    def hydrolight(self, X:int=4, Y:int=0):
+        """ Lazily opened Hydrolight table
+
+        Args:
+            X (int, optional): 1,2,4
+            Y (int, optional): Sun zenith angle [deg]
+
+        Returns:
+            xarray.Dataset:
+        """
+        return open_hydrolight(X, Y, l23_path=self.l23_path)
+
+    def hydrolight_rows(self, rows, X:int=4, Y:int=0,
+                        variables:list=None):
+        """ Read a selection of rows of a Hydrolight table
+
+        Args:
+            rows (int, slice or np.ndarray): Rows (IOP scenarios)
+            X (int, optional): 1,2,4
+            Y (int, optional): Sun zenith angle [deg]
+            variables (list, optional): Variables to read,
+                e.g. ['a', 'bb'].  Defaults to all
+
+        Returns:
+            xarray.Dataset: in memory
+        """
+        ds = self.hydrolight(X, Y)
+        if variables is not None:
+            ds = ds[variables]
+        return ds.isel(IOP_Scenario=rows).load()
+
+
+@functools.lru_cache(maxsize=None)
+def load_loisel_2023(pca_file:str='pca_ab_33_Rrs.npz',
+                     back_scatt:str='bb', l23_path:str=None):
+    """ Shared, process-wide Loisel2023 object
+
+    Args:
+        pca_file (str, optional): PCA file
+        back_scatt (str, optional): Back-scattering PCA for ab
+        l23_path (str, optional): Folder of the files
+
+    Returns:
+        Loisel2023:
+    """
+    return Loisel2023(pca_file=pca_file, back_scatt=back_scatt,
+                      l23_path=l23_path)
+
+@functools.lru_cache(maxsize=16)
+def open_hydrolight(X:int, Y:int, l23_path:str=None,
+                    chunk_size:int=1000):
+    """ Open a Hydrolight table lazily;  cached across the process
+
+    The data are chunked along the IOP scenarios when dask
+    is available.
+
+    Args:
+        X (int): 1,2,4
+        Y (int): Sun zenith angle [deg]
+        l23_path (str, optional): Folder of the file
+        chunk_size (int, optional): Rows per dask chunk
+
+    Returns:
+        xarray.Dataset:
+    """
+    variable_file = hydrolight_file(X, Y, l23_path=l23_path)
+    try:
+        import dask
+    except ImportError:
+        chunks = None
+    else:
+        chunks = {'IOP_Scenario': chunk_size}
+    return xarray.open_dataset(variable_file, chunks=chunks)
+
+def clear_loisel_2023_cache():
+    """ Empty the caches;  the Hydrolight files are closed 
+    once no longer referenced """
+    load_loisel_2023.cache_clear()
+    open_hydrolight.cache_clear()
+
 
 def load_loisel_2023_pca(pca_file:str='pca_ab_33_Rrs.npz',
                          back_scatt:str='bb'):
+    """ Load the PCA of the Loisel 2023 Hydrolight tables
 
-    # Load up data
-    l23_path = os.path.join(os.getenv('OS_COLOR'),
-                            'data', 'Loisel2023')
-    outfile = os.path.join(l23_path, pca_file)
+    Served from the process-wide cache;  the arrays are read-only.
 
-    d = np.load(outfile)
-    nparam = d['a'].shape[1]+d[back_scatt].shape[1]
-    ab = np.zeros((d['a'].shape[0], nparam))
-    ab[:,0:d['a'].shape[1]] = d['a']
-    ab[:,d['a'].shape[1]:] = d[back_scatt]
+    Args:
+        pca_file (str, optional): PCA file
+        back_scatt (str, optional): Back-scattering PCA for ab
 
-    Rs = d['Rs']
+    Returns:
+        tuple: ab (nspec, nparam), Rs (nspec, nwave),
+            dict of all arrays in the file
+    """
+    l23 = load_loisel_2023(pca_file=pca_file, back_scatt=back_scatt)
 
     # Return
-    return ab, Rs, d
\ No newline at end of file
+    return l23.ab, l23.Rs, l23.d
@@ -0,0 +1,225 @@
+""" Library of (ab, Rs) pairs, e.g. the Loisel 2023 tables:
+nearest-neighbour lookups and importance-sampling retrievals """
+
+import functools
+
+import numpy as np
+
+from oceancolor.remote import io as remote_io
+from oceancolor.utils import instrument
+
+
+class Library:
+    """ KD-tree over the library spectra, for the nearest members
+    of target spectra
+
+    The tree is built on a PCA projection of log Rs, where Euclidean
+    distances approximate the relative residuals of mcmc.log_prob.
+    The candidates of the tree are re-ranked on the full spectra.
+
+    Use load_library() to share the Loisel 2023 library across
+    the process.
+
+    Args:
+        ab (np.ndarray): Parameters of the members (nlib, nparam)
+        Rs (np.ndarray): Their spectra (nlib, nwave)
+        ncomp (int, optional): PCA components of log Rs for the tree
+    """
+    def __init__(self, ab:np.ndarray, Rs:np.ndarray, ncomp:int=8):
+        from scipy.spatial import cKDTree
+
+        self.ab = np.asarray(ab)
+        self.Rs = np.asarray(Rs)
+        self.log_Rs = np.log(np.maximum(self.Rs, 1e-10))
+        self.mean = self.log_Rs.mean(axis=0)
+        _, _, Vt = np.linalg.svd(self.log_Rs - self.mean, full_matrices=False)
+        self.M = Vt[:ncomp]
+        self.tree = cKDTree((self.log_Rs - self.mean) @ self.M.T)
+        # Floor on the scatter of the walkers
+        self.ab_std = self.ab.std(axis=0)
+        # For the likelihood matrix;  ab centred against cancellation
+        self.Rs_sq = self.Rs**2
+        self.ab_mean = self.ab.mean(axis=0)
+        self.ab_outer = np.einsum('ji,jk->jik', self.ab - self.ab_mean,
+                                  self.ab - self.ab_mean).reshape(len(self.ab), -1)
+
+    def query(self, Rs:np.ndarray, k:int=8, oversample:int=4):
+        """ Nearest library members of target spectra
+
+        Args:
+            Rs (np.ndarray): Target spectra (nwave) or (ntarget, nwave)
+            k (int, optional): Number of neighbours
+            oversample (int, optional): Candidates from the tree,
+                per neighbour, re-ranked on the full log spectra
+
+        Returns:
+            tuple: distances, indices (..., k), sorted by distance
+        """
+        log_Rs = np.log(np.maximum(np.asarray(Rs, dtype=float), 1e-10))
+        ncand = min(k*oversample, len(self.ab))
+        _, cand = self.tree.query((log_Rs - self.mean) @ self.M.T, k=ncand)
+        cand = cand.reshape(log_Rs.shape[:-1] + (ncand,))
+        dist = np.sqrt(np.sum((self.log_Rs[cand] - log_Rs[..., None, :])**2,
+                              axis=-1))
+        order = np.argsort(dist, axis=-1)[..., :k]
+        return (np.take_along_axis(dist, order, axis=-1),
+                np.take_along_axis(cand, order, axis=-1))
+
+    def init_walkers(self, Rs:np.ndarray, nwalkers:int, k:int=8,
+                     scatter:float=0.1, seed=None):
+        """ Starting positions of MCMC walkers around the parameters of
+        the nearest library members of a spectrum
+
+        Each walker starts at one of the k neighbours, offset by a
+        Gaussian of scatter times the spread of the neighbours
+        (at least 1% of the spread of the library).
+
+        Args:
+            Rs (np.ndarray): Target spectrum (nwave)
+            nwalkers (int): Number of walkers
+            k (int, optional): Number of neighbours
+            scatter (float, optional): Scale of the offsets
+            seed (int, optional): Seed
+
+        Returns:
+            np.ndarray: p0 (nwalkers, nparam), e.g. for run_emcee_nn()
+        """
+        rstate = np.random.default_rng(seed)
+        _, idx = self.query(Rs, k=k)
+        neighbours = self.ab[idx]
+        spread = np.maximum(neighbours.std(axis=0), 0.01*self.ab_std)
+        centers = neighbours[np.arange(nwalkers) % len(neighbours)]
+        return centers + scatter*spread*rstate.normal(size=centers.shape)
+
+    def log_likelihood(self, Rs:np.ndarray, rel_sigma:float=0.05):
+        """ Gaussian log-likelihood of every library member for target
+        spectra, as in mcmc.log_prob with the library spectra as the
+        prediction
+
+        Expands sum((Rs_lib - Rs)^2 / (rel_sigma Rs)^2) into two
+        matrix products.
+
+        Args:
+            Rs (np.ndarray): Target spectra (nspec, nwave);  positive
+            rel_sigma (float, optional): Uncertainty, relative to Rs
+
+        Returns:
+            np.ndarray: log-likelihood (nspec, nlib)
+        """
+        inv_Rs = 1. / np.asarray(Rs, dtype=float)
+        chi2 = (inv_Rs**2) @ self.Rs_sq.T - 2*inv_Rs @ self.Rs.T \
+            + inv_Rs.shape[1]
+        return -0.5 * chi2 / rel_sigma**2
+
+    def importance_sample(self, Rs:np.ndarray, rel_sigma:float=0.05):
+        """ Posterior of ab for target spectra, with the library as
+        the samples of a prior
+
+        Args:
+            Rs (np.ndarray): Target spectra (nspec, nwave);  positive
+            rel_sigma (float, optional): Uncertainty, relative to Rs
+
+        Returns:
+            dict: weights (nspec, nlib), summing to 1;  mean (nspec, nparam)
+                and cov (nspec, nparam, nparam) of ab;  ess (nspec),
+                the effective sample size 1/sum(weights^2)
+        """
+        logL = self.log_likelihood(np.atleast_2d(Rs), rel_sigma=rel_sigma)
+        weights = np.exp(logL - logL.max(axis=1, keepdims=True))
+        weights /= weights.sum(axis=1, keepdims=True)
+
+        nparam = self.ab.shape[1]
+        mean = weights @ (self.ab - self.ab_mean)
+        cov = (weights @ self.ab_outer).reshape(-1, nparam, nparam) \
+            - mean[:, :, None]*mean[:, None, :]
+        return dict(weights=weights, mean=mean + self.ab_mean, cov=cov,
+                    ess=1. / np.sum(weights**2, axis=1))
+
+
+@functools.lru_cache(maxsize=None)
+def load_library(pca_file:str='pca_ab_33_Rrs.npz', back_scatt:str='bb',
+                 ncomp:int=8):
+    """ Library of the Loisel 2023 PCA file;  built once per process
+
+    Args:
+        pca_file (str, optional): PCA file
+        back_scatt (str, optional): Back-scattering PCA for ab
+        ncomp (int, optional): PCA components of log Rs for the tree
+
+    Returns:
+        Library:
+    """
+    ab, Rs, _ = remote_io.load_loisel_2023_pca(pca_file=pca_file,
+                                               back_scatt=back_scatt)
+    return Library(ab, Rs, ncomp=ncomp)
+
+def retrieve_ab(lib:Library, Rs:np.ndarray, rel_sigma:float=0.05,
+                chunk_size:int=1000, nn_model=None, ess_min:float=20.,
+                store_file:str=None, nwalkers:int=32, **mcmc_kwargs):
+    """ Retrieve ab of many spectra by importance sampling of the library,
+    falling back to MCMC where the effective sample size is low
+
+    The spectra run in chunks of (chunk_size, nlib) likelihood
+    matrices;  only the moments are kept.
+
+    Args:
+        lib (Library): e.g. from load_library()
+        Rs (np.ndarray): Spectra (nspec, nwave);  positive
+        rel_sigma (float, optional): Uncertainty, relative to Rs
+        chunk_size (int, optional): Spectra per chunk
+        nn_model (SimpleNet, optional): Emulator for MCMC of the spectra
+            with ess < ess_min.  Defaults to no MCMC
+        ess_min (float, optional): Lowest acceptable effective sample size
+        store_file (str, optional): Chain store for the MCMC samples,
+            keyed i{index}
+        nwalkers (int, optional): Walkers of the MCMC, started from the
+            nearest library members
+        **mcmc_kwargs: Passed to mcmc.run_emcee_nn().  Defaults to no
+            burn-in and check_every=500
+
+    Returns:
+        dict: mean (nspec, nparam) and cov (nspec, nparam, nparam) of ab,
+            ess (nspec), mcmc (nspec), True where MCMC was run, and
+            converged (nspec), True where the MCMC converged
+    """
+    Rs = np.atleast_2d(Rs)
+    nspec, nparam = len(Rs), lib.ab.shape[1]
+    mean = np.zeros((nspec, nparam))
+    cov = np.zeros((nspec, nparam, nparam))
+    ess = np.zeros(nspec)
+
+    with instrument.stage('remote.library.importance', items=nspec,
+                          nlib=len(lib.ab)):
+        for i0 in range(0, nspec, chunk_size):
+            post = lib.importance_sample(Rs[i0:i0+chunk_size],
+                                         rel_sigma=rel_sigma)
+            mean[i0:i0+chunk_size] = post['mean']
+            cov[i0:i0+chunk_size] = post['cov']
+            ess[i0:i0+chunk_size] = post['ess']
+
+    run_mcmc = np.zeros(nspec, dtype=bool)
+    is_converged = np.zeros(nspec, dtype=bool)
+    if nn_model is not None:
+        from oceancolor.remote import mcmc
+
+        run_mcmc = ess < ess_min
+        mcmc_kwargs.setdefault('nburn', 0)
+        mcmc_kwargs.setdefault('check_every', 500)
+        with instrument.stage('remote.library.mcmc',
+                              items=int(run_mcmc.sum())):
+            for idx in np.flatnonzero(run_mcmc):
+                p0 = lib.init_walkers(Rs[idx], nwalkers, seed=int(idx))
+                sampler = mcmc.run_emcee_nn(nn_model, Rs[idx],
+                                            nwalkers=nwalkers, p0=p0,
+                                            **mcmc_kwargs)
+                samples, info = mcmc.converged_samples(
+                    sampler, is_converged=sampler.converged,
+                    tau_factor=mcmc_kwargs.get('tau_factor', 50.))
+                is_converged[idx] = info['converged']
+                if store_file is not None:
+                    mcmc.write_chain(store_file, f'i{idx}', samples, **info)
+                mean[idx] = samples.mean(axis=0)
+                cov[idx] = np.cov(samples.T)
+
+    return dict(mean=mean, cov=cov, ess=ess, mcmc=run_mcmc,
+                converged=is_converged)
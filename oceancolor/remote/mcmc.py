@@ -1,19 +1,18 @@
 """ MCMC module for remote sensing """
 
 import os
+import warnings
 from importlib import resources
 
 import numpy as np
 
-import matplotlib.pyplot as plt
-
 import emcee
-import corner
 
 import torch
 
 from oceancolor.remote.nn import SimpleNet
 from oceancolor.remote import io as remote_io
+from oceancolor.utils import instrument
 
 
 def log_prob(ab, Rs, model, device):
@@ -24,15 +23,155 @@ def log_prob(ab, Rs, model, device):
     return -1*0.5 * np.sum( (pred-Rs)**2 / sig**2)
 
 
-def run_emcee_nn(nn_model, Rs, nwalkers:int=32, nsteps:int=20000,
-                 save_file:str=None):
+def converged(tau:np.ndarray, tau_old:np.ndarray, iteration:int,
+              tau_factor:float=50., tau_rtol:float=0.01):
+    """ Convergence of a chain from its integrated autocorrelation time
+
+    Args:
+        tau (np.ndarray): Autocorrelation time per parameter [steps]
+        tau_old (np.ndarray): At the previous check
+        iteration (int): Length of the chain
+        tau_factor (float, optional): Chain must be longer than
+            tau_factor * tau
+        tau_rtol (float, optional): and tau stable to this fraction
+
+    Returns:
+        bool:
+    """
+    if tau_old is None or not np.all(np.isfinite(tau)):
+        return False
+    return bool(np.all(tau_factor*tau < iteration)
+                and np.all(np.abs(tau_old - tau) < tau_rtol*tau))
+
+def converged_samples(sampler, discard:int=None, thin:int=None,
+                      is_converged:bool=None, tau_factor:float=50.):
+    """ Flat samples of a run with the burn-in discarded and thinned
+    by its autocorrelation time
+
+    Args:
+        sampler (emcee.EnsembleSampler or emcee.backends.Backend):
+            e.g. a full chain read with HDFBackend(read_only=True)
+        discard (int, optional): Steps to discard.  Defaults to 2 tau
+        thin (int, optional): Thinning.  Defaults to tau / 2
+        is_converged (bool, optional): Verdict of the run, e.g. of
+            converged() in run_emcee_nn().  Defaults to the chain being
+            longer than tau_factor * tau
+        tau_factor (float, optional): For the default verdict
+
+    Returns:
+        tuple: samples (nsample, ndim) float32, dict of tau, discard,
+            thin, nsteps, acceptance and converged
+    """
+    iteration = sampler.iteration
+    tau = np.nan_to_num(sampler.get_autocorr_time(tol=0), nan=1.)
+    if discard is None:
+        discard = min(int(2*np.max(tau)), iteration//2)
+    if thin is None:
+        thin = max(int(0.5*np.min(tau)), 1)
+    samples = sampler.get_chain(discard=discard, thin=thin, flat=True)
+    accepted = getattr(sampler, 'backend', sampler).accepted
+    if is_converged is None:
+        is_converged = bool(np.all(tau_factor*tau < iteration))
+    info = dict(tau=tau, discard=discard, thin=thin, nsteps=iteration,
+                acceptance=float(np.mean(accepted)/max(iteration, 1)),
+                converged=is_converged)
+    return samples.astype(np.float32), info
+
+def write_chain(store_file:str, key:str, samples:np.ndarray, **attrs):
+    """ Add the samples of one spectrum to a chain store
+
+    The store is an HDF5 file with one group per spectrum, holding
+    the samples as a float32, gzip-compressed, chunked dataset.
+    A key already in the store is overwritten.
+
+    Args:
+        store_file (str): HDF5 file;  created if needed
+        key (str): Name of the spectrum, e.g. 'i200'
+        samples (np.ndarray): Samples (nsample, ndim),
+            e.g. from converged_samples()
+        **attrs: Stored with the samples, e.g. tau, discard, thin
+    """
+    import h5py
+
+    samples = np.asarray(samples, dtype=np.float32)
+    with h5py.File(store_file, 'a') as f:
+        if key in f:
+            del f[key]
+        grp = f.create_group(key)
+        grp.create_dataset('samples', data=samples, compression='gzip',
+                           shuffle=True,
+                           chunks=(max(min(len(samples), 4096), 1),
+                                   samples.shape[1]))
+        for attr, value in attrs.items():
+            grp.attrs[attr] = value
+
+def read_chain(store_file:str, key:str):
+    """ Samples of one spectrum from a chain store
+
+    Args:
+        store_file (str): From write_chain()
+        key (str): Name of the spectrum
+
+    Returns:
+        tuple: samples (nsample, ndim) float32, dict of attributes
+    """
+    import h5py
+
+    with h5py.File(store_file, 'r') as f:
+        return f[key]['samples'][:], dict(f[key].attrs)
+
+def chain_keys(store_file:str):
+    """ Names of the spectra in a chain store """
+    import h5py
+
+    with h5py.File(store_file, 'r') as f:
+        return list(f.keys())
 
+def run_emcee_nn(nn_model, Rs, nwalkers:int=32, nsteps:int=20000,
+                 save_file:str=None, nburn:int=1000, p0:np.ndarray=None,
+                 check_every:int=None, min_steps:int=1000,
+                 tau_factor:float=50., tau_rtol:float=0.01,
+                 store_file:str=None, store_key:str=None):
+    """ Sample the PCA coefficients of a spectrum with emcee
+
+    Args:
+        nn_model (SimpleNet): ab -> Rs emulator
+        Rs (np.ndarray): Spectrum (nwave)
+        nwalkers (int, optional): Number of walkers
+        nsteps (int, optional): Number of steps after the burn-in;
+            the maximum if check_every is set
+        save_file (str, optional): HDF5 file of the full chains
+        nburn (int, optional): Burn-in steps;  0 skips it.  A start
+            from the library (p0) needs far fewer than a random one
+        p0 (np.ndarray, optional): Starting walkers (nwalkers, ndim),
+            e.g. from library.load_library().init_walkers(Rs, nwalkers).
+            Defaults to uniform on [0,1]
+        check_every (int, optional): Check the autocorrelation time
+            every this many steps and stop once converged();  warns
+            if nsteps are reached first.  Defaults to running all nsteps
+        min_steps (int, optional): Fewest steps when checking
+        tau_factor (float, optional): Passed to converged()
+        tau_rtol (float, optional): Passed to converged()
+        store_file (str, optional): Chain store for the samples of
+            converged_samples(), see write_chain()
+        store_key (str, optional): Their key in the store.
+            Required with store_file
+
+    Returns:
+        emcee.EnsembleSampler: Its converged attribute holds the verdict
+            of converged() when check_every is set, else None
+    """
     # Device for NN
     device = torch.device('cuda' if torch.cuda.is_available() else 'cpu')
 
     # Init
     ndim = nn_model.ninput
-    p0 = np.random.rand(nwalkers, ndim)
+    if p0 is None:
+        p0 = np.random.rand(nwalkers, ndim)
+    elif p0.shape != (nwalkers, ndim):
+        raise ValueError(f"p0 has shape {p0.shape}, not {(nwalkers, ndim)}")
+    if store_file is not None and store_key is None:
+        raise ValueError("store_key is required with store_file")
 
     # Set up the backend
     # Don't forget to clear it in case the file already exists
@@ -47,15 +186,46 @@ def run_emcee_nn(nn_model, Rs, nwalkers:int=32, nsteps:int=20000,
                                     backend=backend)
 
     # Burn in
-    print("Running burn-in")
-    state = sampler.run_mcmc(p0, 1000)
-    sampler.reset()
+    if nburn > 0:
+        print("Running burn-in")
+        with instrument.stage('remote.mcmc.burn_in', items=nwalkers*nburn):
+            state = sampler.run_mcmc(p0, nburn)
+        sampler.reset()
+    else:
+        state = p0
 
     # Run
     print("Running full model")
-    sampler.run_mcmc(state, nsteps)
-
-    print(f"All done: Wrote {save_file}")
+    with instrument.stage('remote.mcmc.run') as stage:
+        is_converged = None
+        if check_every is None:
+            sampler.run_mcmc(state, nsteps)
+        else:
+            tau_old, is_converged = None, False
+            for _ in sampler.sample(state, iterations=nsteps):
+                if sampler.iteration % check_every:
+                    continue
+                tau = sampler.get_autocorr_time(tol=0)
+                if sampler.iteration >= min_steps and converged(
+                        tau, tau_old, sampler.iteration,
+                        tau_factor=tau_factor, tau_rtol=tau_rtol):
+                    is_converged = True
+                    break
+                tau_old = tau
+            if not is_converged:
+                tau = np.max(sampler.get_autocorr_time(tol=0))
+                warnings.warn(f"MCMC did not converge in {nsteps} steps;"
+                              f" tau = {tau:.0f} steps")
+        stage.set(items=nwalkers*sampler.iteration, converged=is_converged)
+    sampler.converged = is_converged
+
+    if store_file is not None:
+        samples, info = converged_samples(sampler, is_converged=is_converged,
+                                          tau_factor=tau_factor)
+        write_chain(store_file, store_key, samples, **info)
+        print(f"Wrote {len(samples)} samples to {store_file}:{store_key}")
+    if save_file is not None:
+        print(f"All done: Wrote {save_file}")
 
     # Return
     return sampler
@@ -74,6 +244,12 @@ if __name__ == '__main__':
 
     # idx=200
     idx = 200
-    save_file = f'MCMC_NN_i{idx}.h5'
+    store_file = 'MCMC_NN_L23.h5'
+
+    # Start from the nearest library members, leaving out the target
+    from oceancolor.remote.library import Library
+    keep = np.arange(len(Rs)) != idx
+    p0 = Library(ab[keep], Rs[keep]).init_walkers(Rs[idx], 32)
 
-    run_emcee_nn(model, Rs[idx], save_file=save_file)
\ No newline at end of file
+    run_emcee_nn(model, Rs[idx], nburn=0, p0=p0, check_every=500,
+                 store_file=store_file, store_key=f'i{idx}')
\ No newline at end of file
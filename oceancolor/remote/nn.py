@@ -6,19 +6,27 @@ import numpy as np
 import torch
 import torch.nn as nn
 import torch.nn.functional as F
-from torch.utils.data import Dataset, DataLoader
+from torch.utils.data import Dataset
 import torch.optim as optim
 from torch.optim.lr_scheduler import StepLR
 
-from IPython import embed
+from oceancolor.remote import io as remote_io
+from oceancolor.utils import instrument
+
 
 # Erdong's Notebook
 #   https://github.com/AI-for-Ocean-Science/ulmo/blob/F_S/ulmo/fs_reg_dense/fs_dense_train.ipynb
 
 class MyDataset(Dataset):
+    """ Dataset held entirely as in-memory tensors
+
+    Indexing accepts an int, a slice or an index tensor so that
+    a full mini-batch is gathered in one go (TensorDataset-style)
+    instead of item by item.
+    """
     def __init__(self, data, targets, transform=None):
-        self.data = data
-        self.targets = targets
+        self.data = torch.as_tensor(data)
+        self.targets = torch.as_tensor(targets)
         self.transform = transform
         
     def __getitem__(self, index):
@@ -29,6 +37,109 @@ class MyDataset(Dataset):
     def __len__(self):
         return len(self.data)
 
+    def to(self, device):
+        """ Move the data and targets to a device (in place)
+
+        Args:
+            device (torch.device): Device
+
+        Returns:
+            MyDataset: self
+        """
+        self.data = self.data.to(device)
+        self.targets = self.targets.to(device)
+        return self
+
+    def split(self, valid_frac:float, seed:int=None):
+        """ Split off a random held-out set
+
+        Args:
+            valid_frac (float): Fraction of the items to hold out
+            seed (int, optional): Seed for the random permutation
+
+        Returns:
+            tuple: training MyDataset, validation MyDataset
+        """
+        gen = torch.Generator()
+        if seed is not None:
+            gen.manual_seed(seed)
+        perm = torch.randperm(len(self), generator=gen).to(self.data.device)
+        nvalid = int(np.round(valid_frac * len(self)))
+        valid, train = perm[:nvalid], perm[nvalid:]
+        return (MyDataset(self.data[train], self.targets[train]),
+                MyDataset(self.data[valid], self.targets[valid]))
+
+
+class TensorLoader:
+    """ Iterate over mini-batches of a MyDataset by tensor slicing
+
+    A drop-in for the torch DataLoader when the whole dataset
+    already sits in memory:  each batch is a single gather on
+    an index tensor, so there are no per-item calls, no worker
+    processes and no collation.
+
+    Args:
+        dataset (MyDataset): Dataset to serve
+        batch_size (int, optional): Number of items per batch
+        shuffle (bool, optional): Reshuffle at every pass
+    """
+    def __init__(self, dataset:MyDataset, batch_size:int=64, 
+                 shuffle:bool=True):
+        self.dataset = dataset
+        self.batch_size = batch_size
+        self.shuffle = shuffle
+
+    def __iter__(self):
+        nitems = len(self.dataset)
+        device = self.dataset.data.device
+        if self.shuffle:
+            order = torch.randperm(nitems, device=device)
+        else:
+            order = torch.arange(nitems, device=device)
+        for i0 in range(0, nitems, self.batch_size):
+            yield self.dataset[order[i0:i0+self.batch_size]]
+
+    def __len__(self):
+        return (len(self.dataset) + self.batch_size - 1) // self.batch_size
+
+class ChunkLoader:
+    """ Iterate over mini-batches of a stream of (ab, Rs) chunks
+
+    For training sets that do not fit in memory, e.g. synthetic
+    shards on disk.  Each chunk is normalized with the parameters
+    of the model, moved to the device and served in shuffled 
+    mini-batches.  Every pass calls chunk_source() anew.
+
+    Args:
+        chunk_source (callable): Returns an iterable of
+            (ab, Rs) np.ndarray chunks
+        ab_parm (tuple): mean, std of ab for the normalization
+        Rs_parm (tuple): mean, std of Rs for the normalization
+        batch_size (int, optional): Number of items per batch
+        shuffle (bool, optional): Shuffle within each chunk
+        device (torch.device, optional): Device for the batches.
+            Defaults to cpu;  perform_training() moves them to its device
+    """
+    def __init__(self, chunk_source, ab_parm:tuple, Rs_parm:tuple,
+                 batch_size:int=64, shuffle:bool=True, 
+                 device:torch.device=None):
+        self.chunk_source = chunk_source
+        self.ab_parm = ab_parm
+        self.Rs_parm = Rs_parm
+        self.batch_size = batch_size
+        self.shuffle = shuffle
+        self.device = torch.device('cpu') if device is None else device
+
+    def __iter__(self):
+        for ab, Rs in self.chunk_source():
+            chunk = MyDataset(
+                ((ab - self.ab_parm[0])/self.ab_parm[1]).astype(np.float32),
+                ((Rs - self.Rs_parm[0])/self.Rs_parm[1]).astype(np.float32)
+                ).to(self.device)
+            yield from TensorLoader(chunk, self.batch_size, 
+                                    shuffle=self.shuffle)
+
+
 class SimpleNet(nn.Module):
     def __init__(self, ninput:int, noutput:int,
                  nhidden1:int, nhidden2:int,
@@ -81,7 +192,7 @@ class SimpleNet(nn.Module):
 
         self.eval()
         with torch.no_grad():
-            batch_features = tensor.view(-1, 6).to(device)
+            batch_features = tensor.view(-1, self.ninput).to(device)
             outputs = self(batch_features)
 
         outputs.cpu()
@@ -102,70 +213,227 @@ def preprocess_data(data):
 
     return data.astype(np.float32), mean, std
 
-def perform_training(model, dataset, ishape:int, train_kwargs, lr,
-                     nepochs:int=100):
+def evaluate_loss(model, dataset:MyDataset, ishape:int, 
+                  batch_size:int=4096):
+    """ Mean MSE loss of a model over a dataset
+
+    Args:
+        model (torch.nn.Module): Model
+        dataset (MyDataset): Dataset (on the model device)
+        ishape (int): Number of input features
+        batch_size (int, optional): Batch size for the evaluation
+
+    Returns:
+        float: loss
+    """
+    criterion = nn.MSELoss(reduction='sum')
+    model.eval()
+    loss = 0.
+    with torch.no_grad():
+        for batch_features, targets in TensorLoader(dataset, batch_size, 
+                                                    shuffle=False):
+            outputs = model(batch_features.view(-1, ishape))
+            loss += criterion(outputs, targets).item()
+    model.train()
+    # Mean over elements, as in nn.MSELoss()
+    return loss / dataset.targets.numel()
 
-    device = torch.device('cuda' if torch.cuda.is_available() else 'cpu')
+def perform_training(model, dataset, ishape:int, train_kwargs, lr,
+                     nepochs:int=100, valid_dataset:MyDataset=None,
+                     patience:int=None, checkpoint_file:str=None,
+                     checkpoint_every:int=100, resume:bool=False,
+                     scheduler_kwargs:dict=None, print_every:int=100,
+                     device:torch.device=None):
+    """ Train a model
+
+    Batches are served straight from in-memory tensors held on the
+    training device.  Optionally, the loss on a held-out set is
+    tracked for early stopping, the learning rate is stepped down
+    with StepLR, and the state is checkpointed so a run can resume.
+
+    Args:
+        model (torch.nn.Module): Model to train (on the device)
+        dataset (MyDataset or ChunkLoader): Training set, or a loader
+            streaming normalized batches on the device
+        ishape (int): Number of input features
+        train_kwargs (dict): Loader keywords, e.g. batch_size, shuffle
+        lr (float): Learning rate
+        nepochs (int, optional): Maximum number of epochs
+        valid_dataset (MyDataset, optional): Held-out set
+        patience (int, optional): Stop after this many epochs without
+            improvement of the validation loss.  Requires valid_dataset.
+            The best weights are restored at the end.
+        checkpoint_file (str, optional): File for periodic checkpoints
+        checkpoint_every (int, optional): Epochs between checkpoints
+        resume (bool, optional): Resume from checkpoint_file, if it exists
+        scheduler_kwargs (dict, optional): Keywords for StepLR, 
+            e.g. dict(step_size=1000, gamma=0.5)
+        print_every (int, optional): Epochs between progress reports
+        device (torch.device, optional): Training device.  Defaults
+            to cuda if available, else cpu
+
+    Returns:
+        tuple: last epoch (int), training loss (float), optimizer
+    """
+    if patience is not None and valid_dataset is None:
+        raise ValueError("Early stopping requires a valid_dataset")
+
+    if device is None:
+        device = torch.device('cuda' if torch.cuda.is_available() else 'cpu')
 
     optimizer = optim.Adadelta(model.parameters(), lr=lr)
+    scheduler = StepLR(optimizer, **scheduler_kwargs) \
+        if scheduler_kwargs is not None else None
     criterion = nn.MSELoss()
-    train_loader = DataLoader(dataset, **train_kwargs)
-
-    for epoch in range(nepochs):
-        loss = 0
-        for batch_features, targets in train_loader:
-
-            # load it to the active device
-            batch_features = batch_features.view(-1, ishape).to(device)
 
+    # Move the data once
+    if isinstance(dataset, MyDataset):
+        dataset.to(device)
+        train_loader = TensorLoader(dataset, **train_kwargs)
+    else:
+        # A loader that streams batches, e.g. ChunkLoader
+        train_loader = dataset
+    if valid_dataset is not None:
+        valid_dataset.to(device)
+
+    # Resume?
+    start_epoch, loss = 0, np.nan
+    best_loss, best_state, nbad = np.inf, None, 0
+    if resume and checkpoint_file is not None and os.path.isfile(checkpoint_file):
+        checkpoint = torch.load(checkpoint_file, map_location=device,
+                                weights_only=False)
+        model.load_state_dict(checkpoint['model_state_dict'])
+        optimizer.load_state_dict(checkpoint['optimizer_state_dict'])
+        if scheduler is not None and checkpoint['scheduler_state_dict'] is not None:
+            scheduler.load_state_dict(checkpoint['scheduler_state_dict'])
+        start_epoch = checkpoint['epoch'] + 1
+        best_loss = checkpoint['best_loss']
+        best_state = checkpoint['best_state_dict']
+        nbad = checkpoint['nbad']
+        loss = checkpoint['loss']
+        print(f"Resuming from {checkpoint_file} at epoch {start_epoch}")
+
+    epoch = start_epoch - 1
+    model.train()
+    for epoch in range(start_epoch, nepochs):
+        with instrument.stage('remote.nn.epoch', epoch=epoch+1) as stage:
+            loss, nbatch, nsample = 0, 0, 0
+            for batch_features, targets in train_loader:
+
+                # load it to the active device;  streamed batches may
+                #  arrive on another one
+                batch_features = batch_features.view(-1, ishape).to(device)
+                targets = targets.to(device)
             
-            # reset the gradients back to zero
-            # PyTorch accumulates gradients on subsequent backward passes
-            optimizer.zero_grad()
+                # reset the gradients back to zero
+                # PyTorch accumulates gradients on subsequent backward passes
+                optimizer.zero_grad()
             
-            # compute reconstructions
-            outputs = model(batch_features)
+                # compute reconstructions
+                outputs = model(batch_features)
             
-            # compute training loss
-            train_loss = criterion(outputs, targets)
+                # compute training loss
+                train_loss = criterion(outputs, targets)
             
-            # compute accumulated gradients
-            train_loss.backward()
+                # compute accumulated gradients
+                train_loss.backward()
             
-            # perform parameter update based on current gradients
-            optimizer.step()
+                # perform parameter update based on current gradients
+                optimizer.step()
             
-            # add the mini-batch training loss to epoch loss
-            loss += train_loss.item()
+                # add the mini-batch training loss to epoch loss
+                loss += train_loss.item()
+                nbatch += 1
+                nsample += batch_features.shape[0]
         
-        # compute the epoch training loss
-        loss = loss / len(train_loader)
+            # compute the epoch training loss
+            loss = loss / nbatch
+            stage.set(items=nsample, loss=loss)
+
+        if scheduler is not None:
+            scheduler.step()
+
+        # Validation
+        stop = False
+        if valid_dataset is not None:
+            valid_loss = evaluate_loss(model, valid_dataset, ishape)
+            if valid_loss < best_loss:
+                best_loss = valid_loss
+                best_state = {key: val.detach().clone() 
+                              for key, val in model.state_dict().items()}
+                nbad = 0
+            else:
+                nbad += 1
+            stop = patience is not None and nbad >= patience
         
         # display the epoch training loss
-        print("epoch : {}/{}, loss = {:.6f}".format(epoch + 1, nepochs, loss))
+        if (epoch + 1) % print_every == 0 or stop or epoch == nepochs-1:
+            msg = "epoch : {}/{}, loss = {:.6f}".format(epoch + 1, nepochs, loss)
+            if valid_dataset is not None:
+                msg += ", valid = {:.6f}".format(valid_loss)
+            print(msg)
+
+        # Checkpoint
+        if checkpoint_file is not None and (
+            (epoch + 1) % checkpoint_every == 0 or stop or epoch == nepochs-1):
+            torch.save({
+                'epoch': epoch,
+                'model_state_dict': model.state_dict(),
+                'optimizer_state_dict': optimizer.state_dict(),
+                'scheduler_state_dict': scheduler.state_dict() 
+                    if scheduler is not None else None,
+                'loss': loss,
+                'best_loss': best_loss,
+                'best_state_dict': best_state,
+                'nbad': nbad,
+                }, checkpoint_file)
+
+        if stop:
+            print(f"Early stopping at epoch {epoch+1}; best valid = {best_loss:.6f}")
+            break
+
+    # Keep the best model
+    if patience is not None and best_state is not None:
+        model.load_state_dict(best_state)
 
     # Return
     return epoch, loss, optimizer
 
 def build_quick_nn_l23(nepochs:int,
                        root:str='model',
-                       back_scatt:str='bb'):
+                       back_scatt:str='bb',
+                       nbatch:int=64,
+                       lr:float=1e-3,
+                       valid_frac:float=None,
+                       patience:int=None,
+                       resume:bool=False,
+                       checkpoint_file:str=None,
+                       checkpoint_every:int=100,
+                       scheduler_kwargs:dict=None):
+    """ Train the quick NN emulator of Rs on the Loisel 2023 PCA
+
+    Args:
+        nepochs (int): Maximum number of epochs
+        root (str, optional): Root of the output files
+        back_scatt (str, optional): Back-scattering PCA to use
+        nbatch (int, optional): Batch size
+        lr (float, optional): Learning rate
+        valid_frac (float, optional): Fraction held out for validation.
+            Defaults to 0.1 with patience, else to training on everything
+        patience (int, optional): Early-stopping patience in epochs
+        resume (bool, optional): Resume from the checkpoint file, if it exists
+        checkpoint_file (str, optional): File for periodic checkpoints.
+            Defaults to none, or to {root}_ckpt.pt with resume
+        checkpoint_every (int, optional): Epochs between checkpoints
+        scheduler_kwargs (dict, optional): Keywords for StepLR
+    """
 
     # ##############################
     # Quick NN on L23
 
     # Load up data
-    l23_path = os.path.join(os.getenv('OS_COLOR'),
-                            'data', 'Loisel2023')
-    outfile = os.path.join(l23_path, 'pca_ab_33_Rrs.npz')
-
-    d = np.load(outfile)
-    nparam = d['a'].shape[1]+d[back_scatt].shape[1]
-    ab = np.zeros((d['a'].shape[0], nparam))
-    ab[:,0:d['a'].shape[1]] = d['a']
-    ab[:,d['a'].shape[1]:] = d[back_scatt]
-
-    target = d['Rs']
+    ab, target, _ = remote_io.load_loisel_2023_pca(back_scatt=back_scatt)
+    nparam = ab.shape[1]
 
     # Preprocess
     pre_ab, mean_ab, std_ab = preprocess_data(ab)
@@ -173,6 +441,12 @@ def build_quick_nn_l23(nepochs:int,
 
     # Dataset
     dataset = MyDataset(pre_ab, pre_targ)
+    if valid_frac is None:
+        valid_frac = 0.1 if patience is not None else 0.
+    if valid_frac > 0.:
+        dataset, valid_dataset = dataset.split(valid_frac, seed=1234)
+    else:
+        valid_dataset = None
 
     # Model
     device = torch.device('cuda' if torch.cuda.is_available() else 'cpu')
@@ -185,12 +459,16 @@ def build_quick_nn_l23(nepochs:int,
                       (mean_ab, std_ab),
                       (mean_targ, std_targ),
                       ).to(device)
-    nbatch = 64
     train_kwargs = {'batch_size': nbatch}
 
-    lr = 1e-3
-    epoch, loss, optimizer = perform_training(model, dataset, nparam, 
-                     train_kwargs, lr, nepochs=nepochs)
+    if checkpoint_file is None and resume:
+        checkpoint_file = f'{root}_ckpt.pt'
+    epoch, loss, optimizer = perform_training(
+        model, dataset, nparam, train_kwargs, lr, nepochs=nepochs,
+        valid_dataset=valid_dataset, patience=patience,
+        checkpoint_file=checkpoint_file,
+        checkpoint_every=checkpoint_every, resume=resume,
+        scheduler_kwargs=scheduler_kwargs)
 
 
     # Save
@@ -210,7 +488,7 @@ if __name__ == '__main__':
 
     # Train
     build_quick_nn_l23(100, root='model_100')
-    build_quick_nn_l23(20000, root='model_20000')
+    build_quick_nn_l23(20000, root='model_20000', patience=500)
 
     # Test loading and prediction
     test = False
@@ -218,4 +496,4 @@ if __name__ == '__main__':
         model = torch.load('model_100.pth')
         device = torch.device('cuda' if torch.cuda.is_available() else 'cpu')
         tmp = model.prediction(np.array([0.1, 0.2, 0.3, 0.4, 0.5, 0.6]), device)
-        embed(header='215 of nn')
\ No newline at end of file
+        print(tmp)
\ No newline at end of file
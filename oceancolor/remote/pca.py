@@ -3,18 +3,30 @@
 import os
 import numpy as np
 
-from sklearn import decomposition
-
-from matplotlib import pyplot as plt
-
 import xarray
 
+from oceancolor.remote import io as remote_io
+
 def reconstruct(pca_fit, vec):
     Y = pca_fit.transform(vec)
     recon = np.dot(Y, pca_fit.components_)
     # Return
     return recon[0] # Flatten
 
+def reconstruct_from_coeffs(coeffs:np.ndarray, M:np.ndarray, 
+                            mean:np.ndarray):
+    """ Reconstruct spectra from PCA coefficients
+
+    Args:
+        coeffs (np.ndarray): Coefficients (..., ncomp)
+        M (np.ndarray): Components (ncomp, nwave)
+        mean (np.ndarray): Mean spectrum (nwave)
+
+    Returns:
+        np.ndarray: Spectra (..., nwave)
+    """
+    return np.matmul(coeffs, M) + mean
+
 def l23_hydrolight(X:int, Y:int, Na:int, Nb:int, Nbb:int,
                    save_outputs:str=None, chk_idx:int=None):
     """_summary_
@@ -40,6 +52,8 @@ def l23_hydrolight(X:int, Y:int, Na:int, Nb:int, Nbb:int,
                                  f'Hydrolight{X}{Y:02d}.nc')
     ds = xarray.load_dataset(variable_file)
 
+    from sklearn import decomposition
+
     # Fit
     pca_fit_a = decomposition.PCA(n_components=Na).fit(ds.a.data)
     pca_fit_b = decomposition.PCA(n_components=Nb).fit(ds.b.data)
@@ -66,6 +80,7 @@ def l23_hydrolight(X:int, Y:int, Na:int, Nb:int, Nbb:int,
         print(f'Wrote: {save_outputs}')
 
     if chk_idx is not None:
+        from matplotlib import pyplot as plt
         d_l23 = np.load(save_outputs)
         plt.clf()
         ax = plt.gca()
@@ -82,8 +97,157 @@ def l23_hydrolight(X:int, Y:int, Na:int, Nb:int, Nbb:int,
     return pca_fit_a, pca_fit_b
 
 
+def hydrolight_files(XY:list, l23_path:str=None):
+    """ Paths to a set of Loisel 2023 Hydrolight files
+
+    Args:
+        XY (list): list of (X, Y) tuples, e.g. [(4,0), (4,30)]
+        l23_path (str, optional): Folder of the files.
+            Defaults to $OS_COLOR/data/Loisel2023
+
+    Returns:
+        list: list of str
+    """
+    return [remote_io.hydrolight_file(X, Y, l23_path=l23_path)
+            for X, Y in XY]
+
+def iter_hydrolight_chunks(files:list, variable:str, 
+                           chunk_size:int=1000):
+    """ Iterate over rows of a variable in one or more Hydrolight files
+
+    Each file is opened lazily and only chunk_size rows are 
+    read at a time.
+
+    Args:
+        files (list): list of Hydrolight files
+        variable (str): Variable, e.g. a, bb, Rrs
+        chunk_size (int, optional): Number of rows per chunk
+
+    Yields:
+        np.ndarray: (nrow, nwave) chunk
+    """
+    for ifile in files:
+        with xarray.open_dataset(ifile, cache=False) as ds:
+            nrow = ds[variable].shape[0]
+            for i0 in range(0, nrow, chunk_size):
+                yield ds[variable][i0:i0+chunk_size].values.astype(np.float64)
+
+def fit_streaming_pca(files:list, variable:str, ncomp:int,
+                      chunk_size:int=1000, method:str='covariance'):
+    """ Fit a PCA to a variable over one or more Hydrolight files,
+    one chunk at a time
+
+    The 'covariance' method accumulates the mean and scatter matrix
+    (nwave x nwave) with the pairwise update of Chan et al. and
+    diagonalizes it at the end, i.e. it is exact.  The 'incremental'
+    method uses sklearn's IncrementalPCA.  Components follow the 
+    sign convention of sklearn's PCA.
+
+    Args:
+        files (list): list of Hydrolight files
+        variable (str): Variable, e.g. a, b, bb
+        ncomp (int): Number of components
+        chunk_size (int, optional): Number of rows per chunk
+        method (str, optional): 'covariance' or 'incremental'
+
+    Returns:
+        tuple: components (ncomp, nwave), mean (nwave), 
+            explained variance (ncomp)
+    """
+    if method == 'incremental':
+        from sklearn import decomposition
+        ipca = decomposition.IncrementalPCA(n_components=ncomp)
+        for chunk in iter_hydrolight_chunks(files, variable, chunk_size):
+            ipca.partial_fit(chunk)
+        components = ipca.components_
+        mean = ipca.mean_
+        variance = ipca.explained_variance_
+    elif method == 'covariance':
+        ntot, mean, scatter = 0, None, None
+        for chunk in iter_hydrolight_chunks(files, variable, chunk_size):
+            n_b = chunk.shape[0]
+            mean_b = chunk.mean(axis=0)
+            cen = chunk - mean_b
+            scatter_b = cen.T @ cen
+            if mean is None:
+                ntot, mean, scatter = n_b, mean_b, scatter_b
+                continue
+            # Merge
+            delta = mean_b - mean
+            nnew = ntot + n_b
+            scatter += scatter_b + np.outer(delta, delta) * ntot * n_b / nnew
+            mean = mean + delta * n_b / nnew
+            ntot = nnew
+        # Diagonalize;  eigh returns ascending eigenvalues
+        evals, evecs = np.linalg.eigh(scatter / (ntot - 1))
+        order = np.argsort(evals)[::-1][:ncomp]
+        components = evecs[:, order].T
+        variance = evals[order]
+        # Sign convention of sklearn
+        max_abs = np.argmax(np.abs(components), axis=1)
+        signs = np.sign(components[np.arange(ncomp), max_abs])
+        components *= signs[:, None]
+    else:
+        raise ValueError(f"Bad method: {method}")
+
+    return components, mean, variance
+
+def l23_hydrolight_streaming(XY:list, Na:int, Nb:int, Nbb:int,
+                             save_outputs:str=None, chunk_size:int=1000,
+                             method:str='covariance', l23_path:str=None):
+    """ Fit the a, b, bb PCAs over one or more Hydrolight files
+    without loading them into memory
+
+    Same outputs as l23_hydrolight(), but the files are read in chunks
+    and several (X, Y) files may be fit jointly.  The coefficients and Rs
+    are concatenated in the order of XY.
+
+    Args:
+        XY (list): list of (X, Y) tuples, e.g. [(4,0)]
+        Na (int): Number of components for a
+        Nb (int): Number of components for b
+        Nbb (int): Number of components for bb
+        save_outputs (str, optional): npz file to write
+        chunk_size (int, optional): Number of rows per chunk
+        method (str, optional): 'covariance' or 'incremental'
+        l23_path (str, optional): Folder of the Hydrolight files
+
+    Returns:
+        dict: Same items as in the npz file
+    """
+    files = hydrolight_files(XY, l23_path=l23_path)
+
+    outputs = {}
+    for key, ncomp in zip(['a', 'b', 'bb'], [Na, Nb, Nbb]):
+        components, mean, _ = fit_streaming_pca(
+            files, key, ncomp, chunk_size=chunk_size, method=method)
+        # Project, chunk by chunk
+        coeffs = [np.dot(chunk - mean, components.T)
+            for chunk in iter_hydrolight_chunks(files, key, chunk_size)]
+        outputs[key] = np.concatenate(coeffs)
+        outputs[f'{key}_M3'] = components
+        outputs[f'{key}_mean'] = mean
+
+    # Rs
+    outputs['Rs'] = np.concatenate(
+        [chunk.astype(np.float32) for chunk in 
+         iter_hydrolight_chunks(files, 'Rrs', chunk_size)])
+
+    # Save?
+    if save_outputs:
+        np.savez(save_outputs, **outputs)
+        print(f'Wrote: {save_outputs}')
+
+    # All done
+    return outputs
+
+
 if __name__ == '__main__':
     l23_path = os.path.join(os.getenv('OS_COLOR'),
                             'data', 'Loisel2023')
     outfile = os.path.join(l23_path, 'pca_ab_33_Rrs.npz')
-    l23_hydrolight(4, 0, 3, 3, 3, save_outputs=outfile, chk_idx=200)
\ No newline at end of file
+    l23_hydrolight(4, 0, 3, 3, 3, save_outputs=outfile, chk_idx=200)
+
+    # Streamed, jointly over several files
+    #l23_hydrolight_streaming([(4,0), (4,30), (4,60)], 3, 3, 3,
+    #                         save_outputs=outfile)
\ No newline at end of file
@@ -0,0 +1,120 @@
+""" Summaries of MCMC posteriors of PCA coefficients """
+
+import numpy as np
+
+import xarray
+
+
+def coeff_moments(chains:np.ndarray):
+    """ Mean and covariance of the coefficients of a batch of chains
+
+    Args:
+        chains (np.ndarray): Flat chains (nspec, nsamples, ncoeff)
+
+    Returns:
+        tuple: mean (nspec, ncoeff), covariance (nspec, ncoeff, ncoeff)
+    """
+    mean = chains.mean(axis=1)
+    cen = chains - mean[:, None, :]
+    cov = np.einsum('nsi,nsj->nij', cen, cen) / chains.shape[1]
+    return mean, cov
+
+def spectral_quantiles(chain:np.ndarray, M:np.ndarray,
+                       mean:np.ndarray, quantiles:np.ndarray,
+                       chunk_size:int=16):
+    """ Quantiles of the spectra reconstructed from one chain
+
+    Quantiles are not linear in the coefficients, so the
+    spectra are reconstructed, but only chunk_size wavelengths
+    at a time.
+
+    Args:
+        chain (np.ndarray): Flat chain (nsamples, ncoeff)
+        M (np.ndarray): Components (ncoeff, nwave)
+        mean (np.ndarray): Mean spectrum (nwave)
+        quantiles (np.ndarray): Quantiles, e.g. [0.16, 0.5, 0.84]
+        chunk_size (int, optional): Wavelengths per chunk
+
+    Returns:
+        np.ndarray: (nquantile, nwave)
+    """
+    nwave = M.shape[1]
+    output = np.zeros((len(quantiles), nwave))
+    for i0 in range(0, nwave, chunk_size):
+        recon = np.dot(chain, M[:, i0:i0+chunk_size]) + mean[i0:i0+chunk_size]
+        output[:, i0:i0+chunk_size] = np.quantile(recon, quantiles, axis=0)
+    return output
+
+def summarize_spectra(chains:np.ndarray, M:np.ndarray, mean:np.ndarray,
+                      wave:np.ndarray=None, quantiles:tuple=(0.16, 0.5, 0.84),
+                      chunk_size:int=16):
+    """ Posterior summary of spectra reconstructed from PCA chains
+
+    The mean and standard deviation follow from the mean and
+    covariance of the coefficients, as the reconstruction is linear:
+    mean = <c> M + mu and var = diag(M^T Cov(c) M).  Quantiles are
+    computed in chunks of wavelength.  No (nsamples, nwave) array
+    is built for the full spectrum.
+
+    Args:
+        chains (np.ndarray): Flat chain (nsamples, ncoeff) or
+            batch of chains (nspec, nsamples, ncoeff)
+        M (np.ndarray): Components (ncoeff, nwave)
+        mean (np.ndarray): Mean spectrum (nwave)
+        wave (np.ndarray, optional): Wavelengths (nwave)
+        quantiles (tuple, optional): Quantiles to compute.
+            Set to None to skip them
+        chunk_size (int, optional): Wavelengths per chunk for the quantiles
+
+    Returns:
+        xarray.Dataset: mean, std and quantiles on
+            (spectrum, Lambda[, quantile])
+    """
+    if chains.ndim == 2:
+        chains = chains[None]
+    if wave is None:
+        wave = np.arange(M.shape[1])
+
+    c_mean, c_cov = coeff_moments(chains)
+    s_mean = np.dot(c_mean, M) + mean
+    s_var = np.einsum('il,nij,jl->nl', M, c_cov, M)
+    s_std = np.sqrt(np.maximum(s_var, 0.))
+
+    data_vars = dict(mean=(('spectrum', 'Lambda'), s_mean),
+                     std=(('spectrum', 'Lambda'), s_std))
+    coords = dict(Lambda=wave, spectrum=np.arange(chains.shape[0]))
+
+    if quantiles is not None:
+        quantiles = np.asarray(quantiles)
+        s_q = np.stack([spectral_quantiles(chain, M, mean, quantiles,
+                                           chunk_size=chunk_size)
+                        for chain in chains])
+        data_vars['quantiles'] = (('spectrum', 'quantile', 'Lambda'), s_q)
+        coords['quantile'] = quantiles
+
+    return xarray.Dataset(data_vars, coords=coords)
+
+def summarize_ab(chains:np.ndarray, d_l23:dict, wave:np.ndarray=None,
+                 back_scatt:str='bb', **kwargs):
+    """ Posterior summary of a and bb from chains of the Loisel 2023
+    PCA coefficients, as sampled by run_emcee_nn()
+
+    Args:
+        chains (np.ndarray): Flat chain (nsamples, ncoeff) or
+            batch of chains (nspec, nsamples, ncoeff)
+        d_l23 (dict): PCA file items, e.g. from load_loisel_2023_pca()
+        wave (np.ndarray, optional): Wavelengths (nwave)
+        back_scatt (str, optional): Back-scattering PCA
+        **kwargs: Passed to summarize_spectra()
+
+    Returns:
+        xarray.Dataset: a_mean, a_std, a_quantiles, bb_mean, ...
+    """
+    na = d_l23['a_M3'].shape[0]
+    ds_a = summarize_spectra(chains[..., :na], d_l23['a_M3'],
+                             d_l23['a_mean'], wave=wave, **kwargs)
+    ds_b = summarize_spectra(chains[..., na:], d_l23[f'{back_scatt}_M3'],
+                             d_l23[f'{back_scatt}_mean'], wave=wave, **kwargs)
+    return xarray.merge([
+        ds_a.rename({key: f'a_{key}' for key in ds_a.data_vars}),
+        ds_b.rename({key: f'{back_scatt}_{key}' for key in ds_b.data_vars})])
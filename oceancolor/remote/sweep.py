@@ -0,0 +1,245 @@
+""" Hyper-parameter sweeps of the NN emulator of Rs """
+
+import os
+import time
+import itertools
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+import pandas
+
+import torch
+
+from oceancolor.remote import nn as remote_nn
+from oceancolor.remote import io as remote_io
+
+# Training data of a sweep worker;  filled by _init_worker()
+_worker_data = {}
+
+
+def build_configs(nhidden1:tuple=(16, 32, 64, 128),
+                  nhidden2:tuple=(16, 32, 64, 128),
+                  nbatch:tuple=(64,), lr:tuple=(1e-3,)):
+    """ Build the grid of SimpleNet configurations to sweep
+
+    Args:
+        nhidden1 (tuple, optional): Sizes of the first hidden layer
+        nhidden2 (tuple, optional): Sizes of the second hidden layer
+        nbatch (tuple, optional): Batch sizes
+        lr (tuple, optional): Learning rates
+
+    Returns:
+        list: list of dict, one per configuration
+    """
+    return [dict(nhidden1=n1, nhidden2=n2, nbatch=nb, lr=ilr)
+            for n1, n2, nb, ilr in itertools.product(
+                nhidden1, nhidden2, nbatch, lr)]
+
+
+def count_parameters(model):
+    """ Number of trainable parameters of a model
+
+    Args:
+        model (torch.nn.Module): Model
+
+    Returns:
+        int: number of parameters
+    """
+    return sum(p.numel() for p in model.parameters() if p.requires_grad)
+
+
+def time_inference(model, nsample:int=1, nrepeat:int=200):
+    """ Time SimpleNet.prediction() on the CPU
+
+    Args:
+        model (SimpleNet): Model
+        nsample (int, optional): Number of spectra per call
+        nrepeat (int, optional): Number of calls to average over
+
+    Returns:
+        float: seconds per call
+    """
+    device = torch.device('cpu')
+    sample = np.outer(np.ones(nsample), model.ab_parm[0])
+    # Warm up
+    model.prediction(sample, device)
+    t0 = time.perf_counter()
+    for _ in range(nrepeat):
+        model.prediction(sample, device)
+    return (time.perf_counter() - t0) / nrepeat
+
+
+def _init_worker(ab:np.ndarray, Rs:np.ndarray, nthreads:int,
+                 valid_frac:float, seed:int):
+    # Pin the worker to a few threads so workers do not compete
+    torch.set_num_threads(nthreads)
+    try:
+        torch.set_num_interop_threads(nthreads)
+    except RuntimeError:
+        pass
+    _worker_data.update(dict(ab=ab, Rs=Rs, valid_frac=valid_frac,
+                             seed=seed))
+
+
+def train_config(config:dict, nepochs:int, patience:int=None,
+                 outdir:str=None):
+    """ Train and score one SimpleNet configuration in a sweep worker
+
+    Args:
+        config (dict): nhidden1, nhidden2, nbatch, lr
+        nepochs (int): Maximum number of epochs
+        patience (int, optional): Early-stopping patience
+        outdir (str, optional): If provided, write the model here
+
+    Returns:
+        tuple: config plus the scores of the trained model (dict),
+            the model
+    """
+    ab, Rs = _worker_data['ab'], _worker_data['Rs']
+    device = torch.device('cpu')
+
+    # Preprocess and split;  same split for every configuration
+    pre_ab, mean_ab, std_ab = remote_nn.preprocess_data(ab)
+    pre_Rs, mean_Rs, std_Rs = remote_nn.preprocess_data(Rs)
+    dataset = remote_nn.MyDataset(pre_ab, pre_Rs)
+    train, valid = dataset.split(_worker_data['valid_frac'],
+                                 seed=_worker_data['seed'])
+
+    model = remote_nn.SimpleNet(ab.shape[1], Rs.shape[1],
+                                config['nhidden1'], config['nhidden2'],
+                                (mean_ab, std_ab), (mean_Rs, std_Rs))
+
+    t0 = time.perf_counter()
+    epoch, loss, _ = remote_nn.perform_training(
+        model, train, ab.shape[1], {'batch_size': config['nbatch']},
+        config['lr'], nepochs=nepochs, valid_dataset=valid,
+        patience=patience, print_every=nepochs+1, device=device)
+    train_time = time.perf_counter() - t0
+
+    # Score on the held-out set, in Rs units
+    valid_loss = remote_nn.evaluate_loss(model, valid, ab.shape[1])
+    valid_ab = valid.data.numpy() * std_ab + mean_ab
+    valid_Rs = valid.targets.numpy() * std_Rs + mean_Rs
+    pred = model.prediction(valid_ab, device).reshape(valid_Rs.shape)
+    rel_err = np.sqrt(np.mean(((pred - valid_Rs) / valid_Rs)**2, axis=1))
+
+    result = config.copy()
+    result.update(dict(
+        nparam=count_parameters(model),
+        nepochs=epoch+1,
+        train_loss=loss,
+        valid_loss=valid_loss,
+        valid_rel_err=float(np.median(rel_err)),
+        train_time=train_time,
+        ))
+
+    # Save?
+    if outdir is not None:
+        model_file = os.path.join(
+            outdir, 'model_h{nhidden1}_h{nhidden2}_b{nbatch}_lr{lr:g}.pth'.format(
+                **config))
+        torch.save(model, model_file)
+        result['model_file'] = model_file
+
+    return result, model
+
+
+def run_sweep(ab:np.ndarray, Rs:np.ndarray, configs:list, nepochs:int,
+              patience:int=None, nworkers:int=None, nthreads:int=1,
+              valid_frac:float=0.1, seed:int=1234, outdir:str=None,
+              results_file:str=None):
+    """ Train a set of SimpleNet configurations in a pool of CPU workers
+
+    Args:
+        ab (np.ndarray): Input PCA coefficients (nspec, nparam)
+        Rs (np.ndarray): Target Rs (nspec, nwave)
+        configs (list): list of dict, e.g. from build_configs()
+        nepochs (int): Maximum number of epochs
+        patience (int, optional): Early-stopping patience
+        nworkers (int, optional): Number of worker processes.
+            Defaults to the number of CPUs divided by nthreads
+        nthreads (int, optional): Torch threads per worker
+        valid_frac (float, optional): Fraction held out for scoring
+        seed (int, optional): Seed for the train/validation split
+        outdir (str, optional): Write the models here
+        results_file (str, optional): Write the results table here
+            (.parquet or .csv)
+
+    Returns:
+        pandas.DataFrame: one row per configuration
+    """
+    if nworkers is None:
+        nworkers = max(1, (os.cpu_count() or 1) // nthreads)
+
+    # Spawn to keep the workers clear of the parent's torch threads
+    ctx = multiprocessing.get_context('spawn')
+    with ProcessPoolExecutor(max_workers=nworkers, mp_context=ctx,
+                             initializer=_init_worker,
+                             initargs=(ab, Rs, nthreads, valid_frac, seed)
+                             ) as executor:
+        futures = [executor.submit(train_config, config, nepochs,
+                                   patience, outdir)
+                   for config in configs]
+        trained = [future.result() for future in futures]
+
+    # Time the models one at a time, clear of the training
+    results = []
+    for result, model in trained:
+        result['latency_1'] = time_inference(model, nsample=1)
+        result['latency_1000'] = time_inference(model, nsample=1000,
+                                                nrepeat=20)
+        results.append(result)
+        print("nhidden1={nhidden1}, nhidden2={nhidden2}, nbatch={nbatch}, "
+              "lr={lr:g}: valid_loss={valid_loss:.5f}, "
+              "latency={latency_1:.2e}s".format(**result))
+
+    results = pandas.DataFrame(results)
+
+    # Save?
+    if results_file is not None:
+        if results_file.endswith('.csv'):
+            results.to_csv(results_file, index=False)
+        else:
+            results.to_parquet(results_file)
+        print(f"Wrote: {results_file}")
+
+    return results
+
+
+def pick_model(results:pandas.DataFrame, max_error:float,
+               metric:str='valid_rel_err', latency:str='latency_1'):
+    """ Pick the fastest model that meets an accuracy target
+
+    Ties in latency are broken by the number of parameters.
+
+    Args:
+        results (pandas.DataFrame): Output of run_sweep()
+        max_error (float): Maximum allowed value of metric
+        metric (str, optional): Accuracy column, e.g. valid_rel_err
+            or valid_loss
+        latency (str, optional): Latency column to minimize
+
+    Returns:
+        pandas.Series: row of the chosen model
+
+    Raises:
+        ValueError: if no model meets the target
+    """
+    ok = results[results[metric] <= max_error]
+    if len(ok) == 0:
+        raise ValueError(
+            f"No model has {metric} <= {max_error};  best is {results[metric].min()}")
+    return ok.sort_values([latency, 'nparam']).iloc[0]
+
+
+if __name__ == '__main__':
+
+    # Load Hydrolight
+    ab, Rs, _ = remote_io.load_loisel_2023_pca()
+
+    results = run_sweep(ab, Rs, build_configs(), nepochs=5000,
+                        patience=200, nthreads=2,
+                        results_file='sweep_l23.parquet')
+    # Within 1% of Rs
+    print(pick_model(results, 0.01))
@@ -0,0 +1,205 @@
+""" Synthetic (ab, Rs) training sets from particle mixtures and
+the forward LS2 relations """
+
+import os
+import glob
+import collections
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+
+from oceancolor import mixture
+from oceancolor import water
+from oceancolor.ls2 import io as ls2_io
+from oceancolor.ls2 import forward
+
+# log10 ranges of the concentrations [particles per m^3]
+default_log_conc = {
+    'detritus': (13.5, 16.),
+    'minerals': (10., 13.5),
+    'bubbles': (3., 6.5),
+}
+
+# Hydrolight wavelengths of Loisel 2023 [nm]
+l23_wave = np.arange(350., 755., 5.)
+
+
+def sample_scenarios(nscen:int, rstate:np.random.Generator,
+                     log_conc:dict=None, sza_range:tuple=(0., 60.)):
+    """ Draw concentrations (log-uniform) and solar zenith angles
+
+    Args:
+        nscen (int): Number of scenarios
+        rstate (np.random.Generator): Random state
+        log_conc (dict, optional): log10 range of the concentration
+            of each component [particles per m^3]
+        sza_range (tuple, optional): Range of solar zenith angles [deg]
+
+    Returns:
+        tuple: concentrations (nscen, ncomponent) in the order of
+            log_conc, sza (nscen)
+    """
+    if log_conc is None:
+        log_conc = default_log_conc
+    lo = np.array([rng[0] for rng in log_conc.values()])
+    hi = np.array([rng[1] for rng in log_conc.values()])
+    conc = 10**rstate.uniform(lo, hi, size=(nscen, lo.size))
+    sza = rstate.uniform(*sza_range, size=nscen)
+    return conc, sza
+
+def project(spec:np.ndarray, M:np.ndarray, mean:np.ndarray):
+    """ PCA coefficients of spectra for an orthonormal basis
+
+    Args:
+        spec (np.ndarray): Spectra (N, nwave)
+        M (np.ndarray): Components (ncomp, nwave)
+        mean (np.ndarray): Mean spectrum (nwave)
+
+    Returns:
+        np.ndarray: coefficients (N, ncomp)
+    """
+    return np.dot(spec - mean, M.T)
+
+def generate_chunk(nscen:int, seed, pca_bases:dict, wave:np.ndarray=None,
+                   log_conc:dict=None, sza_range:tuple=(0., 60.),
+                   back_scatt:str='bb'):
+    """ Generate one chunk of synthetic (ab, Rs) pairs
+
+    IOPs follow from a ParticleMixture, Rs from the forward LS2
+    relations.  Scenarios outside of the LS2 LUT are dropped.
+
+    Args:
+        nscen (int): Number of scenarios to draw
+        seed (int or np.random.SeedSequence): Seed
+        pca_bases (dict): a_M3, a_mean, bb_M3, bb_mean on wave,
+            e.g. from load_loisel_2023_pca()
+        wave (np.ndarray, optional): Wavelengths [nm].
+            Defaults to those of Loisel 2023
+        log_conc (dict, optional): log10 range of the concentrations
+        sza_range (tuple, optional): Range of solar zenith angles [deg]
+        back_scatt (str, optional): Back-scattering PCA
+
+    Returns:
+        tuple: ab (N, ncoeff), Rs (N, nwave), with N <= nscen
+    """
+    if wave is None:
+        wave = l23_wave
+    if log_conc is None:
+        log_conc = default_log_conc
+    rstate = np.random.default_rng(seed)
+
+    conc, sza = sample_scenarios(nscen, rstate, log_conc=log_conc,
+                                 sza_range=sza_range)
+    mix = mixture.ParticleMixture(wave, components=tuple(log_conc.keys()))
+    a, b, bb = mix.iops(conc)
+
+    # Forward model
+    _, bw, _ = water.water_iops(wave)
+    Rs, _ = forward.LS2_forward(sza[:, None], a, bb, b, bw,
+                                ls2_io.load_LUT())
+    keep = np.all(np.isfinite(Rs), axis=1)
+
+    # Project
+    ab = np.concatenate([
+        project(a[keep], pca_bases['a_M3'], pca_bases['a_mean']),
+        project(bb[keep], pca_bases[f'{back_scatt}_M3'],
+                pca_bases[f'{back_scatt}_mean'])], axis=1)
+
+    return ab, Rs[keep]
+
+def _generate(args):
+    return generate_chunk(*args[0], **args[1])
+
+def iter_chunks(nchunks:int, chunk_size:int, pca_bases:dict, seed:int=None,
+                nworkers:int=None, **kwargs):
+    """ Generate chunks of synthetic (ab, Rs) in a pool of processes
+
+    Chunks are yielded in order, with at most 2 nworkers of them
+    submitted ahead of the consumer, so the memory does not grow with
+    nchunks.  Each chunk has its own child seed, so the output does not
+    depend on nworkers.
+
+    Args:
+        nchunks (int): Number of chunks
+        chunk_size (int): Scenarios drawn per chunk
+        pca_bases (dict): a_M3, a_mean, bb_M3, bb_mean
+        seed (int, optional): Seed
+        nworkers (int, optional): Number of processes.
+            Defaults to the number of CPUs;  1 runs in process
+        **kwargs: Passed to generate_chunk()
+
+    Yields:
+        tuple: ab (N, ncoeff), Rs (N, nwave)
+    """
+    # Keep only the arrays needed by the workers
+    pca_bases = {key: np.asarray(pca_bases[key]) for key in pca_bases
+                 if key.endswith('_M3') or key.endswith('_mean')}
+    seeds = np.random.SeedSequence(seed).spawn(nchunks)
+    tasks = [((chunk_size, iseed, pca_bases), kwargs) for iseed in seeds]
+
+    if nworkers == 1:
+        for task in tasks:
+            yield _generate(task)
+        return
+
+    ctx = multiprocessing.get_context('spawn')
+    with ProcessPoolExecutor(max_workers=nworkers, mp_context=ctx) as executor:
+        window = 2*(nworkers or os.cpu_count() or 1)
+        pending = collections.deque()
+        for task in tasks:
+            if len(pending) == window:
+                yield pending.popleft().result()
+            pending.append(executor.submit(_generate, task))
+        while pending:
+            yield pending.popleft().result()
+
+def write_shards(outdir:str, nchunks:int, chunk_size:int, pca_bases:dict,
+                 seed:int=None, nworkers:int=None, **kwargs):
+    """ Write a synthetic training set as npz shards, one per chunk
+
+    Args:
+        outdir (str): Output folder
+        nchunks (int): Number of shards
+        chunk_size (int): Scenarios drawn per shard
+        pca_bases (dict): a_M3, a_mean, bb_M3, bb_mean
+        seed (int, optional): Seed
+        nworkers (int, optional): Number of processes
+        **kwargs: Passed to generate_chunk()
+
+    Returns:
+        list: shard files
+    """
+    os.makedirs(outdir, exist_ok=True)
+    files = []
+    for ss, (ab, Rs) in enumerate(iter_chunks(
+            nchunks, chunk_size, pca_bases, seed=seed,
+            nworkers=nworkers, **kwargs)):
+        outfile = os.path.join(outdir, f'synth_{ss:05d}.npz')
+        np.savez(outfile, ab=ab, Rs=Rs.astype(np.float32))
+        files.append(outfile)
+    print(f"Wrote {len(files)} shards to {outdir}")
+    return files
+
+def shard_source(outdir:str):
+    """ Chunk source for nn.ChunkLoader reading the shards of a folder
+
+    Args:
+        outdir (str): Folder of the shards
+
+    Returns:
+        callable: returns a generator of (ab, Rs)
+    """
+    files = sorted(glob.glob(os.path.join(outdir, 'synth_*.npz')))
+    def source():
+        for ifile in files:
+            with np.load(ifile) as d:
+                yield d['ab'], d['Rs']
+    return source
+
+
+if __name__ == '__main__':
+    from oceancolor.remote import io as remote_io
+
+    _, _, d_l23 = remote_io.load_loisel_2023_pca()
+    write_shards('synth_l23', 100, 100000, d_l23, seed=1234)
@@ -0,0 +1,7 @@
+from oceancolor import lazy_submodules
+
+__getattr__, __dir__ = lazy_submodules(__name__, (
+    'embedding', 'explore', 'ingest', 'io', 'measures', 'spectra',
+    'synthetic'))
+
+del lazy_submodules
@@ -0,0 +1,217 @@
+""" UMAP embeddings of Tara spectra:  fit once, transform many """
+
+import os
+import pickle
+
+import numpy as np
+import pandas
+
+from oceancolor.utils import instrument
+
+
+def fit_umap(spectra:np.ndarray, nfit:int=None, seed:int=42,
+             **umap_kwargs):
+    """ Fit UMAP on a random subsample of the spectra
+
+    Args:
+        spectra (np.ndarray): Spectra (nspec, nwave)
+        nfit (int, optional): Size of the subsample.
+            Defaults to all of the spectra
+        seed (int, optional): Seed for the subsample and UMAP
+        **umap_kwargs: Passed to umap.UMAP()
+
+    Returns:
+        tuple: fitted umap.UMAP, indices of the fitted spectra (nfit)
+    """
+    import umap
+
+    rstate = np.random.default_rng(seed)
+    if nfit is None or nfit >= len(spectra):
+        fit_idx = np.arange(len(spectra))
+    else:
+        fit_idx = np.sort(rstate.choice(len(spectra), size=nfit, replace=False))
+
+    reducer = umap.UMAP(random_state=seed, **umap_kwargs)
+    reducer.fit(spectra[fit_idx])
+
+    return reducer, fit_idx
+
+def fit_parametric(spectra:np.ndarray, embedding:np.ndarray,
+                   hidden_layer_sizes:tuple=(64, 64), seed:int=42,
+                   **mlp_kwargs):
+    """ Fit a neural network that approximates a UMAP embedding
+
+    Much faster than UMAP.transform() for large sets of new spectra
+
+    Args:
+        spectra (np.ndarray): Spectra of the fit (nfit, nwave)
+        embedding (np.ndarray): Their embedding, e.g. reducer.embedding_
+            (nfit, ncomp)
+        hidden_layer_sizes (tuple, optional): Hidden layers of the MLP
+        seed (int, optional): Seed
+        **mlp_kwargs: Passed to sklearn's MLPRegressor
+
+    Returns:
+        sklearn.pipeline.Pipeline: model with a predict() method
+    """
+    from sklearn.neural_network import MLPRegressor
+    from sklearn.pipeline import make_pipeline
+    from sklearn.preprocessing import StandardScaler
+
+    mlp_kwargs.setdefault('max_iter', 1000)
+    model = make_pipeline(
+        StandardScaler(),
+        MLPRegressor(hidden_layer_sizes=hidden_layer_sizes, random_state=seed,
+                     **mlp_kwargs))
+    model.fit(spectra, embedding)
+    return model
+
+def _n_components(model):
+    # Width of the embedding of a UMAP or a (pipeline ending in a) regressor
+    if hasattr(model, 'embedding_'):
+        return model.embedding_.shape[1]
+    if hasattr(model, 'steps'):
+        model = model[-1]
+    return model.n_outputs_
+
+def project(model, spectra:np.ndarray, batch_size:int=10000):
+    """ Project spectra through a fitted UMAP or its parametric
+    approximation, in batches
+
+    Args:
+        model (umap.UMAP or sklearn estimator): from fit_umap()
+            or fit_parametric()
+        spectra (np.ndarray): Spectra (nspec, nwave)
+        batch_size (int, optional): Spectra per batch
+
+    Returns:
+        np.ndarray: embedding (nspec, ncomp)
+    """
+    func = model.transform if hasattr(model, 'embedding_') else model.predict
+    if len(spectra) == 0:
+        return np.zeros((0, _n_components(model)))
+    return np.concatenate([func(spectra[i0:i0+batch_size])
+                           for i0 in range(0, len(spectra), batch_size)])
+
+def embed_spectra(model, spectra:np.ndarray, reducer=None,
+                  fit_idx:np.ndarray=None, batch_size:int=10000):
+    """ Embedding of a set of spectra, reusing the embedding of the
+    spectra that UMAP was fit on
+
+    Args:
+        model (umap.UMAP or sklearn estimator): Model for the other spectra
+        spectra (np.ndarray): Spectra (nspec, nwave)
+        reducer (umap.UMAP, optional): Fitted UMAP whose embedding_
+            holds the fitted spectra.  Defaults to model, if a UMAP
+        fit_idx (np.ndarray, optional): Indices in spectra of the
+            fitted spectra, from fit_umap()
+        batch_size (int, optional): Spectra per batch
+
+    Returns:
+        np.ndarray: embedding (nspec, ncomp)
+    """
+    if reducer is None and hasattr(model, 'embedding_'):
+        reducer = model
+    if fit_idx is None or reducer is None:
+        return project(model, spectra, batch_size=batch_size)
+
+    embedding = np.zeros((len(spectra), reducer.embedding_.shape[1]),
+                         dtype=reducer.embedding_.dtype)
+    embedding[fit_idx] = reducer.embedding_
+    new = np.ones(len(spectra), dtype=bool)
+    new[fit_idx] = False
+    embedding[new] = project(model, spectra[new], batch_size=batch_size)
+    return embedding
+
+def umap_table(tara_ids, embedding:np.ndarray):
+    """ UMAP table in the schema of load_tara_umap()
+
+    Args:
+        tara_ids (np.ndarray): Index of the spectra in the Tara database
+        embedding (np.ndarray): Embedding (nspec, 2)
+
+    Returns:
+        pandas.DataFrame: tara_id, U0, U1
+    """
+    umap_tbl = pandas.DataFrame()
+    umap_tbl['tara_id'] = np.asarray(tara_ids)
+    umap_tbl['U0'] = embedding[:,0]
+    umap_tbl['U1'] = embedding[:,1]
+    return umap_tbl
+
+def save_model(model, outfile:str):
+    """ Pickle a fitted UMAP or parametric model """
+    with open(outfile, 'wb') as f:
+        pickle.dump(model, f)
+    print(f"Saved model to {outfile}")
+
+def load_model(infile:str):
+    """ Load a model written by save_model() """
+    with open(infile, 'rb') as f:
+        return pickle.load(f)
+
+def extend_umap_table(umap_tbl:pandas.DataFrame, model, spectra:np.ndarray,
+                      tara_ids, batch_size:int=10000):
+    """ Add new spectra, e.g. of a new cruise, to a UMAP table
+    without refitting
+
+    Spectra already in the table are skipped.
+
+    Args:
+        umap_tbl (pandas.DataFrame): Table with tara_id, U0, U1
+        model (umap.UMAP or sklearn estimator): Saved model
+        spectra (np.ndarray): Spectra (nspec, nwave), processed as
+            for the fit
+        tara_ids (np.ndarray): Their index in the Tara database
+        batch_size (int, optional): Spectra per batch
+
+    Returns:
+        pandas.DataFrame: extended table
+    """
+    tara_ids = np.asarray(tara_ids)
+    new = ~np.isin(tara_ids, umap_tbl.tara_id.values)
+    embedding = project(model, spectra[new], batch_size=batch_size)
+    return pandas.concat([umap_tbl, umap_table(tara_ids[new], embedding)],
+                         ignore_index=True)
+
+def run_embedding(outfile:str, spectra:np.ndarray, tara_ids,
+                  nfit:int=None, model_file:str=None,
+                  parametric:bool=False, seed:int=42, **umap_kwargs):
+    """ Fit UMAP once on a subsample, embed all of the spectra and write
+    the table
+
+    Args:
+        outfile (str): UMAP table (parquet)
+        spectra (np.ndarray): Spectra (nspec, nwave)
+        tara_ids (np.ndarray): Their index in the Tara database
+        nfit (int, optional): Spectra for the fit;  defaults to all
+        model_file (str, optional): Pickle the UMAP (and parametric
+            model, as {root}_nn.pkl) here
+        parametric (bool, optional): Embed the spectra outside of the
+            fit with a parametric approximation
+        seed (int, optional): Seed
+        **umap_kwargs: Passed to umap.UMAP()
+
+    Returns:
+        pandas.DataFrame: UMAP table
+    """
+    with instrument.stage('tara.embedding.fit') as stage:
+        reducer, fit_idx = fit_umap(spectra, nfit=nfit, seed=seed,
+                                    **umap_kwargs)
+        model = fit_parametric(spectra[fit_idx], reducer.embedding_,
+                               seed=seed) if parametric else reducer
+        stage.set(items=len(fit_idx))
+
+    with instrument.stage('tara.embedding.embed', items=len(spectra)):
+        embedding = embed_spectra(model, spectra, reducer=reducer,
+                                  fit_idx=fit_idx)
+
+    if model_file is not None:
+        save_model(reducer, model_file)
+        if parametric:
+            save_model(model, os.path.splitext(model_file)[0]+'_nn.pkl')
+
+    umap_tbl = umap_table(tara_ids, embedding)
+    umap_tbl.to_parquet(outfile)
+    print(f"Wrote UMAP table to {outfile}")
+    return umap_tbl
@@ -1,18 +1,13 @@
 """ Methods to explore the Tara Oceans dataset, typically data driven"""
 
 import numpy as np
-import warnings
 
 from oceancolor.tara import io 
 from oceancolor.tara import  spectra
+from oceancolor.utils import instrument
 
-try:
-    import sequencer
-except ImportError:
-    warnings.warn("sequencer not installed.  Some functions will not work.")
-else:
-    from sequencer import sequencer_
 
+@instrument.timed('tara.prep_spectra')
 def prep_spectra(wv_grid:np.ndarray=None, min_sn:float=1.,
                  process:dict=None):
 
@@ -20,10 +15,13 @@ def prep_spectra(wv_grid:np.ndarray=None, min_sn:float=1.,
         wv_grid = np.arange(402.5, 707.5, 5.) # nm
 
     # Load the data
-    tara_db = io.load_tara_db()
+    with instrument.stage('tara.load_tara_db') as stage:
+        tara_db = io.load_tara_db()
+        stage.set(items=len(tara_db))
 
     # Process to common wavelengths
-    wv_nm, all_a_ph, all_a_ph_sig = spectra.spectra_from_table(tara_db)
+    with instrument.stage('tara.spectra_from_table', items=len(tara_db)):
+        wv_nm, all_a_ph, all_a_ph_sig = spectra.spectra_from_table(tara_db)
     rwv_nm, r_aph, r_sig = spectra.rebin_to_grid(wv_nm, all_a_ph, all_a_ph_sig, wv_grid) 
 
     # Cull bad spectra
@@ -63,6 +61,7 @@ def prep_spectra(wv_grid:np.ndarray=None, min_sn:float=1.,
 def run_sequencer(waves:np.ndarray, aph:np.ndarray, 
                   output_path:str,
                   estimator_list:list=None):
+    import sequencer
 
     # Init
     if estimator_list is None:
@@ -2,7 +2,7 @@
 
 import os
 import glob
-from pkg_resources import resource_filename
+from importlib import resources
 import warnings
 
 #import numpy as np
@@ -12,15 +12,12 @@ import warnings
 import pandas
 
 from oceancolor.tara import io
+from oceancolor.utils import instrument
 
 # HARD CODED FOR INGESTION ONLY
 tara_path = '/home/xavier/Projects/Oceanography/Color/data/Tara'
 drop_columns = ['date', 'time', 'lat', 'lon', 'Wt', 'sal']
 
-from IPython import embed
-
-warnings.warn('ADD in META!')
-
 def read_one_file(ofile:str, skip_sig:bool=False):
     """ Read one file from the Tara database
 
@@ -75,7 +72,7 @@ def read_one_file(ofile:str, skip_sig:bool=False):
                            delimiter=' ', index_col=False)
     elif os.path.basename(ofile) == 'Tara_ACS_apcp2011_351ap.txt':
         ex_file = os.path.join(
-            resource_filename('oceancolor', 'data'),
+            resources.files('oceancolor'), 'data',
             'Tara', '682bc9fe5b_Tara_ACS_apcp2011_351ap.sb')
         df_sig, _ = read_one_file(ex_file, skip_sig=True)
         # Fuss!
@@ -93,7 +90,6 @@ def read_one_file(ofile:str, skip_sig:bool=False):
         df_sig[''] = 0.
     else:
         warnings.warn(f"No uncertainty file for {ofile}")
-        embed(header='ingest 84')
         df_sig = None
 
     # Add datetime
@@ -181,7 +177,9 @@ def load_all():
     for cruise in cruises:
         print(f"Loading {cruise}...")
         # ap
-        df = load_cruise(cruise)
+        with instrument.stage('tara.ingest.load_cruise', cruise=cruise) as stage:
+            df = load_cruise(cruise)
+            stage.set(items=0 if df is None else len(df))
         if df is None:
             continue
         # Append
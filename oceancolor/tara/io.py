@@ -1,13 +1,11 @@
 """ Methods for I/O on Tara Oceans data. """
 import os
 
-from pkg_resources import resource_filename
+from importlib import resources
 import pandas
 
-from IPython import embed
-
-db_name = os.path.join(resource_filename(
-        'oceancolor', 'data'), 'Tara', 'Tara_APCP.parquet')
+db_name = os.path.join(resources.files(
+        'oceancolor'), 'data', 'Tara', 'Tara_APCP.parquet')
 
 def load_tara_db():
     """ Load the Tara Oceans database. 
@@ -3,13 +3,8 @@
 import numpy as np
 import pandas
 
-from matplotlib import pyplot as plt
-import seaborn as sns
-
 from oceancolor.tara import spectra
 
-from IPython import embed
-
 def chla_boss13(tara_tbl:pandas.DataFrame, debug:bool=False):
 
     # ap_676
@@ -33,9 +28,10 @@ def chla_boss13(tara_tbl:pandas.DataFrame, debug:bool=False):
     tara_tbl['Chla'] = Chla
 
     if debug:
+        from matplotlib import pyplot as plt
+        import seaborn as sns
         sns.histplot(np.maximum(Chla,1e-3), bins=100, log_scale=True)
         plt.show()
-        embed(header='35 of measures.py')
 
     # Return
     return
@@ -2,9 +2,8 @@
 
 import numpy as np
 import pandas
-from scipy.interpolate import interp1d
 
-from IPython import embed
+from oceancolor.utils import instrument
 
 def parse_wavelengths(inp, flavor:str='ap'):
     """ Parse wavelengths from a row/table of the Tara Oceans database. 
@@ -44,8 +43,8 @@ def spectbl_from_keys(tbl:pandas.DataFrame, keys:np.ndarray):
     for key in keys:
         for ilist, ikey in zip([values,err_vals], 
                                [key, 'sig_'+key]):
-            # Slurp
-            val = tbl[ikey].values
+            # Slurp;  a copy, to leave the table as is
+            val = tbl[ikey].to_numpy(dtype=float, copy=True)
             # Masked?
             val[np.isclose(val, -9999.)] = np.nan
             ilist.append(val)
@@ -203,6 +202,8 @@ def interpolate_to_grid(wv_nm:np.ndarray, values:np.ndarray,
     Returns:
         tuple: values, error [np.ndarray, np.ndarray]
     """
+    from scipy.interpolate import interp1d
+
     # Interpolate
     f_values = interp1d(wv_nm, values, 
         bounds_error=False, fill_value=np.nan)
@@ -216,6 +217,8 @@ def interpolate_to_grid(wv_nm:np.ndarray, values:np.ndarray,
     # Return
     return new_values, new_err
 
+@instrument.timed('tara.rebin_to_grid',
+                  items=lambda wv_nm, values, *args, **kwargs: values.shape[1])
 def rebin_to_grid(wv_nm:np.ndarray, values:np.ndarray, 
                   err_vals:np.ndarray, wv_grid:np.ndarray):
     """ Rebin spectra to a new wavelength grid.
@@ -0,0 +1,258 @@
+""" Synthetic Tara Oceans database, in the schema of Tara_APCP.parquet,
+for scaling tests and benchmarks """
+
+import os
+from importlib import resources
+
+import numpy as np
+import pandas
+
+# One-minute binned ACS file of the Tara database, for its wavelengths
+acs_file = os.path.join(resources.files('oceancolor'), 'data', 'Tara',
+                        '682bc9fe5b_Tara_ACS_apcp2011_351ap.sb')
+
+# Start of the first cruise
+start_date = np.datetime64('2009-09-05T00:00:00')
+
+# Gaussian bands of phytoplankton absorption:  center, width [nm],
+#  relative amplitude
+ph_bands = np.array([
+    [435., 19., 1.], [465., 15., 0.35], [490., 17., 0.25],
+    [532., 13., 0.06], [583., 12., 0.05], [623., 11., 0.08],
+    [676., 10., 0.55]])
+
+
+def acs_wavelengths(sb_file:str=None):
+    """ Wavelengths of the ACS channels of the Tara database
+
+    Args:
+        sb_file (str, optional): SeaBASS file.  Defaults to acs_file
+
+    Returns:
+        tuple: wavelengths [nm] (np.ndarray), as in the column names (list)
+    """
+    if sb_file is None:
+        sb_file = acs_file
+    with open(sb_file) as f:
+        for line in f:
+            if line.startswith('/fields='):
+                fields = line.strip().split('=')[1].split(',')
+                break
+    labels = [field[2:] for field in fields
+              if field.startswith('ap') and not field.endswith('_sd')]
+    return np.array([float(label) for label in labels]), labels
+
+def phyto_shape(wave:np.ndarray, chla:np.ndarray):
+    """ a_ph per unit a_ph(676) from Gaussian bands
+
+    The blue bands grow relative to the red peak at low chlorophyll
+    (package effect).
+
+    Args:
+        wave (np.ndarray): Wavelengths [nm] (nwave)
+        chla (np.ndarray): Chlorophyll-a [mg/m^3] (N)
+
+    Returns:
+        np.ndarray: shape (N, nwave)
+    """
+    gauss = np.exp(-0.5*((wave[None,:] - ph_bands[:,0:1])/ph_bands[:,1:2])**2)
+    # Blue bands scale with chlorophyll
+    blue = (ph_bands[:,0] < 600.)
+    scale = np.where(blue[None,:], 1.6*np.asarray(chla)[:,None]**-0.15, 1.)
+    shape = (scale * ph_bands[:,2]) @ gauss
+    i676 = np.argmin(np.abs(wave - 676.))
+    return shape / shape[:, i676:i676+1]
+
+def sample_cruises(ncruise:int, seed):
+    """ Track, water properties and optical character of each cruise
+
+    Args:
+        ncruise (int): Number of cruises
+        seed (int or np.random.SeedSequence): Seed
+
+    Returns:
+        dict: arrays (ncruise) of the cruise parameters
+    """
+    rstate = np.random.default_rng(seed)
+    return dict(
+        name=np.array([f'SYN-{ii:03d}' for ii in range(ncruise)]),
+        # Start and heading;  ~10 knots
+        lat0=rstate.uniform(-60., 60., ncruise),
+        lon0=rstate.uniform(-180., 180., ncruise),
+        dlat=rstate.normal(0., 0.002, ncruise),
+        dlon=rstate.normal(0., 0.002, ncruise),
+        start=start_date + (30*np.arange(ncruise)).astype('timedelta64[D]'),
+        Wt=rstate.uniform(2., 29., ncruise),
+        sal=rstate.uniform(32., 37.5, ncruise),
+        # log10 Chla [mg/m^3]
+        log_chla=rstate.normal(-0.7, 0.45, ncruise),
+        # Non-algal absorption:  fraction of a_ph(440) and slope [1/nm]
+        nap_frac=rstate.uniform(0.1, 0.6, ncruise),
+        S_nap=rstate.uniform(0.009, 0.013, ncruise),
+        # Particulate scattering slope
+        gamma=rstate.uniform(0.3, 1.5, ncruise),
+        # Cruises without the reddest channels (NaN)
+        no_red=rstate.random(ncruise) < 0.25,
+    )
+
+def generate_chunk(row0:int, nrow:int, cruises:dict, rows_per_cruise:int,
+                   seed, sentinel_frac:float=1e-3, dropout_frac:float=5e-3):
+    """ Rows [row0, row0+nrow) of a synthetic Tara database
+
+    a_p is a_ph (Gaussian bands, scaled to match the Chla estimator
+    of measures.chla_boss13) plus an exponential non-algal term.
+    c_p adds a power law b_p, scaled with Chla, to a_p.
+
+    Args:
+        row0 (int): First row
+        nrow (int): Number of rows
+        cruises (dict): From sample_cruises()
+        rows_per_cruise (int): Rows of each cruise;  one row per minute
+        seed (int or np.random.SeedSequence): Seed of the chunk
+        sentinel_frac (float, optional): Fraction of values
+            set to -9999
+        dropout_frac (float, optional): Fraction of rows with all of
+            the spectra set to -9999
+
+    Returns:
+        pandas.DataFrame: chunk, with the columns of Tara_APCP.parquet
+    """
+    rstate = np.random.default_rng(seed)
+    wave, labels = acs_wavelengths()
+    nwave = wave.size
+
+    rows = np.arange(row0, row0+nrow)
+    icruise = rows // rows_per_cruise
+    minute = rows - icruise*rows_per_cruise
+    cruise = {key: value[icruise] for key, value in cruises.items()}
+
+    # Metadata
+    dt = cruise['start'] + minute.astype('timedelta64[m]')
+    lat = np.clip(cruise['lat0'] + cruise['dlat']*minute, -75., 80.)
+    lon = (cruise['lon0'] + cruise['dlon']*minute + 180.) % 360. - 180.
+    Wt = cruise['Wt'] + 0.5*np.sin(2*np.pi*minute/1440.) \
+        + rstate.normal(0., 0.05, nrow)
+    sal = cruise['sal'] + rstate.normal(0., 0.02, nrow)
+
+    # Chla varies along the track
+    log_chla = cruise['log_chla'] + 0.3*np.sin(2*np.pi*minute/7200. + icruise) \
+        + rstate.normal(0., 0.1, nrow)
+    chla = 10**log_chla
+
+    # a_p
+    aph676 = (chla/157.)**(1/1.22)
+    aph = aph676[:,None] * phyto_shape(wave, chla)
+    aph440 = aph[:, np.argmin(np.abs(wave-440.))]
+    anap = (cruise['nap_frac']*aph440)[:,None] * np.exp(
+        -cruise['S_nap'][:,None]*(wave[None,:] - 440.))
+    ap = aph + anap
+    sig_ap = 0.001 + 0.05*ap
+    ap = ap + sig_ap*rstate.normal(size=(nrow, nwave))
+
+    # c_p
+    bp660 = 0.4*chla**0.8 * rstate.lognormal(0., 0.2, nrow)
+    cp = bp660[:,None] * (wave[None,:]/660.)**(-cruise['gamma'][:,None]) + ap
+    sig_cp = 0.002 + 0.02*cp
+    cp = cp + sig_cp*rstate.normal(size=(nrow, nwave))
+
+    # Gaps
+    red = wave > 740.
+    for arr in (ap, sig_ap, cp, sig_cp):
+        arr[np.ix_(cruise['no_red'], red)] = np.nan
+    dropout = rstate.random(nrow) < dropout_frac
+    for arr, sig in ((ap, sig_ap), (cp, sig_cp)):
+        bad = rstate.random((nrow, nwave)) < sentinel_frac
+        bad[dropout] = True
+        bad &= np.isfinite(arr)
+        arr[bad] = -9999.
+        sig[bad] = -9999.
+
+    # Columns in the order of ingest.load_cruise()
+    columns = {}
+    dti = pandas.DatetimeIndex(dt)
+    columns['date'] = (dti.year*10000 + dti.month*100 + dti.day).to_numpy(
+        dtype=np.int64)
+    columns['time'] = np.array([f'{hh:02d}:{mm:02d}:00' for hh in range(24)
+                                for mm in range(60)])[dti.hour*60 + dti.minute]
+    columns['lat'], columns['lon'] = lat, lon
+    columns['Wt'], columns['sal'] = Wt, sal
+    columns.update({f'ap{label}': ap[:,iwv] for iwv, label in enumerate(labels)})
+    columns['datetime'] = dt.astype('datetime64[ns]')
+    columns.update({f'sig_ap{label}': sig_ap[:,iwv]
+                    for iwv, label in enumerate(labels)})
+    columns.update({f'cp{label}': cp[:,iwv] for iwv, label in enumerate(labels)})
+    columns.update({f'sig_cp{label}': sig_cp[:,iwv]
+                    for iwv, label in enumerate(labels)})
+    columns['cruise'] = cruise['name']
+
+    return pandas.DataFrame(columns)
+
+def iter_chunks(nrow:int, seed:int=None, ncruise:int=40,
+                chunk_size:int=50000, **kwargs):
+    """ Generate a synthetic Tara database chunk by chunk
+
+    Each chunk has its own child seed, so the output depends
+    only on seed, nrow, ncruise and chunk_size.
+
+    Args:
+        nrow (int): Number of rows
+        seed (int, optional): Seed
+        ncruise (int, optional): Number of cruises
+        chunk_size (int, optional): Rows per chunk
+        **kwargs: Passed to generate_chunk()
+
+    Yields:
+        pandas.DataFrame: chunk
+    """
+    ncruise = max(min(ncruise, nrow), 1)
+    rows_per_cruise = -(-nrow // ncruise)
+    nchunks = -(-nrow // chunk_size)
+    cruise_seed, chunk_seed = np.random.SeedSequence(seed).spawn(2)
+    cruises = sample_cruises(ncruise, cruise_seed)
+
+    for ichunk, iseed in enumerate(chunk_seed.spawn(nchunks)):
+        row0 = ichunk*chunk_size
+        yield generate_chunk(row0, min(chunk_size, nrow-row0), cruises,
+                             rows_per_cruise, iseed, **kwargs)
+
+def write_tara_db(outfile:str, nrow:int, seed:int=None, ncruise:int=40,
+                  chunk_size:int=50000, **kwargs):
+    """ Write a synthetic Tara database to parquet, one row group
+    per chunk, without holding the full table in memory
+
+    Args:
+        outfile (str): Output file, e.g. Tara_APCP.parquet
+        nrow (int): Number of rows
+        seed (int, optional): Seed
+        ncruise (int, optional): Number of cruises
+        chunk_size (int, optional): Rows per chunk
+        **kwargs: Passed to generate_chunk()
+
+    Returns:
+        str: outfile
+    """
+    import pyarrow
+    from pyarrow import parquet
+
+    writer = None
+    try:
+        for chunk in iter_chunks(nrow, seed=seed, ncruise=ncruise,
+                                 chunk_size=chunk_size, **kwargs):
+            if writer is None:
+                table = pyarrow.Table.from_pandas(chunk, preserve_index=False)
+                # Dictionaries only pay off for the strings
+                writer = parquet.ParquetWriter(outfile, table.schema,
+                                               use_dictionary=['time', 'cruise'])
+            else:
+                table = pyarrow.Table.from_pandas(chunk, schema=writer.schema,
+                                                  preserve_index=False)
+            writer.write_table(table)
+    finally:
+        if writer is not None:
+            writer.close()
+    print(f"Wrote {nrow} rows to {outfile}")
+    return outfile
+
+
+if __name__ == '__main__':
+    write_tara_db('Tara_APCP_synthetic.parquet', 1000000, seed=1234)
@@ -0,0 +1,48 @@
+""" Import time of the package """
+import sys
+import subprocess
+
+import pytest
+
+# Seconds, for a fresh interpreter
+import_budget = 1.
+
+
+def run_import(module:str):
+    """ Import a module in a fresh interpreter;  return the
+    import time and the heavy modules that were loaded """
+    code = (f"import sys, time; t0 = time.perf_counter(); import {module}; "
+            "dt = time.perf_counter() - t0; "
+            "heavy = [mod for mod in ('IPython', 'scipy', 'torch', 'matplotlib', "
+            "'seaborn', 'sklearn', 'pkg_resources') if mod in sys.modules]; "
+            "print(dt, ','.join(heavy))")
+    # Warnings at import are errors
+    result = subprocess.run([sys.executable, '-W', 'error', '-c', code],
+                            capture_output=True, text=True, check=True)
+    dt, heavy = (result.stdout.strip().split(' ') + [''])[:2]
+    return float(dt), [mod for mod in heavy.split(',') if mod]
+
+
+def test_import_ls2():
+    dt, heavy = run_import('oceancolor.ls2')
+    assert heavy == []
+    assert dt < import_budget
+
+    _, heavy = run_import('oceancolor.ls2.ls2_main')
+    assert heavy == []
+
+
+@pytest.mark.parametrize('module', ['oceancolor.tara.io', 'oceancolor.tara.ingest',
+                                    'oceancolor.tara.measures', 'oceancolor.remote.pca',
+                                    'oceancolor.tara.explore'])
+def test_no_heavy_imports(module):
+    _, heavy = run_import(module)
+    assert heavy == []
+
+
+def test_lazy_submodules():
+    import oceancolor
+    assert 'ls2' in dir(oceancolor)
+    assert oceancolor.ls2.forward.calc_muw(0.) == 1.
+    with pytest.raises(AttributeError):
+        oceancolor.not_a_module
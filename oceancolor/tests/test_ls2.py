@@ -1,15 +1,20 @@
 """ Tests for the ls2 module """
 
 #clear command window and workspace; close figures  
+import os
 import numpy as np
 import pathlib
 import datetime
+import warnings
 import pytest
 
 import pandas
 
 from oceancolor.ls2.io import load_LUT
 from oceancolor.ls2.ls2_main import LS2_main
+from oceancolor.ls2 import ls2_main
+from oceancolor.ls2 import forward
+from oceancolor import water
 
 from IPython import embed
 
@@ -192,4 +197,239 @@ def test_ls2_run():
 
     assert np.allclose(ls2_412['Output bb [1/m]'].values, 
                        df['Output bb [1/m]'].values, 
-                       rtol=1e-3)
\ No newline at end of file
+                       rtol=1e-3)
+    for key in ls2_test_run.keys():
+        assert np.allclose(ls2_test_run[key]['Ouput a [1/m]'].values,
+                           save_dfs[key]['Ouput a [1/m]'].values,
+                           rtol=1e-6)
+
+
+def test_seek_pos_batch():
+    LS2_LUT = load_LUT()
+    rstate = np.random.default_rng(1)
+    for itype, key in [('eta', 'eta'), ('muw', 'muw')]:
+        LUT = LS2_LUT[key].flatten()
+        params = rstate.uniform(LUT.min(), LUT.max(), size=50)
+        idx = ls2_main.LS2_seek_pos_batch(params, LUT, itype)
+        assert np.all(idx == [ls2_main.LS2_seek_pos(p, LUT, itype)
+                              for p in params])
+    # Out of bounds
+    assert ls2_main.LS2_seek_pos_batch(np.array([2., np.nan]),
+                                       LS2_LUT['eta'], 'eta').tolist() == [-1, -1]
+
+
+def test_forward():
+    LS2_LUT = load_LUT()
+    rstate = np.random.default_rng(3)
+    a = rstate.uniform(0.02, 1., size=100)
+    bb = a * rstate.uniform(0.005, 0.2, size=100)
+    b = bb * rstate.uniform(20., 80., size=100)
+    sza = rstate.uniform(0., 60., size=100)
+    bw = 0.003
+
+    Rrs, Kd = forward.LS2_forward(sza, a, bb, b, bw, LS2_LUT)
+    assert np.all(np.isfinite(Rrs))
+
+    # Back through LS2
+    for i in range(0, 100, 10):
+        out = LS2_main(sza[i], 500., Rrs[i], Kd[i], 0.003, bw, b[i]-bw,
+                       LS2_LUT, False)
+        assert np.isclose(out[0], a[i], rtol=1e-8)
+        assert np.isclose(out[2], bb[i], rtol=1e-8)
+
+    # eta outside of the LUT
+    Rrs, Kd = forward.LS2_forward(30., 0.1, 0.01, bw/2, bw, LS2_LUT)
+    assert np.isnan(Rrs) and np.isnan(Kd)
+
+
+def test_batch():
+    LS2_LUT = load_LUT()
+    ls2_test_run = pandas.read_excel(data_path('LS2_test_run.xls'), sheet_name=None)
+    df = pandas.concat(ls2_test_run.values(), ignore_index=True)
+    inputs = [df[f'Input {key}'].values for key in
+              ('sza [deg]', 'wavelength [nm]', 'Rrs [1/sr]', 'Kd [1/m]',
+               'aw [1/m]', 'bw [1/m]', 'bp [1/m]')]
+
+    for Flag_Raman in (False, True):
+        out = ls2_main.LS2_batch(*inputs, LS2_LUT, Flag_Raman, chunk_size=7)
+        for i in range(0, len(df), 5):
+            single = LS2_main(*[x[i] for x in inputs], LS2_LUT, Flag_Raman)
+            assert np.allclose([x[i] for x in out], single, rtol=1e-10,
+                               equal_nan=True)
+    # Reference run, with the Raman correction
+    assert np.allclose(out[0], df['Ouput a [1/m]'].values, rtol=1e-10)
+    assert np.allclose(out[2], df['Output bb [1/m]'].values, rtol=1e-10)
+
+    # Outside of the LUTs
+    out = ls2_main.LS2_batch(30., 500., 0.002, 0.1, 0.01, 0.003, -0.0015,
+                             LS2_LUT, True)
+    assert np.all(np.isnan(out))
+
+
+def test_batch_fast():
+    LS2_LUT = load_LUT()
+    tables = ls2_main.LS2_fast_tables(LS2_LUT)
+
+    # Over the LUT;  a few Rrs off the tables
+    rstate = np.random.default_rng(1234)
+    npix = 20000
+    sza = rstate.uniform(0., 70., npix)
+    Rrs = rstate.uniform(0., 0.05, npix)
+    Rrs[:10] = 0.06
+    Kd = rstate.uniform(0.02, 1., npix)
+    bw = 0.003
+    bp = bw/rstate.uniform(1e-3, 0.2, npix) - bw
+    lam = rstate.uniform(400., 700., npix)
+
+    with warnings.catch_warnings():
+        warnings.simplefilter('ignore')
+        for Flag_Raman in (False, True):
+            exact = ls2_main.LS2_batch(sza, lam, Rrs, Kd, 0.01, bw, bp,
+                                       LS2_LUT, Flag_Raman)
+            fast = ls2_main.LS2_batch(sza, lam, Rrs, Kd, 0.01, bw, bp,
+                                      LS2_LUT, Flag_Raman, mode='fast',
+                                      tables=tables, chunk_size=7000)
+            same = np.isfinite(exact[4]) == np.isfinite(fast[4])
+            assert np.sum(~same) < 10
+            # anw and bbp relative to a and bb
+            for i, ref in ((0, 0), (1, 0), (2, 2), (3, 2)):
+                error = np.abs(fast[i]-exact[i])[same] / exact[ref][same]
+                assert np.nanmax(error) < ls2_main.fast_max_rel_error
+            # Off the tables:  exact
+            assert np.array_equal([x[:10] for x in fast],
+                                  [x[:10] for x in exact], equal_nan=True)
+
+    with pytest.raises(ValueError):
+        ls2_main.LS2_batch(30., 500., 0.002, 0.1, 0.01, 0.003, 0.01,
+                           LS2_LUT, True, mode='approximate')
+
+
+def test_batch_uncertainty():
+    LS2_LUT = load_LUT()
+    rstate = np.random.default_rng(42)
+    npix = 1000
+    inputs = dict(sza=rstate.uniform(1., 69., npix),
+                  Rrs=rstate.uniform(1e-3, 0.02, npix),
+                  Kd=rstate.uniform(0.03, 0.5, npix),
+                  bp=rstate.uniform(0.02, 1., npix))
+    steps = dict(sza=1e-4, Rrs=1e-8, Kd=1e-7, bp=1e-7)
+    lam, aw, bw = rstate.uniform(410., 690., npix), 0.01, 0.003
+
+    def run(func, inputs, **kwargs):
+        return func(inputs['sza'], lam, inputs['Rrs'], inputs['Kd'], aw, bw,
+                    inputs['bp'], LS2_LUT, Flag_Raman, **kwargs)
+
+    with warnings.catch_warnings():
+        warnings.simplefilter('ignore')
+        for Flag_Raman in (False, True):
+            out = run(ls2_main.LS2_batch, inputs)
+            sigmas = {}
+            for key, step in steps.items():
+                sig = run(ls2_main.LS2_batch_uncertainty, inputs,
+                          **{f'sig_{key}': 1.})
+                assert np.allclose(sig[:5], out, equal_nan=True)
+                # Central differences
+                plus = run(ls2_main.LS2_batch, dict(inputs, **{key: inputs[key]+step}))
+                minus = run(ls2_main.LS2_batch, dict(inputs, **{key: inputs[key]-step}))
+                for i in (0, 1, 2, 3):
+                    deriv = np.abs(plus[i]-minus[i])/(2*step)
+                    assert np.allclose(sig[5+i], deriv, rtol=1e-3, equal_nan=True)
+                sigmas[key] = sig[5:]
+
+            # Independent errors add in quadrature
+            sig = run(ls2_main.LS2_batch_uncertainty, inputs, sig_sza=0.5,
+                      sig_Rrs=1e-4, sig_Kd=0.01, sig_bp=0.02)
+            expected = np.sqrt((0.5*sigmas['sza'][0])**2 + (1e-4*sigmas['Rrs'][0])**2
+                               + (0.01*sigmas['Kd'][0])**2 + (0.02*sigmas['bp'][0])**2)
+            assert np.allclose(sig[5], expected, equal_nan=True)
+
+
+def test_pipeline():
+    from oceancolor.ls2 import pipeline
+
+    wave = np.array([412., 443., 490., 510., 555., 670.])
+    # OC4 and bp
+    Rrs = np.array([0.004, 0.005, 0.005, 0.004, 0.005, 0.001])
+    assert np.isclose(pipeline.oc4_chla(Rrs, wave), 10**0.366)
+    bp = pipeline.bp_from_chla(np.array([2., 5.]), wave)
+    assert np.allclose(bp[0], 0.416*2**0.766)
+    with pytest.raises(ValueError):
+        pipeline.oc4_chla(Rrs[:3], wave[:3])
+
+    # Scene of simulated waters
+    _, sza, _, Rrs_sim, Kd_sim = pipeline.simulate_kd_training(
+        60, seed=1, wave=wave)
+    Rrs, Kd = Rrs_sim.reshape(6, 10, 6), Kd_sim.reshape(6, 10, 6)
+    sza = sza.reshape(6, 10)
+
+    # The bundled MLP
+    kd_mlp = pipeline.load_kd_mlp()
+    ok = np.isfinite(Kd)
+    assert np.nanmedian(np.abs(kd_mlp(Rrs, wave, sza)[ok]/Kd[ok] - 1)) < 0.05
+
+    # Same as LS2_batch on the same inputs
+    LS2_LUT = load_LUT()
+    with warnings.catch_warnings():
+        warnings.simplefilter('ignore')
+        out = pipeline.retrieve_iops(Rrs, wave, sza,
+                                     kd_estimator=lambda *args: Kd.reshape(-1, 6))
+        aw, bw, _ = water.water_iops(wave)
+        batch = ls2_main.LS2_batch(sza[..., None], wave, Rrs, Kd, aw, bw,
+                                   out['bp'], LS2_LUT, True)
+        # Chunks
+        full = pipeline.retrieve_iops(Rrs, wave, sza)
+        chunked = pipeline.retrieve_iops(Rrs, wave, sza, chunk_size=7)
+    assert out['a'].shape == (6, 10, 6) and out['chla'].shape == (6, 10)
+    for key, value in zip(('a', 'anw', 'bb', 'bbp', 'kappa'), batch):
+        assert np.allclose(out[key], value, rtol=1e-12, equal_nan=True)
+    assert np.sum(np.isfinite(out['a'])) > 0.8*out['a'].size
+    for key in full.keys():
+        assert np.allclose(full[key], chunked[key], rtol=1e-12, equal_nan=True)
+
+
+def test_closure(tmp_path):
+    import xarray
+    from oceancolor.ls2 import closure
+
+    # Fake Hydrolight tables, with Rrs and Kd from the forward LS2
+    rstate = np.random.default_rng(7)
+    wave = np.arange(400., 705., 25.)
+    nrow = 50
+    aw, bw, _ = water.water_iops(wave)
+    a = aw + rstate.uniform(0.01, 0.3, (nrow, 1)) * np.exp(-0.015*(wave-400.))
+    bp = rstate.uniform(0.05, 1., (nrow, 1)) * (wave/550.)**-0.5
+    bb = bw/2 + 0.015*bp
+    Rrs, Kd = forward.LS2_forward(30., a, bb, bw + bp, bw, load_LUT())
+    files = []
+    for kd in (True, False):
+        variables = dict(a=a, b=bw+bp, bb=bb, Rrs=Rrs)
+        if kd:
+            variables['Kd'] = Kd
+        ds = xarray.Dataset({key: (('IOP_Scenario', 'Lambda'), value)
+                             for key, value in variables.items()},
+                            coords={'Lambda': wave})
+        files.append(os.path.join(tmp_path, f'Hydrolight{1 if kd else 2}30.nc'))
+        ds.to_netcdf(files[-1], engine='h5netcdf')
+
+    outfile = os.path.join(tmp_path, 'closure.csv')
+    summary = closure.run_closure(files[:1], outfile=outfile, chunk_size=16,
+                                  nworkers=1)
+    assert os.path.isfile(outfile)
+    assert len(summary) == 2*wave.size
+    ok = np.isfinite(Rrs)
+    assert np.array_equal(summary.n.values[:wave.size], ok.sum(axis=0))
+    # Exact, to the floor of the bins
+    assert np.all(summary.mdape < 1e-3)
+
+    # Kd from the MLP, in a pool of processes
+    both = closure.run_closure(files, chunk_size=16, nworkers=2)
+    assert np.all(both.n.values[:wave.size] == 2*ok.sum(axis=0))
+    assert np.all(np.isfinite(both.rmse))
+
+    # Binned median
+    acc = closure.new_accumulator(1)
+    true = rstate.uniform(0.1, 1., (1000, 1))
+    ret = true*(1 + rstate.normal(0., 0.1, (1000, 1)))
+    closure.accumulate(acc, 'a', true, ret)
+    mdape = closure.summarize(acc, [500.]).mdape.values[0]
+    assert np.isclose(mdape, 100*np.median(np.abs(ret/true-1)), rtol=0.012)
@@ -0,0 +1,51 @@
+""" Tests for particle mixtures """
+import numpy as np
+
+from oceancolor import cross
+from oceancolor import mixture
+from oceancolor import water
+
+import pytest
+
+
+def test_mixture():
+    wave = np.arange(400., 705., 5.)
+    mix = mixture.ParticleMixture(wave)
+    assert mix.components == ['detritus', 'minerals', 'bubbles']
+    assert mix.xsec.shape == (3, 3, wave.size)
+
+    rstate = np.random.default_rng(42)
+    conc = rstate.uniform(0., 1e10, size=(50, 3))
+    a, b, bb = mix.iops(conc)
+    assert a.shape == (50, wave.size)
+
+    # Component by component
+    aw, bw, bbw = water.water_iops(wave)
+    a_sum = aw + 1e-12 * (np.outer(conc[:,0], cross.detritus_abs(wave)) 
+                          + np.outer(conc[:,1], cross.minerals_abs(wave)))
+    bb_sum = bbw + 1e-12 * (np.outer(conc[:,0], cross.detritus_backscatt(wave)) 
+                            + np.outer(conc[:,1], cross.mineral_backscatt(wave))
+                            + np.outer(conc[:,2], cross.bubbles_backscatt(wave)))
+    assert np.allclose(a, a_sum)
+    assert np.allclose(bb, bb_sum)
+
+    # Into a buffer
+    out = np.full((50, 3, wave.size), -1., dtype=mix.dtype)
+    a_out, _, _ = mix.iops(conc, out=out)
+    assert np.shares_memory(a_out, out)
+    assert np.allclose(out[:,0], a_sum)
+    # Which must be written in place
+    for bad in (np.full((3, 50, wave.size), -1., dtype=mix.dtype).transpose(1, 0, 2),
+                np.empty((50, 3, wave.size), dtype=np.float16),
+                np.empty((49, 3, wave.size), dtype=mix.dtype)):
+        with pytest.raises(ValueError):
+            mix.iops(conc, out=bad)
+
+    # No water
+    mix = mixture.ParticleMixture(wave, components=('minerals',), 
+                                  add_water=False)
+    _, b, _ = mix.iops(np.ones(1))
+    assert np.allclose(b[0], 1e-12*cross.mineral_scatt(wave))
+
+    with pytest.raises(ValueError):
+        mix.iops(conc)
@@ -1,13 +1,109 @@
 """ Tests for phytoplankton """""
 import os
 
-from oceancolor.ph import io
+import numpy as np
+import pandas
+
+from oceancolor.ph import load_data
+from oceancolor.ph import community
+from oceancolor import mixture
 
 import pytest
 
-from IPython import embed
 
-def test_load_tables():
-    df = io.load_tables()
+def fake_xsec(path, kind:str, species=('VIRU', 'HBAC', 'PROC ')):
+    """ Write a small, fake Stramski 2001 cross-section workbook """
+    wave = np.arange(400., 705., 5.)
+    df = pandas.DataFrame({'Lambda': wave})
+    scale = 3. if kind == 'att' else 1.
+    for ss, label in enumerate(species):
+        df[label] = scale * (ss+1) * 1e-3 * (wave/500.)**-1
+    df.to_excel(os.path.join(path, load_data.stramski2001_files[kind]),
+                sheet_name='Sheet1', index=False)
+
+
+def test_load_tables(tmp_path, monkeypatch):
+    monkeypatch.setenv('OCEANCOLOR_CACHE', str(tmp_path))
+    tables = load_data.stramski2001()
+    assert 'HBAC' in tables['table1']['Label'].values
+
+    # Second call served from the same cache file
+    tab1_cache, _ = load_data.stramski2001_cache()
+    assert os.path.isfile(tab1_cache)
+    assert load_data.stramski2001_cache()[0] == tab1_cache
+
+
+def fake_data(tmp_path):
+    data_path = tmp_path / 'data'
+    data_path.mkdir()
+    (data_path / load_data.stramski2001_files['table1']).write_text(
+        'Label\tD_(um)\nVIRU \t0.07\n')
+    for kind in ('abs', 'att'):
+        fake_xsec(data_path, kind)
+    return data_path, str(tmp_path / 'cache')
+
+
+def test_xsec_cache(tmp_path):
+    data_path, cache_dir = fake_data(tmp_path)
+
+    xsec = load_data.stramski2001_xsec('abs', data_path=str(data_path),
+                                       cache_dir=cache_dir)
+    assert xsec.species == ['VIRU', 'HBAC', 'PROC']
+    assert np.allclose(xsec['HBAC'], 2*xsec['VIRU'])
+    assert xsec.rows(['PROC', 'VIRU']).shape == (2, xsec.wave.size)
+    assert not xsec.values.flags.writeable
+
+    # Editing a source rebuilds the cache
+    _, old_cache = load_data.stramski2001_cache(str(data_path), cache_dir)
+    fake_xsec(data_path, 'att', species=('SYNE',))
+    os.utime(data_path / load_data.stramski2001_files['att'], ns=(0, 0))
+    _, new_cache = load_data.stramski2001_cache(str(data_path), cache_dir)
+    assert new_cache != old_cache
+    assert not os.path.isfile(old_cache)
+    assert load_data.stramski2001_xsec('att', data_path=str(data_path),
+                                       cache_dir=cache_dir).species == ['SYNE']
+    assert load_data.stramski2001_table1(
+        data_path=str(data_path), cache_dir=cache_dir).Label.tolist() == ['VIRU ']
+
+
+def test_stramski2001_frames(tmp_path):
+    data_path, cache_dir = fake_data(tmp_path)
+
+    # As read by pandas, labels included
+    tables = load_data.stramski2001(data_path=str(data_path),
+                                    cache_dir=cache_dir)
+    pandas.testing.assert_frame_equal(tables['table1'], pandas.read_csv(
+        data_path / load_data.stramski2001_files['table1'], sep='\t'))
+    for kind in ('abs', 'att'):
+        pandas.testing.assert_frame_equal(tables[kind], pandas.read_excel(
+            data_path / load_data.stramski2001_files[kind], sheet_name='Sheet1'))
+    assert 'PROC ' in tables['abs']
+
+
+def test_community(tmp_path):
+    data_path, cache_dir = fake_data(tmp_path)
+    wave = np.arange(400., 705., 10.)
+    comm = community.Community(wave, species=('PROC', 'VIRU'),
+                               data_path=str(data_path), cache_dir=cache_dir)
+
+    rstate = np.random.default_rng(1)
+    conc = rstate.uniform(0., 1e12, size=(20, 2))
+    a_ph, b_ph, c_ph = comm.iops(conc)
+    assert a_ph.shape == (20, wave.size)
+    assert np.allclose(c_ph, a_ph + b_ph)
+    a_proc = 3e-3 * (wave/500.)**-1
+    assert np.allclose(a_ph, 1e-12 * (np.outer(conc[:,0], a_proc)
+                                      + np.outer(conc[:,1], a_proc/3)))
+
+    # Combine with non-algal particles
+    mix = mixture.ParticleMixture(wave, components=('detritus',),
+                                  add_water=False)
+    comm.add_to_mixture(mix, bb_ratio=0.01)
+    assert mix.components == ['detritus', 'PROC', 'VIRU']
+    a, b, bb = mix.iops(np.concatenate([np.zeros((20, 1)), conc], axis=1))
+    assert np.allclose(a, a_ph)
+    assert np.allclose(bb, 0.01*b_ph)
 
-#pytest.set_trace()
\ No newline at end of file
+    with pytest.raises(ValueError):
+        community.Community(wave, species=('XXXX',),
+                            data_path=str(data_path), cache_dir=cache_dir)
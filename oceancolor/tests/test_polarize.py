@@ -1,23 +1,119 @@
 """ Tests for phytoplankton """""
 import os
 
+import numpy as np
+import pandas
+
 from oceancolor.polarize import load_data
+from oceancolor.polarize import integrate
 
 import pytest
 
 from IPython import embed
 
-def test_load_koetner2020():
+def test_load_koetner2020(tmp_path, monkeypatch):
+    monkeypatch.setenv('OCEANCOLOR_CACHE', str(tmp_path))
     df_p22, psis, p22_samples, p22_median, p22_mean = load_data.koetner2020('P22')
 
     assert p22_samples.shape[1] == 15
 
-def test_load_koetner2021():
+    # Same table as from Excel
+    xlsx_file = os.path.join(load_data.polarization_path(),
+                             load_data.koestner_files[2020])
+    pandas.testing.assert_frame_equal(
+        df_p22, pandas.read_excel(xlsx_file, sheet_name='P22'))
+    assert np.allclose(df_p22[16].values, p22_samples[0].tolist() + [
+        p22_median[0], p22_mean[0]])
+
+def test_load_koetner2021(tmp_path, monkeypatch):
+    monkeypatch.setenv('OCEANCOLOR_CACHE', str(tmp_path))
     # Lagoon
     df, psis, vsf = load_data.koetner2021(sheet='Lagoon')
 
     assert vsf.shape[0] == len(psis)
     assert vsf.shape[1] == len(df)
+    assert df.columns[0] == 'Unnamed: 0'
 
     # BS
-    df, psis, vsf = load_data.koetner2021(sheet='BS')
\ No newline at end of file
+    df, psis, vsf = load_data.koetner2021(sheet='BS')
+    assert vsf.shape == (len(psis), 36)
+
+    # Same table as from Excel
+    xlsx_file = os.path.join(load_data.polarization_path(),
+                             load_data.koestner_files[2021])
+    pandas.testing.assert_frame_equal(
+        df, pandas.read_excel(xlsx_file, sheet_name='Beaufort Sea - corrected'))
+    assert df['psi [deg]'].iloc[0] == 'VSF'
+
+
+def test_koetner_workbooks(tmp_path, monkeypatch):
+    monkeypatch.setenv('OCEANCOLOR_CACHE', str(tmp_path))
+    excel = {year: pandas.read_excel(os.path.join(
+        load_data.polarization_path(), load_data.koestner_files[year]),
+        sheet_name=None) for year in (2020, 2021)}
+    load_data.koestner_cache(2020)
+    load_data.koestner_cache(2021)
+
+    # The whole workbooks, without Excel
+    def no_excel(*args, **kwargs):
+        raise AssertionError("Excel was read")
+    monkeypatch.setattr(load_data.pandas, 'read_excel', no_excel)
+    k2020 = load_data.koetner2020()
+    assert list(k2020) == list(excel[2020])
+    for name in k2020:
+        pandas.testing.assert_frame_equal(k2020[name], excel[2020][name])
+    k2021 = load_data.koetner2021()
+    assert list(k2021) == ['Header', 'Lagoon', 'Minerals', 'BS', 'BS-uncorrected']
+    pandas.testing.assert_frame_equal(k2021['Header'], excel[2021]['Header'])
+    pandas.testing.assert_frame_equal(
+        k2021['BS-uncorrected'], excel[2021]['Beaufort Sea - uncorrected'])
+
+
+def test_koestner_store(tmp_path, monkeypatch):
+    monkeypatch.setenv('OCEANCOLOR_CACHE', str(tmp_path))
+    ds = load_data.koestner(2021, 'Lagoon')
+    assert ds.VSF.dims == ('sample', 'psi')
+    assert ds.VSF.shape == (5, ds.psi.size)
+    assert 'cp' in ds.coords
+    load_data.koestner_cache(2020)
+
+    # Served from the cache, without Excel
+    def no_excel(*args, **kwargs):
+        raise AssertionError("Excel was read")
+    monkeypatch.setattr(load_data.pandas, 'read_excel', no_excel)
+    ds_bs = load_data.koestner(2021, 'BS')
+    assert ds_bs.attrs['sheet'] == 'Beaufort Sea - corrected'
+    ds_p12 = load_data.koestner(2020, 'P12')
+    assert ds_p12.P12.shape[0] == 17
+
+    # Common psi grid
+    psi_grid = np.linspace(1., 150., 50)
+    vsf = load_data.interp_psi(ds.psi.data, ds.VSF.data, psi_grid)
+    for ss in range(vsf.shape[0]):
+        assert np.allclose(vsf[ss], np.interp(psi_grid, ds.psi.data,
+                                              ds.VSF.data[ss]))
+    ds_grid = load_data.regrid(ds_p12, [10., 16., 100., 170.])
+    assert np.allclose(ds_grid.P12.data[:, 1], ds_p12.P12.sel(psi=16.).data)
+    assert np.all(np.isnan(ds_grid.P12.data[:, [0, 3]]))
+
+
+def test_integrate_vsf(tmp_path, monkeypatch):
+    monkeypatch.setenv('OCEANCOLOR_CACHE', str(tmp_path))
+    # Isotropic:  b = 1, bb = 0.5
+    psi = np.linspace(1., 170., 500)
+    vsf = np.full((3, psi.size), 1/(4*np.pi))
+    b, bb, ratio = integrate.integrate_vsf(psi, vsf, extrapolate='constant')
+    assert np.allclose(b, 1., rtol=1e-4)
+    assert np.allclose(ratio, 0.5, rtol=1e-4)
+    # Without extrapolation, limited to the range of psi
+    b, _, _ = integrate.integrate_vsf(psi, vsf[0])
+    assert np.isclose(b, 0.5*(np.cos(np.deg2rad(1.)) - np.cos(np.deg2rad(170.))),
+                      rtol=1e-4)
+    # Cached on the grid
+    assert integrate.quadrature_weights(psi) is integrate.quadrature_weights(psi.copy())
+
+    # Koestner 2021:  b close to the tabulated bp
+    ds = load_data.koestner(2021, 'Lagoon')
+    coeffs = integrate.scattering_coeffs(ds, extrapolate='constant')
+    assert np.allclose(coeffs.b.data, ds.bp.data, rtol=0.02)
+    assert np.all((coeffs.bb_ratio.data > 0.01) & (coeffs.bb_ratio.data < 0.05))
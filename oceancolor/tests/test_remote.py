@@ -0,0 +1,364 @@
+""" Tests for the remote module """
+import os
+
+import numpy as np
+import pandas
+import xarray
+
+import torch
+
+from sklearn import decomposition
+
+from oceancolor.remote import nn as remote_nn
+from oceancolor.remote import sweep
+from oceancolor.remote import pca as remote_pca
+from oceancolor.remote import io as remote_io
+from oceancolor.remote import posterior
+from oceancolor.remote import synthetic
+from oceancolor.remote import library
+from oceancolor.remote import mcmc
+
+import pytest
+
+
+def fake_hydrolight(path, X:int, Y:int, nrow:int=300, seed:int=0):
+    """ Write a small, fake Hydrolight{X}{Y}.nc file """
+    rstate = np.random.default_rng(seed)
+    wave = np.arange(350., 755., 5., dtype=np.float32)
+    amp = rstate.uniform(0.01, 1., size=(nrow, 4))
+    a = (0.01 + amp[:,0:1] * np.exp(-0.01*(wave-350.)) 
+         + 0.1*amp[:,1:2] * np.exp(-((wave-440.)/30.)**2)
+         + 0.05*amp[:,3:4] * np.exp(-((wave-675.)/15.)**2))
+    bb = 0.001 + 0.01*amp[:,2:3] * (wave/550.)**-1.
+    b = 30. * bb
+    Rrs = 0.09 * bb / (a + bb)
+    ds = xarray.Dataset(
+        {key: (('IOP_Scenario', 'Lambda'), val.astype(np.float32))
+         for key, val in zip(['a', 'b', 'bb', 'Rrs'], [a, b, bb, Rrs])},
+        coords={'Lambda': wave})
+    outfile = os.path.join(path, f'Hydrolight{X}{Y:02d}.nc')
+    ds.to_netcdf(outfile, engine='h5netcdf')
+    return outfile
+
+
+def fake_training_set(nitems:int=500, seed:int=42):
+    rstate = np.random.default_rng(seed)
+    ab = rstate.normal(size=(nitems, 6))
+    Rs = np.outer(ab[:,0], np.linspace(1., 2., 10)) + 0.1*ab[:,3:4]
+    pre_ab, mean_ab, std_ab = remote_nn.preprocess_data(ab)
+    pre_Rs, mean_Rs, std_Rs = remote_nn.preprocess_data(Rs)
+    model = remote_nn.SimpleNet(6, 10, 16, 16, (mean_ab, std_ab),
+                                (mean_Rs, std_Rs))
+    return remote_nn.MyDataset(pre_ab, pre_Rs), model
+
+
+def test_tensor_loader():
+    dataset, _ = fake_training_set(nitems=130)
+    loader = remote_nn.TensorLoader(dataset, batch_size=64)
+    sizes = [len(x) for x, y in loader]
+    assert len(loader) == 3
+    assert sizes == [64, 64, 2]
+
+
+def test_training_resume(tmp_path):
+    torch.manual_seed(1)
+    dataset, model = fake_training_set()
+    train, valid = dataset.split(0.2, seed=1)
+    assert len(valid) == 100
+
+    ckpt_file = os.path.join(tmp_path, 'ckpt.pt')
+    epoch, loss, _ = remote_nn.perform_training(
+        model, train, 6, dict(batch_size=64), 1., nepochs=5,
+        valid_dataset=valid, checkpoint_file=ckpt_file,
+        checkpoint_every=2)
+    assert epoch == 4
+    assert os.path.isfile(ckpt_file)
+
+    # Resume to a later epoch
+    epoch, loss2, _ = remote_nn.perform_training(
+        model, train, 6, dict(batch_size=64), 1., nepochs=8,
+        valid_dataset=valid, checkpoint_file=ckpt_file, resume=True)
+    assert epoch == 7
+    assert loss2 < loss
+
+
+def test_early_stopping():
+    dataset, model = fake_training_set()
+    train, valid = dataset.split(0.2, seed=1)
+    # Zero learning rate never improves
+    epoch, _, _ = remote_nn.perform_training(
+        model, train, 6, dict(batch_size=64), 0., nepochs=100,
+        valid_dataset=valid, patience=3)
+    assert epoch == 3
+
+    with pytest.raises(ValueError):
+        remote_nn.perform_training(model, train, 6, dict(batch_size=64),
+                                   0., patience=3)
+
+
+def test_sweep():
+    rstate = np.random.default_rng(42)
+    ab = rstate.normal(size=(300, 6))
+    Rs = 1. + np.outer(ab[:,0]**2, np.linspace(1., 2., 10))
+
+    configs = sweep.build_configs(nhidden1=(8, 16), nhidden2=(8,))
+    assert len(configs) == 2
+
+    results = sweep.run_sweep(ab, Rs, configs, nepochs=3, nworkers=2)
+    assert len(results) == 2
+    assert np.all(results.nparam.values > 0)
+
+    assert np.all(results.latency_1.values > 0)
+
+    # The fastest model misses the accuracy cut
+    table = pandas.DataFrame(dict(
+        valid_rel_err=[0.02, 0.008, 0.005, 0.009],
+        latency_1=[1e-5, 3e-5, 5e-5, 3e-5],
+        nparam=[100, 400, 900, 300]))
+    best = sweep.pick_model(table, 0.01)
+    assert best.name == 3
+    assert sweep.pick_model(table, 0.006).name == 2
+    with pytest.raises(ValueError):
+        sweep.pick_model(table, 0.001)
+
+
+def test_streaming_pca(tmp_path):
+    files = [fake_hydrolight(tmp_path, 4, Y, seed=Y) for Y in [0, 30]]
+    all_a = np.concatenate([xarray.load_dataset(ifile).a.data 
+                            for ifile in files]).astype(np.float64)
+    pca_fit = decomposition.PCA(n_components=3).fit(all_a)
+
+    for method in ['covariance', 'incremental']:
+        M, mean, var = remote_pca.fit_streaming_pca(
+            files, 'a', 3, chunk_size=64, method=method)
+        assert np.allclose(mean, pca_fit.mean_)
+        assert np.allclose(np.abs(M), np.abs(pca_fit.components_), atol=1e-3)
+    # Covariance is exact, including the sign
+    M, mean, var = remote_pca.fit_streaming_pca(files, 'a', 3, chunk_size=64)
+    assert np.allclose(M, pca_fit.components_)
+    assert np.allclose(var, pca_fit.explained_variance_)
+
+    outfile = os.path.join(tmp_path, 'pca_ab_33_Rrs.npz')
+    d = remote_pca.l23_hydrolight_streaming(
+        [(4,0), (4,30)], 3, 3, 3, save_outputs=outfile, chunk_size=100, 
+        l23_path=str(tmp_path))
+    d_l23 = np.load(outfile)
+    for key in ['a', 'b', 'bb', 'a_M3', 'b_M3', 'bb_M3', 
+                'a_mean', 'b_mean', 'bb_mean', 'Rs']:
+        assert key in d_l23.files
+    assert d_l23['a'].shape == (600, 3)
+    assert d_l23['Rs'].shape == (600, 81)
+    assert np.allclose(d['a'], pca_fit.transform(all_a))
+
+
+def test_loisel_2023_cache(tmp_path):
+    fake_hydrolight(tmp_path, 4, 0)
+    remote_pca.l23_hydrolight_streaming(
+        [(4,0)], 3, 3, 3, l23_path=str(tmp_path),
+        save_outputs=os.path.join(tmp_path, 'pca_ab_33_Rrs.npz'))
+
+    l23 = remote_io.load_loisel_2023(l23_path=str(tmp_path))
+    assert l23 is remote_io.load_loisel_2023(l23_path=str(tmp_path))
+    assert l23.ab.shape == (300, 6)
+    assert l23.Rs.shape == (300, 81)
+    assert np.allclose(l23.ab[:,3:], l23.d['bb'])
+    with pytest.raises(ValueError):
+        l23.ab[0,0] = 1.
+
+    # One row
+    ds = l23.hydrolight_rows(200, variables=['a', 'bb'])
+    assert ds.a.shape == (81,)
+    full = xarray.load_dataset(remote_io.hydrolight_file(4, 0, str(tmp_path)))
+    assert np.allclose(ds.a.data, full.a.data[200])
+
+    remote_io.clear_loisel_2023_cache()
+    assert l23 is not remote_io.load_loisel_2023(l23_path=str(tmp_path))
+
+
+def test_posterior_summary():
+    rstate = np.random.default_rng(1)
+    M = rstate.normal(size=(3, 40))
+    mean = rstate.normal(size=40)
+    chains = rstate.normal(size=(4, 2000, 3)) * np.array([1., 0.5, 0.1])
+
+    ds = posterior.summarize_spectra(chains, M, mean, chunk_size=7)
+    for ss in range(chains.shape[0]):
+        recon = remote_pca.reconstruct_from_coeffs(chains[ss], M, mean)
+        assert np.allclose(ds['mean'].data[ss], recon.mean(axis=0))
+        assert np.allclose(ds['std'].data[ss], recon.std(axis=0))
+        assert np.allclose(ds['quantiles'].data[ss],
+                           np.quantile(recon, [0.16, 0.5, 0.84], axis=0))
+
+    # Single chain and a/bb split
+    d_l23 = dict(a_M3=M, a_mean=mean, bb_M3=M[::-1], bb_mean=mean)
+    ds = posterior.summarize_ab(np.concatenate([chains[0], chains[1]], axis=1),
+                                d_l23, quantiles=None)
+    assert ds.a_mean.shape == (1, 40)
+    assert np.allclose(ds.bb_std.data[0], posterior.summarize_spectra(
+        chains[1], M[::-1], mean, quantiles=None)['std'].data[0])
+
+
+def test_synthetic(tmp_path):
+    rstate = np.random.default_rng(0)
+    M = np.linalg.qr(rstate.normal(size=(81, 3)))[0].T
+    pca_bases = dict(a_M3=M, a_mean=np.zeros(81), bb_M3=M, bb_mean=np.zeros(81))
+
+    ab, Rs = synthetic.generate_chunk(200, 1, pca_bases)
+    assert ab.shape[1] == 6
+    assert Rs.shape == (ab.shape[0], 81)
+    assert np.all(np.isfinite(Rs))
+
+    # Output independent of the number of workers, past the window of
+    #  chunks in flight
+    chunks1 = list(synthetic.iter_chunks(6, 50, pca_bases, seed=5, nworkers=1))
+    chunks2 = list(synthetic.iter_chunks(6, 50, pca_bases, seed=5, nworkers=2))
+    assert len(chunks2) == 6
+    for (ab1, Rs1), (ab2, Rs2) in zip(chunks1, chunks2):
+        assert np.array_equal(ab1, ab2)
+        assert np.array_equal(Rs1, Rs2)
+
+    # Shards and training from them
+    synthetic.write_shards(tmp_path, 6, 50, pca_bases, seed=5, nworkers=1)
+    source = synthetic.shard_source(tmp_path)
+    _, mean_ab, std_ab = remote_nn.preprocess_data(ab)
+    _, mean_Rs, std_Rs = remote_nn.preprocess_data(Rs)
+    loader = remote_nn.ChunkLoader(source, (mean_ab, std_ab),
+                                   (mean_Rs, std_Rs), batch_size=32)
+    assert sum(len(x) for x, _ in loader) == sum(len(c[0]) for c in chunks1)
+
+    model = remote_nn.SimpleNet(6, 81, 16, 16, (mean_ab, std_ab),
+                                (mean_Rs, std_Rs))
+    epoch, loss, _ = remote_nn.perform_training(model, loader, 6, None, 1.,
+                                                nepochs=2)
+    assert epoch == 1
+    assert np.isfinite(loss)
+
+
+def test_library():
+    rstate = np.random.default_rng(3)
+    ab = rstate.normal(size=(500, 6))
+    W = rstate.normal(scale=0.3, size=(6, 10))
+    Rs = 0.005*np.exp(ab @ W)
+    lib = library.Library(ab, Rs, ncomp=4)
+
+    # Members find themselves
+    dist, idx = lib.query(Rs[:20], k=5)
+    assert idx.shape == (20, 5)
+    assert np.array_equal(idx[:,0], np.arange(20))
+    assert np.allclose(dist[:,0], 0.)
+    # Same as brute force
+    brute = np.argsort(np.sum((np.log(Rs) - np.log(Rs[7]))**2, axis=1))[:5]
+    assert np.array_equal(lib.query(Rs[7], k=5)[1], brute)
+
+    p0 = lib.init_walkers(Rs[7]*1.01, 32, k=4, seed=1)
+    assert p0.shape == (32, 6)
+    assert np.all(np.abs(p0.mean(axis=0) - ab[brute[:4]].mean(axis=0))
+                  < 3*ab.std(axis=0))
+
+    # Start of the MCMC
+    _, model = fake_training_set()
+    sampler = mcmc.run_emcee_nn(model, Rs[7], nsteps=2, nburn=0, p0=p0)
+    assert sampler.get_chain().shape == (2, 32, 6)
+    with pytest.raises(ValueError):
+        mcmc.run_emcee_nn(model, Rs[7], nsteps=2, nburn=0, p0=p0[:10])
+
+
+def test_mcmc_adaptive(tmp_path):
+    # Thinning of a Gaussian
+    rstate = np.random.default_rng(2)
+    np.random.seed(2)
+    sampler = mcmc.emcee.EnsembleSampler(
+        16, 3, lambda x: -0.5*np.sum(x**2))
+    sampler.run_mcmc(rstate.normal(size=(16, 3)), 4000)
+    samples, info = mcmc.converged_samples(sampler)
+    assert samples.dtype == np.float32
+    assert info['discard'] >= 2*info['tau'].max() - 1
+    assert np.array_equal(samples, sampler.get_chain(
+        discard=info['discard'], thin=info['thin'], flat=True).astype(np.float32))
+    assert np.allclose(samples.std(axis=0), 1., atol=0.2)
+    nlong = int(60*info['tau'].max())
+    assert mcmc.converged(info['tau'], info['tau'], nlong)
+    assert not mcmc.converged(info['tau'], None, nlong)
+    assert not mcmc.converged(info['tau'], 1.1*info['tau'], nlong)
+    assert not mcmc.converged(info['tau'], info['tau'], 10)
+
+    # Stop at the first check past min_steps, with loose tolerances
+    _, model = fake_training_set()
+    Rs = model.prediction(np.zeros(6, dtype=np.float32), 'cpu')
+    store_file = os.path.join(tmp_path, 'chains.h5')
+    sampler = mcmc.run_emcee_nn(
+        model, Rs, nsteps=1000, nburn=0, p0=0.01*rstate.normal(size=(32, 6)),
+        check_every=50, min_steps=100, tau_factor=1., tau_rtol=10.,
+        store_file=store_file, store_key='i0')
+    assert sampler.iteration == 100
+    assert sampler.converged
+
+    # Many spectra in one store
+    mcmc.write_chain(store_file, 'i1', samples, tau=info['tau'])
+    assert mcmc.chain_keys(store_file) == ['i0', 'i1']
+    chain, attrs = mcmc.read_chain(store_file, 'i1')
+    assert np.array_equal(chain, samples)
+    assert np.allclose(attrs['tau'], info['tau'])
+    chain, attrs = mcmc.read_chain(store_file, 'i0')
+    assert chain.shape[1] == 6
+    assert attrs['nsteps'] == 100
+    assert attrs['converged']
+
+    # Step limit reached:  flagged and warned
+    with pytest.warns(UserWarning, match='did not converge'):
+        mcmc.run_emcee_nn(
+            model, Rs, nsteps=100, nburn=0, p0=0.01*rstate.normal(size=(32, 6)),
+            check_every=50, min_steps=50, store_file=store_file,
+            store_key='i2')
+    assert not mcmc.read_chain(store_file, 'i2')[1]['converged']
+    assert info['converged']
+
+
+def test_importance_sampling(tmp_path):
+    rstate = np.random.default_rng(4)
+    ab = rstate.normal(size=(400, 6))
+    W = rstate.normal(scale=0.3, size=(6, 10))
+    Rs = 0.005*np.exp(ab @ W)
+    lib = library.Library(ab, Rs, ncomp=4)
+    targets = Rs[:5] * (1. + 0.02*rstate.normal(size=(5, 10)))
+
+    # Same as the loop over the library
+    post = lib.importance_sample(targets)
+    logL = np.array([[-0.5*np.sum((Rs[j]-target)**2 / (0.05*target)**2)
+                      for j in range(len(Rs))] for target in targets])
+    weights = np.exp(logL - logL.max(axis=1, keepdims=True))
+    weights /= weights.sum(axis=1, keepdims=True)
+    assert np.allclose(post['weights'], weights)
+    assert np.allclose(post['mean'], weights @ ab)
+    for ss in range(len(targets)):
+        assert np.allclose(post['cov'][ss],
+                           np.cov(ab.T, aweights=weights[ss], bias=True))
+    assert np.allclose(post['ess'], 1./np.sum(weights**2, axis=1))
+    assert np.all((post['ess'] >= 1.) & (post['ess'] <= len(ab)))
+
+    # Chunked
+    result = library.retrieve_ab(lib, targets, chunk_size=2)
+    assert np.allclose(result['mean'], post['mean'])
+    assert np.allclose(result['cov'], post['cov'])
+    assert not np.any(result['mcmc'])
+
+    # MCMC of the low ESS spectra
+    _, model = fake_training_set()
+    store_file = os.path.join(tmp_path, 'chains.h5')
+    low = post['ess'] < np.sort(post['ess'])[1] + 1e-9
+    result = library.retrieve_ab(lib, targets, nn_model=model,
+                                 ess_min=np.sort(post['ess'])[1] + 1e-9,
+                                 store_file=store_file, nsteps=20,
+                                 check_every=None)
+    assert np.array_equal(result['mcmc'], low)
+    # 20 steps are too few to converge
+    assert not np.any(result['converged'])
+    assert mcmc.chain_keys(store_file) == [f'i{idx}' for idx in np.flatnonzero(low)]
+    assert np.allclose(result['mean'][~low], post['mean'][~low])
+
+    # The verdict of the run, not a re-estimate:  tau never stable
+    result = library.retrieve_ab(lib, targets, nn_model=model,
+                                 ess_min=np.sort(post['ess'])[1] + 1e-9,
+                                 nsteps=100, check_every=50, min_steps=50,
+                                 tau_factor=1e-3, tau_rtol=0.)
+    assert not np.any(result['converged'])
@@ -57,4 +57,82 @@ def test_single_value():
 
     # Test
     assert np.isclose(value[0], 0.01625)
-    assert np.isclose(sig[0], 0.00465)
\ No newline at end of file
+    assert np.isclose(sig[0], 0.00465)
+
+
+def test_embedding(tmp_path):
+    pytest.importorskip('umap')
+    from oceancolor.tara import embedding
+
+    # Two families of fake spectra
+    rstate = np.random.default_rng(0)
+    wave = np.arange(400., 705., 5.)
+    amp = rstate.uniform(0.5, 1., size=(300, 1))
+    slope = np.where(rstate.uniform(size=(300, 1)) > 0.5, 0.01, 0.03)
+    spec = amp * np.exp(-slope*(wave-400.)) + 0.01*rstate.normal(size=(300, wave.size))
+
+    outfile = os.path.join(tmp_path, 'umap.parquet')
+    model_file = os.path.join(tmp_path, 'umap.pkl')
+    umap_tbl = embedding.run_embedding(outfile, spec[:250], np.arange(250),
+                                       nfit=200, model_file=model_file,
+                                       parametric=True, n_neighbors=10)
+    assert list(umap_tbl.columns) == ['tara_id', 'U0', 'U1']
+    assert np.all(np.isfinite(umap_tbl[['U0', 'U1']].values))
+
+    # Fitted spectra keep their embedding
+    reducer = embedding.load_model(model_file)
+    uv = umap_tbl[['U0', 'U1']].values
+    assert np.all(np.any(np.all(uv[:,None] == reducer.embedding_[None], axis=2), axis=0))
+
+    # New spectra, without refitting
+    nn_model = embedding.load_model(os.path.join(tmp_path, 'umap_nn.pkl'))
+    for model in (reducer, nn_model):
+        new_tbl = embedding.extend_umap_table(umap_tbl, model, spec,
+                                              np.arange(300), batch_size=20)
+        assert len(new_tbl) == 300
+        assert new_tbl.tara_id.tolist() == list(range(300))
+
+        assert embedding.project(model, spec[:0]).shape == (0, 2)
+
+
+def test_project_empty():
+    from oceancolor.tara import embedding
+
+    # Width of the embedding from the model
+    rstate = np.random.default_rng(1)
+    model = embedding.fit_parametric(rstate.normal(size=(50, 8)),
+                                     rstate.normal(size=(50, 3)),
+                                     hidden_layer_sizes=(4,), max_iter=10)
+    assert embedding.project(model, np.zeros((0, 8))).shape == (0, 3)
+
+
+def test_synthetic(tmp_path, monkeypatch):
+    from oceancolor.tara import synthetic
+    from oceancolor.tara import measures
+    from oceancolor.tara import explore
+
+    outfile = str(tmp_path / 'Tara_APCP.parquet')
+    synthetic.write_tara_db(outfile, 2500, seed=7, ncruise=3, chunk_size=1000)
+    monkeypatch.setattr(io, 'db_name', outfile)
+    tara_db = io.load_tara_db()
+    assert len(tara_db) == 2500
+    assert tara_db.cruise.nunique() == 3
+
+    # Schema
+    wave, labels = synthetic.acs_wavelengths()
+    assert list(tara_db.columns[:7]) == ['date', 'time', 'lat', 'lon', 'Wt',
+                                         'sal', f'ap{labels[0]}']
+    wv_nm, values, err = spectra.spectra_from_table(tara_db, flavor='cp')
+    assert np.allclose(wv_nm, wave)
+    assert np.any(tara_db[f'ap{labels[10]}'] == -9999.)
+
+    # Reproducible
+    chunk = next(synthetic.iter_chunks(2500, seed=7, ncruise=3,
+                                       chunk_size=1000))
+    pandas.testing.assert_frame_equal(chunk, tara_db.iloc[:1000])
+
+    # Tara code paths
+    measures.add_derived(tara_db)
+    assert np.nanmedian(tara_db.Chla) > 0.
+    rwv_nm, raph, rsig, tbl = explore.prep_spectra()
+    assert raph.shape == (len(tbl), rwv_nm.size)
@@ -0,0 +1,100 @@
+""" Tests for the utilities """
+import json
+
+import numpy as np
+
+from oceancolor.utils import benchmark
+from oceancolor.utils import cat_utils
+from oceancolor.utils import instrument
+
+import pytest
+
+
+def test_match_ids():
+    match_IDs = np.array([5, 3, 9, 3, 7])
+    rows = cat_utils.match_ids(np.array([3, 7, 5]), match_IDs)
+    assert rows.tolist() == [1, 4, 0]
+
+    with pytest.raises(IOError):
+        cat_utils.match_ids(np.array([3, 4]), match_IDs)
+    rows = cat_utils.match_ids(np.array([3, 4]), match_IDs,
+                               require_in_match=False)
+    assert rows.tolist() == [1, -1]
+
+
+def test_id_index():
+    index = cat_utils.IDIndex(np.array(['b', 'a', 'c', 'a', 'a']))
+    rows, miss = index.match(np.array(['a', 'z', 'c']))
+    assert rows.tolist() == [1, -1, 2]
+    assert miss.tolist() == [False, True, False]
+
+    # All of the duplicates
+    idx, rows = index.match_all(np.array(['c', 'z', 'a']))
+    assert idx.tolist() == [0, 2, 2, 2]
+    assert rows.tolist() == [2, 1, 3, 4]
+
+    # Multi-key
+    cruise = np.array(['A', 'A', 'B', 'B'])
+    time = np.array(['2011-01-01', '2011-01-02', '2011-01-01', '2011-01-02'],
+                    dtype='datetime64[D]')
+    index = cat_utils.IDIndex((cruise, time))
+    rows, miss = index.match((np.array(['B', 'A', 'C', 'A']),
+                              np.array(['2011-01-01', '2011-01-02',
+                                        '2011-01-01', '2011-01-03'],
+                                       dtype='datetime64[D]')))
+    assert rows.tolist() == [2, 1, -1, -1]
+    assert miss.tolist() == [False, False, True, True]
+
+
+def test_benchmark(tmp_path):
+    result = benchmark.measure(lambda: np.ones(2**20), repeat=2)
+    assert result['seconds'] > 0.
+    assert result['peak_mb'] >= 8.
+
+    baseline = dict(fast=dict(seconds=1., peak_mb=10.),
+                    tiny=dict(seconds=1e-5, peak_mb=0.01))
+    outfile = str(tmp_path / 'bench.json')
+    benchmark.write_results(outfile, baseline)
+    baseline = benchmark.load_results(outfile)
+    assert benchmark.compare(baseline, baseline) == []
+
+    results = dict(fast=dict(seconds=1.5, peak_mb=11.),
+                   tiny=dict(seconds=1e-4, peak_mb=1.))
+    regressions = benchmark.compare(results, baseline, threshold=0.25)
+    assert len(regressions) == 1 and regressions[0].startswith('fast: seconds')
+
+
+def test_instrument(tmp_path):
+    outfile = str(tmp_path / 'metrics.jsonl')
+    config = dict(instrument._config)
+    # Off
+    instrument.configure(None)
+    with instrument.stage('off', items=10) as stage:
+        stage.set(items=20)
+    instrument.count('off')
+
+    instrument.configure(outfile, memory=True)
+    try:
+        @instrument.timed('decorated', items=lambda n: n)
+        def alloc(n):
+            return np.ones(n)
+
+        with instrument.stage('outer', cruise='Rio-BA') as stage:
+            alloc(2**20)
+            stage.set(items=3)
+        instrument.count('calls')
+        instrument.count('calls', 2)
+        instrument.flush_counters()
+    finally:
+        instrument.configure(**config)
+
+    with open(outfile) as f:
+        records = [json.loads(line) for line in f]
+    assert [record.get('stage', record.get('counter')) for record in records] \
+        == ['decorated', 'outer', 'calls']
+    decorated, outer, calls = records
+    assert decorated['items'] == 2**20 and decorated['peak_mb'] >= 8.
+    assert outer['peak_mb'] >= decorated['peak_mb']
+    assert outer['items'] == 3 and outer['cruise'] == 'Rio-BA'
+    assert outer['seconds'] >= decorated['seconds']
+    assert calls['count'] == 3
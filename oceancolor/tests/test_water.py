@@ -0,0 +1,45 @@
+""" Tests for pure water """
+import numpy as np
+
+from oceancolor import water
+
+import pytest
+
+
+def test_water_coef():
+    wave, aw, bw = water.load_water_coef()
+    assert wave[0] == 200.
+    assert np.all(np.diff(wave) > 0.)
+    # Cached and read-only
+    assert water.load_water_coef()[1] is aw
+    with pytest.raises(ValueError):
+        aw[0] = 0.
+
+def test_water_iops():
+    waves = np.array([412., 443., 490., 510., 555., 670.])
+    aw, bw, bbw = water.water_iops(waves)
+    assert aw.shape == waves.shape
+    assert np.isclose(aw[2], 0.015)
+    assert np.allclose(bbw, bw/2.)
+    assert np.isclose(water.aw(490.), 0.015)
+    assert np.isnan(water.bw(100.))
+
+def test_band_iops():
+    aw, bw, bbw = water.band_iops('SeaWiFS')
+    assert np.allclose(aw, [0.0050668, 0.0072185, 0.0162135, 0.0316549,
+                            0.0591845, 0.4387803], rtol=1e-4)
+    assert np.allclose(bw, [0.0066823, 0.0048928, 0.0031753, 0.0026756,
+                            0.001864, 0.0008355], rtol=1e-4)
+    # Band averages differ from the monochromatic aw of the LS2 test
+    #  by +8.4% at 412 and +8.1% at 490 nm, where aw is steep
+    ls2_aw = np.array([0.004673, 0.00721, 0.015, 0.0325, 0.0592, 0.439])
+    assert np.allclose(aw/ls2_aw - 1., [0.0843, 0.0012, 0.0809, -0.026,
+                                        -0.0003, -0.0005], atol=1e-3)
+    # Memoized
+    assert water.band_iops('SeaWiFS')[0] is aw
+    # Custom
+    aw2, _, _ = water.band_iops(([443.], [20.]))
+    assert np.isclose(aw2[0], aw[1])
+
+    with pytest.raises(ValueError):
+        water.band_iops('Hubble')
@@ -0,0 +1,6 @@
+from oceancolor import lazy_submodules
+
+__getattr__, __dir__ = lazy_submodules(__name__, (
+    'benchmark', 'cache', 'cat_utils', 'fig_utils', 'instrument', 'plotting'))
+
+del lazy_submodules
@@ -0,0 +1,129 @@
+""" Offline benchmarks:  wall time and peak memory, with regression checks """
+
+import json
+import time
+import platform
+import datetime
+import tracemalloc
+
+import numpy as np
+
+
+def measure(func, repeat:int=3, number:int=1, memory:bool=True):
+    """ Wall time and peak memory of a callable
+
+    The time is the best of the repeats, after a warm-up call.
+    The peak memory is that of one more call under tracemalloc, which
+    sees the allocations of Python and numpy (not those of torch).
+
+    Args:
+        func (callable): Called without arguments
+        repeat (int, optional): Number of timings
+        number (int, optional): Calls per timing
+        memory (bool, optional): Measure the peak memory
+
+    Returns:
+        dict: seconds (per call), peak_mb (NaN if not measured)
+    """
+    func()
+    times = []
+    for _ in range(repeat):
+        t0 = time.perf_counter()
+        for _ in range(number):
+            func()
+        times.append((time.perf_counter() - t0) / number)
+
+    peak_mb = np.nan
+    if memory:
+        tracemalloc.start()
+        try:
+            func()
+            _, peak = tracemalloc.get_traced_memory()
+        finally:
+            tracemalloc.stop()
+        peak_mb = peak / 2**20
+
+    return dict(seconds=min(times), peak_mb=peak_mb)
+
+def run_suite(benchmarks:dict, repeat:int=3, select:str=None,
+              memory:bool=True, verbose:bool=True):
+    """ Run a set of benchmarks
+
+    Args:
+        benchmarks (dict): name -> setup;  setup() prepares the inputs
+            (not timed) and returns the callable to time
+        repeat (int, optional): Number of timings
+        select (str, optional): Only run the benchmarks whose name
+            contains this
+        memory (bool, optional): Measure the peak memory
+        verbose (bool, optional): Print the results as they come
+
+    Returns:
+        dict: name -> dict of seconds, peak_mb
+    """
+    results = {}
+    for name, setup in benchmarks.items():
+        if select is not None and select not in name:
+            continue
+        results[name] = measure(setup(), repeat=repeat, memory=memory)
+        if verbose:
+            print(f"{name:45s} {results[name]['seconds']:10.4f} s "
+                  f"{results[name]['peak_mb']:10.1f} MB")
+    return results
+
+def compare(results:dict, baseline:dict, threshold:float=0.25,
+            min_seconds:float=1e-3, min_mb:float=1.):
+    """ Regressions of a set of results with respect to a baseline
+
+    Benchmarks missing from either set are ignored.
+
+    Args:
+        results (dict): From run_suite()
+        baseline (dict): From run_suite(), e.g. of the last release
+        threshold (float, optional): Allowed fractional increase
+        min_seconds (float, optional): Ignore the time of faster
+            baseline benchmarks
+        min_mb (float, optional): Ignore the memory of smaller
+            baseline benchmarks
+
+    Returns:
+        list: Descriptions of the regressions;  empty if none
+    """
+    regressions = []
+    for name in results.keys() & baseline.keys():
+        for key, floor, unit in (('seconds', min_seconds, 's'),
+                                 ('peak_mb', min_mb, 'MB')):
+            new, old = results[name][key], baseline[name][key]
+            if not (np.isfinite(new) and np.isfinite(old)) or old < floor:
+                continue
+            if new > (1+threshold)*old:
+                regressions.append(
+                    f"{name}: {key} {old:.4g} -> {new:.4g} {unit} "
+                    f"(+{100*(new/old-1):.0f}%)")
+    return sorted(regressions)
+
+def write_results(outfile:str, results:dict):
+    """ Write benchmark results, with their environment, to JSON
+
+    Args:
+        outfile (str): Output file
+        results (dict): From run_suite()
+    """
+    meta = dict(date=datetime.datetime.now().isoformat(timespec='seconds'),
+                python=platform.python_version(), numpy=np.__version__,
+                machine=platform.machine(), node=platform.node())
+    with open(outfile, 'w') as f:
+        json.dump(dict(meta=meta, results=results), f, indent=1)
+    print(f"Wrote benchmarks to {outfile}")
+
+def load_results(infile:str):
+    """ Results written by write_results()
+
+    Args:
+        infile (str): JSON file
+
+    Returns:
+        dict: name -> dict of seconds, peak_mb
+    """
+    with open(infile) as f:
+        return json.load(f)['results']
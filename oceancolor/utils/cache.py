@@ -0,0 +1,73 @@
+""" Binary caches of tables converted from slow source files """
+
+import os
+import glob
+import hashlib
+
+import numpy as np
+
+
+def cache_path():
+    """ Folder of the binary caches;  $OCEANCOLOR_CACHE or
+    ~/.cache/oceancolor """
+    return os.getenv('OCEANCOLOR_CACHE',
+                     os.path.join(os.path.expanduser('~'), '.cache', 'oceancolor'))
+
+def cache_key(files:list):
+    """ Hash of the names, modification times and sizes of source files
+
+    Args:
+        files (list): Source files
+
+    Returns:
+        str: 12 hex digits
+    """
+    hasher = hashlib.sha1()
+    for ifile in files:
+        stat = os.stat(ifile)
+        hasher.update(f'{os.path.basename(ifile)}:{stat.st_mtime_ns}:{stat.st_size};'.encode())
+    return hasher.hexdigest()[:12]
+
+def cache_file(prefix:str, files:list, ext:str, cache_dir:str=None):
+    """ Name of the cache of a set of source files
+
+    Args:
+        prefix (str): Prefix of the file name, without underscores
+            after the last one
+        files (list): Source files
+        ext (str): Extension, e.g. '.npz'
+        cache_dir (str, optional): Folder.  Defaults to cache_path()
+
+    Returns:
+        str: {cache_dir}/{prefix}_{key}{ext}
+    """
+    if cache_dir is None:
+        cache_dir = cache_path()
+    return os.path.join(cache_dir, f'{prefix}_{cache_key(files)}{ext}')
+
+def write_cache(outfile:str, write):
+    """ Write a cache file atomically and remove its stale versions
+
+    Args:
+        outfile (str): Cache file, from cache_file()
+        write (callable): Writes the cache to the file name passed
+    """
+    os.makedirs(os.path.dirname(outfile), exist_ok=True)
+    prefix = os.path.basename(outfile).rsplit('_', 1)[0]
+    tmpfile = f'{outfile}.{os.getpid()}.tmp'
+    write(tmpfile)
+    os.replace(tmpfile, outfile)
+    ext = os.path.splitext(outfile)[1]
+    for ifile in glob.glob(os.path.join(os.path.dirname(outfile), f'{prefix}_*{ext}')):
+        if ifile != outfile:
+            os.remove(ifile)
+
+def write_npz(outfile:str, arrays:dict):
+    """ np.savez to a file name that does not end in .npz
+
+    Args:
+        outfile (str): Output file
+        arrays (dict): Arrays to save
+    """
+    with open(outfile, 'wb') as f:
+        np.savez(f, **arrays)
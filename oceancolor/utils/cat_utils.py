@@ -20,19 +20,108 @@ def match_ids(IDs, match_IDs, require_in_match=True):
     rows : ndarray
       Rows in match_IDs that match to IDs, aligned
       -1 if there is no match
+
+    For repeated matching against the same match_IDs, build
+    an IDIndex once instead
     """
-    rows = -1 * np.ones_like(IDs).astype(int)
-    # Find which IDs are in match_IDs
-    in_match = np.in1d(IDs, match_IDs)
-    if require_in_match:
-        if np.sum(~in_match) > 0:
-            raise IOError("qcat.match_ids: One or more input IDs not in match_IDs")
-    rows[~in_match] = -1
-    #
-    IDs_inmatch = IDs[in_match]
-    # Find indices of input IDs in meta table -- first instance in meta only!
-    xsorted = np.argsort(match_IDs)
-    ypos = np.searchsorted(match_IDs, IDs_inmatch, sorter=xsorted)
-    indices = xsorted[ypos]
-    rows[in_match] = indices
+    rows, _ = IDIndex(match_IDs).match(IDs, require_in_match=require_in_match)
     return rows
+
+
+class IDIndex:
+    """ Index of a set of IDs, sorted once, for repeated matching
+
+    Queries cost O(n log m) for n input IDs and m indexed IDs.
+
+    Parameters
+    ----------
+    match_IDs : ndarray or tuple of ndarray
+        IDs to be searched, usually of a table.  A tuple of
+        arrays for multi-key IDs, e.g. (cruise, datetime)
+    """
+    def __init__(self, match_IDs):
+        self.multi = isinstance(match_IDs, tuple)
+        if self.multi:
+            # Factorize each key, then combine the codes
+            self.uniques = [np.unique(np.asarray(key)) for key in match_IDs]
+            codes, _ = self._codes(match_IDs)
+        else:
+            codes = np.asarray(match_IDs)
+        self.nrows = len(codes)
+        self.order = np.argsort(codes, kind='stable')
+        self.sorted = codes[self.order]
+
+    def _codes(self, IDs):
+        # Combined integer code of multi-key IDs;  and a mask of the
+        # IDs with a key that is not indexed
+        if len(IDs) != len(self.uniques):
+            raise IOError(f"IDIndex: expected {len(self.uniques)} keys, got {len(IDs)}")
+        key_codes, miss = [], np.zeros(len(IDs[0]), dtype=bool)
+        for key, uniq in zip(IDs, self.uniques):
+            key = np.asarray(key)
+            code = np.minimum(np.searchsorted(uniq, key), uniq.size-1)
+            miss |= uniq[code] != key
+            key_codes.append(code)
+        codes = np.ravel_multi_index(key_codes, [uniq.size for uniq in self.uniques])
+        return codes, miss
+
+    def _bounds(self, IDs):
+        # Range of the IDs in self.sorted
+        if self.multi:
+            codes, miss = self._codes(IDs)
+        else:
+            codes, miss = np.asarray(IDs), False
+        left = np.searchsorted(self.sorted, codes, side='left')
+        right = np.searchsorted(self.sorted, codes, side='right')
+        right = np.where(miss, left, right)
+        return left, right
+
+    def match(self, IDs, require_in_match=False):
+        """ Rows of the first instance of each input ID
+
+        Parameters
+        ----------
+        IDs : ndarray or tuple of ndarray
+            IDs to be found, with the same keys as match_IDs
+        require_in_match : bool, optional
+            Require that each of the input IDs occurs within the match_IDs
+
+        Returns
+        -------
+        rows : ndarray
+            Rows in match_IDs that match to IDs, aligned
+            -1 if there is no match
+        miss : ndarray
+            True for the input IDs without a match
+        """
+        left, right = self._bounds(IDs)
+        miss = right == left
+        if require_in_match and np.any(miss):
+            raise IOError("IDIndex.match: One or more input IDs not in match_IDs")
+        rows = -1 * np.ones(miss.size, dtype=int)
+        rows[~miss] = self.order[left[~miss]]
+        return rows, miss
+
+    def match_all(self, IDs):
+        """ All of the matches of each input ID, including duplicates
+        in match_IDs
+
+        Parameters
+        ----------
+        IDs : ndarray or tuple of ndarray
+            IDs to be found, with the same keys as match_IDs
+
+        Returns
+        -------
+        idx : ndarray
+            Index of the input ID of each match
+        rows : ndarray
+            Row in match_IDs of each match, in order of the input IDs
+            and then of match_IDs
+        """
+        left, right = self._bounds(IDs)
+        counts = right - left
+        idx = np.repeat(np.arange(counts.size), counts)
+        offsets = np.arange(idx.size) - np.repeat(np.cumsum(counts) - counts, counts)
+        rows = self.order[np.repeat(left, counts) + offsets]
+        return idx, rows
@@ -0,0 +1,202 @@
+""" Lightweight timing, counters and memory metrics of pipeline stages
+
+Off unless $OCEANCOLOR_METRICS is set, to a JSON-lines file or to
+'stderr'.  Every stage then emits one line with its name, seconds,
+items, items per second and, if $OCEANCOLOR_METRICS_MEMORY is set,
+the peak of the memory traced by tracemalloc above its start [MB].
+When off, a stage costs about a microsecond.
+
+    from oceancolor.utils import instrument
+
+    with instrument.stage('ls2.batch', items=npix):
+        ...
+
+    @instrument.timed('tara.rebin_to_grid')
+    def rebin_to_grid(...):
+        ...
+"""
+
+import os
+import sys
+import json
+import time
+import atexit
+import functools
+import threading
+import tracemalloc
+import contextlib
+
+_config = dict(
+    output=os.getenv('OCEANCOLOR_METRICS') or None,
+    memory=os.getenv('OCEANCOLOR_METRICS_MEMORY', '') not in ('', '0'),
+)
+_counters = {}
+_open_stages = []
+# Did we start tracemalloc?
+_tracing = dict(started=False)
+_lock = threading.Lock()
+
+
+def configure(output:str=None, memory:bool=False):
+    """ Turn the metrics on or off, overriding the environment
+
+    Args:
+        output (str, optional): JSON-lines file, or 'stderr'.
+            None turns the metrics off
+        memory (bool, optional): Track the peak memory with tracemalloc
+    """
+    flush_counters()
+    _config['output'] = output
+    _config['memory'] = memory
+
+def enabled():
+    """ True if the metrics are on """
+    return _config['output'] is not None
+
+def emit(record:dict):
+    """ Write one metric as a line of JSON, if the metrics are on
+
+    Args:
+        record (dict): Metric;  time and pid are added
+    """
+    output = _config['output']
+    if output is None:
+        return
+    record = dict(record, time=round(time.time(), 3), pid=os.getpid())
+    line = json.dumps(record, default=str) + '\n'
+    with _lock:
+        if output == 'stderr':
+            sys.stderr.write(line)
+        else:
+            with open(output, 'a') as f:
+                f.write(line)
+
+def count(name:str, n:int=1):
+    """ Add to a counter;  the counters are emitted by flush_counters()
+    and at exit
+
+    Args:
+        name (str): Counter
+        n (int, optional): Increment
+    """
+    if _config['output'] is None:
+        return
+    with _lock:
+        _counters[name] = _counters.get(name, 0) + n
+
+def flush_counters():
+    """ Emit the counters and reset them """
+    with _lock:
+        counters = dict(_counters)
+        _counters.clear()
+    for name, n in sorted(counters.items()):
+        emit(dict(counter=name, count=n))
+
+atexit.register(flush_counters)
+
+
+class _Stage:
+    # State of an open stage
+    def __init__(self, name:str, items, fields:dict):
+        self.name = name
+        self.items = items
+        self.fields = fields
+        self.mem_start = None
+        self.mem_peak = None
+
+    def set(self, items=None, **fields):
+        """ Set the number of items or extra fields before the stage ends """
+        if items is not None:
+            self.items = items
+        self.fields.update(fields)
+
+class _NullStage:
+    # Stands in for _Stage when the metrics are off
+    def set(self, items=None, **fields):
+        pass
+
+_null_stage = _NullStage()
+
+
+def _fold_peak():
+    # Fold the traced peak into the open stages and reset it
+    _, peak = tracemalloc.get_traced_memory()
+    for open_stage in _open_stages:
+        open_stage.mem_peak = max(open_stage.mem_peak, peak)
+    tracemalloc.reset_peak()
+
+@contextlib.contextmanager
+def stage(name:str, items:int=None, **fields):
+    """ Time a block of code and emit its metrics
+
+    Args:
+        name (str): Stage, e.g. 'tara.prep_spectra'
+        items (int, optional): Number of items processed, for items/s.
+            May also be set in the block with .set(items=...)
+        **fields: Extra fields of the metric, e.g. cruise='Rio-BA'
+
+    Yields:
+        object: with a set(items=None, **fields) method
+    """
+    if _config['output'] is None:
+        yield _null_stage
+        return
+
+    this = _Stage(name, items, fields)
+    memory = _config['memory']
+    if memory:
+        if not tracemalloc.is_tracing():
+            tracemalloc.start()
+            _tracing['started'] = True
+        if len(_open_stages) > 0:
+            _fold_peak()
+        else:
+            tracemalloc.reset_peak()
+        this.mem_start, _ = tracemalloc.get_traced_memory()
+        this.mem_peak = this.mem_start
+        _open_stages.append(this)
+
+    t0 = time.perf_counter()
+    try:
+        yield this
+    finally:
+        seconds = time.perf_counter() - t0
+        record = dict(stage=name, seconds=round(seconds, 6))
+        if this.items is not None:
+            record['items'] = int(this.items)
+            record['items_per_s'] = round(this.items/seconds, 3) \
+                if seconds > 0 else None
+        if memory:
+            _fold_peak()
+            _open_stages.remove(this)
+            record['peak_mb'] = round((this.mem_peak - this.mem_start)/2**20, 3)
+            if len(_open_stages) == 0 and _tracing['started']:
+                tracemalloc.stop()
+                _tracing['started'] = False
+        record.update(this.fields)
+        emit(record)
+
+def timed(name:str=None, items=None):
+    """ Decorator running a function as a stage
+
+    Args:
+        name (str, optional): Stage.  Defaults to module.function
+        items (callable, optional): Number of items from the
+            arguments of the function
+
+    Returns:
+        callable: decorator
+    """
+    def decorator(func):
+        stage_name = name if name is not None else \
+            f'{func.__module__}.{func.__qualname__}'
+
+        @functools.wraps(func)
+        def wrapper(*args, **kwargs):
+            if _config['output'] is None:
+                return func(*args, **kwargs)
+            nitems = items(*args, **kwargs) if items is not None else None
+            with stage(stage_name, items=nitems):
+                return func(*args, **kwargs)
+        return wrapper
+    return decorator
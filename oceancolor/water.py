@@ -0,0 +1,157 @@
+""" Pure seawater absorption and scattering """
+import os
+import functools
+from importlib import resources
+
+import numpy as np
+
+# Nominal band centers and FWHM [nm] of the visible bands of
+#  a few ocean color sensors.  Spectral response functions
+#  are approximated by Gaussians of that FWHM.
+sensor_bands = {
+    'SeaWiFS': ((412., 443., 490., 510., 555., 670.),
+                (20., 20., 20., 20., 20., 20.)),
+    'MODIS-Aqua': ((412., 443., 469., 488., 531., 547., 555., 645., 667., 678.),
+                   (15., 10., 20., 10., 10., 10., 20., 50., 10., 10.)),
+    'VIIRS': ((410., 443., 486., 551., 671.),
+              (20., 20., 20., 20., 20.)),
+    'OLCI': ((400., 412.5, 442.5, 490., 510., 560., 620., 665.,
+              673.75, 681.25, 708.75),
+             (15., 10., 10., 10., 10., 10., 10., 10., 7.5, 7.5, 10.)),
+}
+
+
+@functools.lru_cache(maxsize=None)
+def load_water_coef():
+    """ Load the pure water coefficients from the SeaBASS file
+    data/water/water_coef.txt;  parsed once per process
+
+    Returns:
+        tuple: wavelength [nm], aw [m^-1], bw [m^-1] (read-only np.ndarray)
+    """
+    water_file = os.path.join(resources.files('oceancolor'),
+                              'data', 'water', 'water_coef.txt')
+    # Header lines start with / or !
+    data = np.loadtxt(water_file, comments=['/', '!'])
+    data[data == -999.] = np.nan
+
+    wave, aw, bw = data[:,0], data[:,1], data[:,2]
+    for arr in (wave, aw, bw):
+        arr.flags.writeable = False
+
+    return wave, aw, bw
+
+def water_iops(wave):
+    """ Pure water IOPs interpolated to a set of wavelengths
+
+    Per the SeaBASS file, bbw = bw/2
+
+    Args:
+        wave (float or np.ndarray): wavelength in nm
+
+    Returns:
+        tuple: aw, bw, bbw [m^-1];  NaN outside of 200-2449 nm
+    """
+    tbl_wave, tbl_aw, tbl_bw = load_water_coef()
+    aw = np.interp(wave, tbl_wave, tbl_aw, left=np.nan, right=np.nan)
+    bw = np.interp(wave, tbl_wave, tbl_bw, left=np.nan, right=np.nan)
+    return aw, bw, bw/2.
+
+def aw(wave):
+    """ Pure water absorption coefficient
+
+    Args:
+        wave (float or np.ndarray): wavelength in nm
+
+    Returns:
+        float or np.ndarray: aw [m^-1]
+    """
+    return water_iops(wave)[0]
+
+def bw(wave):
+    """ Pure water scattering coefficient
+
+    Args:
+        wave (float or np.ndarray): wavelength in nm
+
+    Returns:
+        float or np.ndarray: bw [m^-1]
+    """
+    return water_iops(wave)[1]
+
+def bbw(wave):
+    """ Pure water backscattering coefficient
+
+    Args:
+        wave (float or np.ndarray): wavelength in nm
+
+    Returns:
+        float or np.ndarray: bbw [m^-1]
+    """
+    return water_iops(wave)[2]
+
+def band_average(srf_wave:np.ndarray, srf:np.ndarray):
+    """ Pure water IOPs averaged over spectral response functions
+
+    Args:
+        srf_wave (np.ndarray): wavelengths of the SRFs [nm] (nwave)
+        srf (np.ndarray): SRFs, one per band (nband, nwave)
+
+    Returns:
+        tuple: aw, bw, bbw (nband) [m^-1]
+    """
+    srf = np.atleast_2d(srf)
+    weights = srf / np.sum(srf, axis=1, keepdims=True)
+    aw, bw, bbw = water_iops(srf_wave)
+    return weights @ aw, weights @ bw, weights @ bbw
+
+def gaussian_srf(centers, fwhm, dwave:float=1.):
+    """ Gaussian approximations to the SRFs of a set of bands
+
+    The SRFs are tabulated out to +/- 2 FWHM on the
+    1 nm grid of water_coef.txt
+
+    Args:
+        centers (tuple): Band centers [nm]
+        fwhm (tuple): Band FWHM [nm]
+        dwave (float, optional): Wavelength step [nm]
+
+    Returns:
+        tuple: wavelengths (nwave), SRFs (nband, nwave)
+    """
+    centers = np.asarray(centers, dtype=float)
+    fwhm = np.asarray(fwhm, dtype=float)
+    srf_wave = np.arange(np.floor(np.min(centers-2*fwhm)),
+                         np.ceil(np.max(centers+2*fwhm))+dwave, dwave)
+    sigma = fwhm / (2*np.sqrt(2*np.log(2)))
+    srf = np.exp(-0.5*((srf_wave[None,:] - centers[:,None])/sigma[:,None])**2)
+    srf[np.abs(srf_wave[None,:] - centers[:,None]) > 2*fwhm[:,None]] = 0.
+    return srf_wave, srf
+
+@functools.lru_cache(maxsize=None)
+def _band_iops(centers:tuple, fwhm:tuple):
+    iops = band_average(*gaussian_srf(centers, fwhm))
+    for arr in iops:
+        arr.flags.writeable = False
+    return iops
+
+def band_iops(bands):
+    """ Pure water IOPs averaged over the bands of a sensor
+
+    Memoized per band set.
+
+    Args:
+        bands (str or tuple): Name of the sensor in sensor_bands,
+            or a tuple of (centers, fwhm) in nm
+
+    Returns:
+        tuple: aw, bw, bbw (nband) [m^-1] (read-only np.ndarray)
+    """
+    if isinstance(bands, str):
+        if bands not in sensor_bands:
+            raise ValueError(f"Unknown sensor: {bands}. Choose from {list(sensor_bands)}")
+        centers, fwhm = sensor_bands[bands]
+    else:
+        centers, fwhm = bands
+    return _band_iops(tuple(float(c) for c in np.atleast_1d(centers)),
+                      tuple(float(f) for f in np.atleast_1d(fwhm)))
@@ -5,6 +5,7 @@ import os
 import pandas
 
 from oceancolor.tara import explore
+from oceancolor.utils import instrument
 
 from sequencer import sequencer_
 
@@ -36,7 +37,9 @@ def run_sequencer(output_path:str, out_tbl_file:str,
     seq = sequencer_.Sequencer(grid, cull_raph, estimator_list, no_norm=not norm)
 
     # Run
-    final_elongation, final_sequence = seq.execute(output_path)
+    with instrument.stage('run_sequencer', items=cull_raph.shape[0],
+                          table=out_tbl_file):
+        final_elongation, final_sequence = seq.execute(output_path)
 
     # Some stats
     # print the resulting elongation
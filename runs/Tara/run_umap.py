@@ -1,47 +1,32 @@
 """ Run UMAP on Tara data """
 import os
 import numpy as np
-import pickle
-
-import pandas
-import umap
 
 from oceancolor.tara import explore
+from oceancolor.tara import embedding
+from oceancolor.utils import instrument
 
 from IPython import embed
 
-def run_umap(umap_tblfile:str, umap_savefile:str, process:dict=None):
+def run_umap(umap_tblfile:str, umap_savefile:str, spectra:np.ndarray,
+             tara_tbl, nfit:int=None):
     """ Run UMAP on a set of Tara spectra
 
+    UMAP is fit once (on a subsample if nfit is set);  the fitted
+    spectra keep their embedding and the others are transformed.
+
     Args:
         umap_tblfile (str): Table holding the UMAP info
         umap_savefile (str): UMAP pickle file
-        process (dict, optional): dict describing how to process the Tara data. Defaults to None.
+        spectra (np.ndarray): Processed spectra, from explore.prep_spectra()
+        tara_tbl (pandas.DataFrame): Their rows of the Tara database
+        nfit (int, optional): Number of spectra for the fit
     """
-
-    # prep
-    rwv_nm, cull_raph, cull_rsig, tara_tbl = explore.prep_spectra(process=process)
-
-    # Train
     print("Training..")
-    reducer_umap = umap.UMAP(random_state=42)
-    latents_mapping = reducer_umap.fit(cull_raph)
-    print("Done..")
-
-    # Save?
-    pickle.dump(latents_mapping, open(umap_savefile, "wb" ) )
-    print(f"Saved UMAP to {umap_savefile}")
-    embedding = latents_mapping.transform(cull_raph)
-
-    # Generate table (only a few entries)
-    umap_tbl = pandas.DataFrame()
-    umap_tbl['tara_id'] = tara_tbl.index
-    umap_tbl['U0'] = embedding[:,0]
-    umap_tbl['U1'] = embedding[:,1]
-
-    # Save
-    umap_tbl.to_parquet(umap_tblfile)
-    print(f"Wrote UMAP table to {umap_tblfile}")
+    with instrument.stage('run_umap', items=len(spectra),
+                          table=os.path.basename(umap_tblfile)):
+        embedding.run_embedding(umap_tblfile, spectra, tara_tbl.index,
+                                nfit=nfit, model_file=umap_savefile)
 
 def main(flg):
     if flg== 'all':
@@ -49,6 +34,9 @@ def main(flg):
     else:
         flg= int(flg)
 
+    # prep (once)
+    rwv_nm, cull_raph, cull_rsig, tara_tbl = explore.prep_spectra()
+
     # UMAP me
     if flg & (2**0):
 
@@ -57,7 +45,7 @@ def main(flg):
             os.getenv('OS_COLOR'), 'Tara', 'UMAP', 'Tara_UMAP_abs.parquet')
         umap_savefile = os.path.join(
             os.getenv('OS_COLOR'), 'Tara', 'UMAP', 'Tara_UMAP_abs.pkl')
-        run_umap(out_tbl_file, umap_savefile)
+        run_umap(out_tbl_file, umap_savefile, cull_raph, tara_tbl)
 
     # UMAP with normalized spectra
     if flg & (2**1):
@@ -67,8 +55,9 @@ def main(flg):
             os.getenv('OS_COLOR'), 'Tara', 'UMAP', 'Tara_UMAP_norm.parquet')
         umap_savefile = os.path.join(
             os.getenv('OS_COLOR'), 'Tara', 'UMAP', 'Tara_UMAP_norm.pkl')
-        process = dict(Norm_PDF=True)
-        run_umap(out_tbl_file, umap_savefile, process=process)
+        # Same as prep_spectra(process=dict(Norm_PDF=True))
+        norm_raph = cull_raph / np.sum(cull_raph, axis=1, keepdims=True)
+        run_umap(out_tbl_file, umap_savefile, norm_raph, tara_tbl)
 
 
 